@@ -0,0 +1,60 @@
+// Autocomplétion des champs client et produit des formulaires de commande :
+// le texte saisi interroge /autocomplete/<table>?q=..., le choix remplit le champ caché (ID).
+function bindAutocomplete(input) {
+    var hidden = document.getElementById(input.dataset.target);
+    var list = document.getElementById(input.getAttribute('list'));
+    var ids = {};
+    var timer = null;
+
+    // Valeur déjà choisie (modification d'une commande, formulaire renvoyé avec erreurs)
+    if (input.value && hidden.value) {
+        ids[input.value] = hidden.value;
+    }
+
+    input.addEventListener('input', function () {
+        hidden.value = ids[input.value] || '';
+        clearTimeout(timer);
+        timer = setTimeout(function () {
+            fetch(input.dataset.autocomplete + '?q=' + encodeURIComponent(input.value.replace(/ \(#\d+\)$/, '')))
+                .then(function (response) { return response.json(); })
+                .then(function (data) {
+                    list.innerHTML = '';
+                    data.results.forEach(function (item) {
+                        var label = item.nom + ' (#' + item.id + ')';
+                        ids[label] = item.id;
+                        var option = document.createElement('option');
+                        option.value = label;
+                        list.appendChild(option);
+                    });
+                    hidden.value = ids[input.value] || '';
+                });
+        }, 200);
+    });
+}
+
+document.querySelectorAll('input[data-autocomplete]').forEach(bindAutocomplete);
+
+// Bouton "Ajouter un produit" : copie vide de la dernière ligne du panier, renumérotée
+// (lignes-0-produit_id -> lignes-1-produit_id, ...)
+document.querySelectorAll('[data-add-line]').forEach(function (button) {
+    var container = document.getElementById(button.dataset.addLine);
+    var prefix = button.dataset.addLine + '-';
+    button.addEventListener('click', function () {
+        var lines = container.querySelectorAll('.ligne-commande');
+        var index = lines.length;
+        var line = lines[lines.length - 1].cloneNode(true);
+        var pattern = new RegExp(prefix + '\\d+-', 'g');
+        line.querySelectorAll('[id], [name], [for], [list], [data-target]').forEach(function (element) {
+            ['id', 'name', 'for', 'list', 'data-target'].forEach(function (attribute) {
+                if (element.hasAttribute(attribute)) {
+                    element.setAttribute(attribute, element.getAttribute(attribute).replace(pattern, prefix + index + '-'));
+                }
+            });
+        });
+        line.querySelectorAll('input').forEach(function (input) { input.value = ''; });
+        line.querySelectorAll('datalist').forEach(function (list) { list.innerHTML = ''; });
+        line.querySelectorAll('.error-messages, .error-message').forEach(function (error) { error.remove(); });
+        container.appendChild(line);
+        line.querySelectorAll('input[data-autocomplete]').forEach(bindAutocomplete);
+    });
+});
@@ -0,0 +1,25 @@
+// Suivi des tâches de fond : un élément data-job="/jobs/<id>" interroge l'état de la tâche
+// et la page se recharge quand elle est terminée (ou en échec).
+document.querySelectorAll('[data-job]').forEach(function (element) {
+    var progress = element.querySelector('[data-job-progress]');
+
+    function poll() {
+        fetch(element.dataset.job, {cache: 'no-store'})
+            .then(function (response) { return response.json(); })
+            .then(function (job) {
+                if (job.status === 'done' || job.status === 'failed') {
+                    window.location.reload();
+                    return;
+                }
+                if (progress && job.progress) {
+                    progress.textContent = job.total
+                        ? job.progress + ' / ' + job.total
+                        : job.progress + ' ligne(s) lue(s)';
+                }
+                setTimeout(poll, 1000);
+            })
+            .catch(function () { setTimeout(poll, 5000); });
+    }
+
+    setTimeout(poll, 500);
+});
@@ -0,0 +1,143 @@
+import threading
+import time
+from flask import Response, g, request
+from metriques import ADMISSION_ACTIVE, ADMISSION_QUEUED, ADMISSION_DECISIONS, ADMISSION_WAIT
+
+'''--------------------Contrôle d'admission des routes coûteuses--------------------'''
+
+# Les routes coûteuses sont rangées par classe (@limited("lourd")). Une classe admet au
+# plus "limit" requêtes à la fois ; les suivantes attendent dans une file d'au plus
+# "queue" places, au plus "timeout" secondes. Sans place dans la file, ou après une
+# attente trop longue, la réponse est un 503 immédiat avec Retry-After : les routes
+# légères (dashboard, formulaires) gardent les threads et le CPU, et la latence des
+# routes coûteuses ne grandit pas sans limite. Une réponse en flux garde sa place
+# jusqu'au dernier octet envoyé.
+# Les limites s'appliquent par processus : avec flask --app app serve, par worker.
+
+# Réglages par défaut, modifiables par app.config['ADMISSION'] = {"lourd": {"limit": 4}, "flux": None}
+# (None : classe sans limite)
+CLASSES = {
+    # Calculs ou lectures de toute une table : graphiques, exports, rapports des ventes
+    "lourd": {"limit": 2, "queue": 4, "timeout": 2.0, "retry_after": 5},
+    # Listes complètes envoyées en flux (?stream=1)
+    "flux": {"limit": 2, "queue": 4, "timeout": 5.0, "retry_after": 10},
+}
+
+
+'''classe d'une limite de requetes simultanees avec file d'attente bornee'''
+class Limiter:
+    def __init__(self, name, limit, queue, timeout, retry_after):
+        self.name = name
+        self.limit = limit
+        self.queue = queue
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.active = 0
+        self.waiting = 0
+        self._condition = threading.Condition()
+
+    '''methode pour obtenir une place (None si admise, sinon la raison du refus)'''
+    def acquire(self):
+        start = time.perf_counter()
+        with self._condition:
+            # Une place libre ne passe pas devant les requêtes qui attendent déjà
+            if self.active < self.limit and not self.waiting:
+                self.active += 1
+                self._report()
+                ADMISSION_DECISIONS.inc(1, self.name, "admitted")
+                return None
+            if self.waiting >= self.queue:
+                ADMISSION_DECISIONS.inc(1, self.name, "rejected_queue_full")
+                return "rejected_queue_full"
+            self.waiting += 1
+            self._report()
+            try:
+                deadline = start + self.timeout
+                while self.active >= self.limit:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        ADMISSION_WAIT.observe(time.perf_counter() - start, self.name)
+                        ADMISSION_DECISIONS.inc(1, self.name, "rejected_timeout")
+                        return "rejected_timeout"
+                    self._condition.wait(remaining)
+                self.active += 1
+            finally:
+                self.waiting -= 1
+                self._report()
+        ADMISSION_WAIT.observe(time.perf_counter() - start, self.name)
+        ADMISSION_DECISIONS.inc(1, self.name, "admitted")
+        return None
+
+    '''methode pour rendre une place (reveille la premiere requete en attente)'''
+    def release(self):
+        with self._condition:
+            self.active -= 1
+            self._report()
+            self._condition.notify()
+
+    def _report(self):
+        ADMISSION_ACTIVE.set(self.active, self.name)
+        ADMISSION_QUEUED.set(self.waiting, self.name)
+
+
+'''decorateur pour ranger une route dans une classe de routes limitees'''
+# when : fonction sans argument, la limite ne s'applique que si elle retourne True
+# (par exemple : seulement pour ?stream=1)
+def limited(name, when=None):
+    def decorator(func):
+        func.admission_class = name
+        func.admission_when = when
+        return func
+    return decorator
+
+
+'''fonction pour savoir si la requete demande une liste complete en flux'''
+def is_stream():
+    return request.args.get('stream') == '1'
+
+
+'''fonction pour brancher le controle d'admission sur une application Flask'''
+def init_app(app):
+    settings = {name: dict(options) for name, options in CLASSES.items()}
+    for name, options in (app.config.get('ADMISSION') or {}).items():
+        if options is None:
+            settings.pop(name, None)
+        else:
+            settings.setdefault(name, dict(CLASSES.get(name, CLASSES["lourd"]))).update(options)
+    limiters = {name: Limiter(name, **options) for name, options in settings.items()}
+    app.extensions['admission'] = limiters
+
+    @app.before_request
+    def admit():
+        func = app.view_functions.get(request.endpoint)
+        limiter = limiters.get(getattr(func, 'admission_class', None))
+        if limiter is None or (func.admission_when is not None and not func.admission_when()):
+            return None
+        if limiter.acquire() is not None:
+            return overloaded(limiter)
+        g.admission = limiter
+        return None
+
+    # La place est rendue à la fermeture de la réponse, après l'envoi complet d'un flux
+    @app.after_request
+    def release_on_close(response):
+        limiter = g.pop('admission', None)
+        if limiter is not None:
+            response.call_on_close(limiter.release)
+        return response
+
+    # Exception dans la vue : after_request n'est pas appelé
+    @app.teardown_request
+    def release_on_error(exception):
+        limiter = g.pop('admission', None)
+        if limiter is not None:
+            limiter.release()
+
+
+'''fonction pour construire la reponse 503 d'une requete refusee'''
+def overloaded(limiter):
+    response = Response(f"Serveur occupé : réessayez dans {limiter.retry_after} secondes.\n", status=503,
+                        content_type='text/plain; charset=utf-8')
+    response.headers['Retry-After'] = str(limiter.retry_after)
+    response.headers['Cache-Control'] = 'no-store'
+    return response
@@ -1,49 +1,141 @@
-from flask import Flask, render_template, redirect, url_for, flash,session, current_app, request
-import sqlite3
-from flask_sqlalchemy import SQLAlchemy
+from flask import Flask, Response, render_template, stream_template, redirect, url_for, flash,session, current_app, request, jsonify, send_file, abort
+from flask.cli import AppGroup
+import sys
 from wtforms import StringField, PasswordField, SubmitField
 from wtforms.validators import DataRequired
 from flask_wtf import FlaskForm
 from decimal import Decimal
-import logging
 from functools import wraps
-import matplotlib
-matplotlib.use('Agg')
-from gestion_produit import Produit, Client, Commande
-from forms import AddProductForm, AddClientForm, AddOrderForm, EditClientForm
-import matplotlib.pyplot as plt
+from werkzeug.exceptions import HTTPException
+import os
+import datetime
+import signal
+import threading
+import time
+import uuid
+import click
+import database
+from database import get_connection
+from gestion_produit import Produit, Client, Commande, Categorie
+from forms import AddProductForm, EditProductForm, AddClientForm, AddOrderForm, EditClientForm
+from graphiques import ready_charts, chart_version
+from import_donnees import ENTITIES, BATCH_SIZE, detect_format, import_file
+from export_donnees import EXPORTS, FORMATS, export
+from migrations import migrate, check_schema
+from utilisateurs import User
+import journal
+import metriques
+import admission
+from admission import limited, is_stream
+import taches
+import ventes
+from cache_http import conditional, gzip_response, templates_signature
+from serveur import serve, warm_templates, WORKERS, THREADS, MAX_REQUESTS, GRACEFUL_TIMEOUT, WorkerRequestHandler
+
+#--------------création de l'application (app factory)-----------------
+
+# Les routes et commandes sont enregistrées ici à l'import, puis ajoutées à chaque
+# application construite par create_app() : importer ce module n'a aucun effet de bord.
+ROUTES = []
+cli = AppGroup('app')
+
+def route(rule, **options):
+    def decorator(func):
+        ROUTES.append((rule, func, options))
+        return func
+    return decorator
+
+# Construction de l'application : flask --app app serve (production, voir serveur.py),
+# flask --app app run (développement), ou gunicorn "app:create_app()"
+def create_app(config=None):
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = 'mysecretkey' # Clef de cryptage
+    if config:
+        app.config.update(config)
+
+    # Journal des actions : JSON, écrit en arrière-plan, rotation par taille
+    journal.configure(app.config.get('AUDIT_LOG'), app.config.get('AUDIT_LOG_MAX_BYTES'),
+                      app.config.get('AUDIT_LOG_BACKUPS'))
+
+    # Durée, instructions SQL et rendu Jinja de chaque requête, exposés sur /metrics
+    metriques.init_app(app)
+
+    # Routes coûteuses : nombre de requêtes simultanées limité, 503 + Retry-After au-delà
+    admission.init_app(app)
+
+    # Threads d'exécution des tâches de fond dans ce processus (0 : flask --app app jobs)
+    taches.configure(app.config.get('JOB_THREADS'))
+
+    # Pages HTML compressées en gzip si le navigateur l'accepte
+    app.after_request(gzip_response)
+
+    app.add_template_filter(date_heure)
+
+    for rule, func, options in ROUTES:
+        app.add_url_rule(rule, view_func=func, **options)
+    for name, command in cli.commands.items():
+        app.cli.add_command(command, name)
+    return app
+
+
+# Filtre des templates : date en secondes (UTC) affichée "18/10/2026 14:05", vide si inconnue
+def date_heure(timestamp):
+    if timestamp is None:
+        return ""
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).strftime("%d/%m/%Y %H:%M")
 
-app = Flask(__name__)
-
-app.config['SECRET_KEY'] = 'mysecretkey' # Clef de cryptage
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///users.db' # Chemin vers ta base de données SQLite des utilisateurs
-db = SQLAlchemy(app) # Création de l'instance de SQLAlchemy
 
 #--------------création des decorateurs-----------------
 
-logging.basicConfig(filename='user_actions.log', level=logging.INFO) # Configuration du logging
+# Journalise chaque appel de la route (utilisateur, route, statut, durée) sans écrire
+# sur le disque dans le thread de la requête : l'écriture est faite par journal.py
 def log_action(func): # Création du decorateur
     @wraps(func) # Utilisation du decorateur
-    def wrapper(*args, **kwargs): 
-        user_id = request.cookies.get('user_id') 
-        action = func.__name__ 
-        logging.info(f"User ID: {user_id}, Action: {action}") 
-        return func(*args, **kwargs) 
-    return wrapper 
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        status = 500
+        try:
+            response = current_app.make_response(func(*args, **kwargs))
+            status = response.status_code
+            return response
+        except HTTPException as e:
+            status = e.code
+            raise
+        finally:
+            user = session.get('user') or {} # Lu après la vue : la connexion est attribuée à l'utilisateur
+            journal.get_audit_logger().info(func.__name__, extra={
+                "user": user.get('username'),
+                "method": request.method,
+                "route": request.path,
+                "endpoint": request.endpoint,
+                "status": status,
+                "duration_ms": round((time.perf_counter() - start) * 1000, 3),
+            })
+    return wrapper
+
+
+#--------------pagination des listes-----------------
+
+PER_PAGE = 50 # Nombre de lignes par page par défaut
+MAX_PER_PAGE = 500 # Taille de page maximale acceptée
+
+# Lecture des paramètres de pagination : ?after=<dernier id>&per_page=<n>&stream=1
+def get_page_args():
+    after = request.args.get('after', 0, type=int)
+    per_page = request.args.get('per_page', PER_PAGE, type=int)
+    per_page = min(max(per_page, 1), MAX_PER_PAGE)
+    stream = request.args.get('stream') == '1'
+    return after, per_page, stream
+
+# Rendu d'une liste : en flux, les lignes sont envoyées au client au fur et à mesure
+def render_list(template, stream, **context):
+    if stream:
+        return stream_template(template, **context)
+    return render_template(template, **context)
 
 
 #------------------------Classe, Methodes et Routes pour accéder au site------------------------
 
-# Création de la classe User
-class User(db.Model): # Création de la classe User
-    id = db.Column(db.Integer, primary_key=True) 
-    username = db.Column(db.String(80), unique=True, nullable=False) 
-    password = db.Column(db.String(120), nullable=False) 
-
-    def __repr__(self):
-        return '<User %r>' % self.username 
-    
-
 # Création de la classe RegisterForm
 class RegisterForm(FlaskForm):
     username = StringField('Nom d\'utilisateur', validators=[DataRequired()])  # Champ de saisie pour le nom d'utilisateur
@@ -61,18 +153,17 @@ class LoginForm(FlaskForm): # Création de la classe LoginForm
 # Création de la fonction create_user
 def create_user(username, password):
     user = User(username=username, password=password) # Création d'un nouvel utilisateur
-    db.session.add(user)
-    db.session.commit() # Sauvegarde des modifications
+    user.add_user() # Sauvegarde dans la base des utilisateurs
 
 # Création de la fonction check_login
 def check_login(username, password):# Création de la fonction check_login
-    user = User.query.filter_by(username=username).first()
+    user = User().get_by_username(username)
     if user and user.password == password:
         return True
     return False
 
 # Création de la route '/' index
-@app.route('/')
+@route('/')
 def index():
     user = session.get('user')
     if user:
@@ -81,7 +172,8 @@ def index():
         return render_template('index.html', user=None)
 
 # Création de la route '/register'
-@app.route('/register', methods=['GET', 'POST']) # Création de la route '/register'
+@route('/register', methods=['GET', 'POST']) # Création de la route '/register'
+@log_action
 def register():
     form = RegisterForm()
     if form.validate_on_submit():
@@ -92,7 +184,8 @@ def register():
     return render_template('register.html', form=form)
 
 # Création de la route '/login'
-@app.route('/login', methods=['GET', 'POST'])
+@route('/login', methods=['GET', 'POST'])
+@log_action
 def login():
     form = LoginForm()
     if form.validate_on_submit():
@@ -106,11 +199,12 @@ def login():
             return render_template('login.html', form=form, error='Nom d\'utilisateur ou mot de passe incorrect')
     return render_template('login.html', form=form)
 
-@app.route('/dashboard')
+@route('/dashboard')
+@conditional('produits')
 def dashboard():
     user = session.get('user')
     if user:
-        with sqlite3.connect("app_database.db") as conn:
+        with get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT nom, description FROM produits ORDER BY id ASC LIMIT 5")  # Limite à 5 produits
             products_data = cursor.fetchall()
@@ -130,7 +224,8 @@ def dashboard():
     else:
         return redirect(url_for('login'))
 
-@app.route('/logout')
+@route('/logout')
+@log_action
 def logout():
     session.pop('user', None)
     return redirect(url_for('login'))
@@ -139,7 +234,8 @@ def logout():
 
 
 # Route pour ajouter un nouveau produit
-@app.route('/add', methods=['GET', 'POST'])
+@route('/add', methods=['GET', 'POST'])
+@log_action
 def add_product():
     form = AddProductForm()
     if form.validate_on_submit():
@@ -149,7 +245,7 @@ def add_product():
             prix=form.prix.data,
             description=form.description.data,
             stock=form.stock.data,
-            type_produit=form.type_produit.data
+            categorie_id=form.categorie_id.data
         )
         new_produit.add_product()  # Appeler la méthode pour ajouter le produit dans la base de données
         #flash('Produit ajouté avec succès!', 'success')
@@ -159,21 +255,29 @@ def add_product():
 
 
 # Route pour modifier un produit
-@app.route('/update/<int:id>', methods=['GET', 'POST'])
+@route('/update/<int:id>', methods=['GET', 'POST'])
+@log_action
 def edit_product(id):
     produit = Produit()  # Créer une instance de la classe Produit
-    produit_to_update = next((p for p in produit.get_products() if p.id == id), None)  # Trouver le produit à modifier
+    produit_to_update = produit.get_by_id(id)  # Trouver le produit à modifier
     
     if produit_to_update is None:
         flash('Produit non trouvé', 'danger')
         return redirect(url_for('list_produits'))
 
-    form = AddProductForm(obj=produit_to_update)
+    form = EditProductForm(obj=produit_to_update)
+    if request.method == 'GET':
+        form.stock_initial.data = produit_to_update.stock
     
     if form.validate_on_submit():
         # Convertir le prix en float si nécessaire
         prix = float(form.prix.data) if isinstance(form.prix.data, Decimal) else form.prix.data
-        produit.update_product(id, form.nom.data, prix, form.description.data, form.stock.data, form.type_produit.data)
+        # Seul l'écart saisi dans le formulaire est appliqué au stock courant
+        try:
+            variation_stock = form.stock.data - int(form.stock_initial.data)
+        except (TypeError, ValueError):
+            variation_stock = 0
+        produit.update_product(id, form.nom.data, prix, form.description.data, form.categorie_id.data, variation_stock)
         #flash('Produit mis à jour avec succès!', 'success')
         return redirect(url_for('list_produits'))
 
@@ -181,39 +285,60 @@ def edit_product(id):
 
 
 # Route pour supprimer un produit
-@app.route('/delete/<int:id>', methods=['GET', 'POST'])
+@route('/delete/<int:id>', methods=['GET', 'POST'])
+@log_action
 def delete_product(id):
     produit = Produit()  # Créer une instance de la classe Produit
-    produit.delete_product(id)  # Appeler la méthode pour supprimer le produit de la base de données
-    #flash('Produit supprimé avec succès!', 'danger')
+    try:
+        produit.delete_product(id)  # Appeler la méthode pour supprimer le produit de la base de données
+        #flash('Produit supprimé avec succès!', 'danger')
+    except ValueError as e:
+        flash(str(e), 'danger')
     return redirect(url_for('list_produits'))
 
 
 # Route pour afficher la liste des produits
-@app.route('/list', methods=['GET'])
+@route('/list', methods=['GET'])
+@limited('flux', when=is_stream)
+@conditional('produits', 'categories')
 def list_produits():
-    type_produit = request.args.get('type_produit')  # Récupère le type sélectionné depuis l'URL
+    # Anciens liens et favoris (?type_produit=<nom>) : redirigés vers le filtre par ID de catégorie
+    type_produit = request.args.get('type_produit')
+    if type_produit is not None:
+        args = request.args.to_dict()
+        del args['type_produit']
+        categorie_id = Categorie.ids_by_name().get(type_produit)
+        if categorie_id is None:
+            flash(f'Type de produit inconnu : {type_produit}', 'danger')
+            return redirect(url_for('list_produits', **args))
+        return redirect(url_for('list_produits', categorie=categorie_id, **args), code=301)
+
+    categorie_id = request.args.get('categorie', type=int)  # Récupère l'ID du type sélectionné depuis l'URL
+    q = request.args.get('q', '').strip()  # Recherche plein texte sur le nom et la description
+    after, per_page, stream = get_page_args()
     produit = Produit()  # Crée une instance de la classe Produit
     
-    if type_produit and type_produit != "":
-        produits = produit.filter_products_by_type(type_produit)  # Filtre par type
+    if q:
+        # Résultats classés par pertinence ; "after" est alors la position dans le classement
+        if stream:
+            produits, next_cursor = produit.iter_search(q, after, categorie_id), None
+        else:
+            produits, next_cursor = produit.search(q, after, per_page, categorie_id)
+    elif stream:
+        # Tous les produits (filtrés si besoin), lus par lots pendant l'envoi
+        produits, next_cursor = produit.iter_products(after, categorie_id), None
     else:
-        produits = produit.get_products()  # Affiche tous les produits
+        produits, next_cursor = produit.get_products_page(after, per_page, categorie_id)
     
-    types_produits = [
-        'Fruits et légumes', 'Produits laitiers', 'Viandes et protéines', 
-        'Produits de boulangerie', 'Céréales et grains', 'Conserves et produits secs', 
-        'Condiments et épices', 'Boissons', 'Produits surgelés', 
-        'Snacks et confiseries', 'Produits non alimentaires'
-    ]
-    
-    return render_template('list_produits.html', produits=produits, types_produits=types_produits, selected_type=type_produit)
+    return render_list('list_produits.html', stream, produits=produits, categories=Categorie.get_categories(), selected_categorie=categorie_id,
+                       q=q, after=after, per_page=per_page, next_cursor=next_cursor)
 
 
 
 # ----------------------- Routes pour les Clients -----------------------
 # Ajouter un client
-@app.route('/add_client', methods=['GET', 'POST'])
+@route('/add_client', methods=['GET', 'POST'])
+@log_action
 def add_client():
     form = AddClientForm()
     if form.validate_on_submit():
@@ -232,7 +357,8 @@ def add_client():
 
 
 # Route d'édition du client
-@app.route('/edit_client/<int:client_id>', methods=['GET', 'POST'])
+@route('/edit_client/<int:client_id>', methods=['GET', 'POST'])
+@log_action
 def edit_client(client_id):
     client_instance = Client("", "", "")  # Crée une instance de Client
     client_data = client_instance.get_client_by_id(client_id)  # Appelle la méthode pour récupérer un client par ID
@@ -270,7 +396,8 @@ def edit_client(client_id):
 
 
 # Supprimer un client
-@app.route('/delete_client/<int:client_id>', methods=['POST'])
+@route('/delete_client/<int:client_id>', methods=['POST'])
+@log_action
 def delete_client(client_id):
     try:
         # Créez une instance de la classe Client avec l'ID du client à supprimer
@@ -284,59 +411,61 @@ def delete_client(client_id):
 
 
 # Afficher la liste des clients
-@app.route('/list_clients')
+@route('/list_clients')
+@limited('flux', when=is_stream)
+@conditional('clients')
 def list_clients():
+    after, per_page, stream = get_page_args()
     client_instance = Client()  # Créer une instance de Client
-    clients = client_instance.get_clients()  # Appeler la méthode d'instance
-    return render_template('list_clients.html', clients=clients)
+    if stream:
+        clients, next_cursor = client_instance.iter_clients(after), None
+    else:
+        clients, next_cursor = client_instance.get_clients_page(after, per_page)
+    return render_list('list_clients.html', stream, clients=clients,
+                       after=after, per_page=per_page, next_cursor=next_cursor)
 
 
 
 
 # ----------------------- Routes pour les Commandes -----------------------
 
-@app.route('/commandes')
+@route('/commandes')
+@limited('flux', when=is_stream)
+@conditional('commandes', 'lignes_commande', 'clients', 'produits')
 def list_commandes():
-    commande = Commande(client_id=None, produit_id=None, quantite=None)
-    orders = commande.get_commandes_with_details()
-    clients = Client("", "", "")
-    clients = clients.get_clients()
-    produits = Produit()
-    produits = produits.get_products()
+    after, per_page, stream = get_page_args()
+    commande = Commande()
+    if stream:
+        orders, next_cursor = commande.iter_commandes_with_details(after), None
+    else:
+        orders, next_cursor = commande.get_commandes_with_details_page(after, per_page)
+    # Une seule ligne suffit pour savoir s'il est possible de passer une commande
+    has_clients = bool(Client().get_clients_page(limit=1)[0])
+    has_produits = bool(Produit().get_products_page(limit=1)[0])
     
-    return render_template('list_commandes.html', 
+    return render_list('list_commandes.html', stream,
                          orders=orders,
-                         clients=clients, 
-                         produits=produits)
+                         has_clients=has_clients, 
+                         has_produits=has_produits,
+                         after=after, per_page=per_page, next_cursor=next_cursor)
 
 
-@app.route('/add_order', methods=['GET', 'POST'])
+@route('/add_order', methods=['GET', 'POST'])
+@log_action
 def add_order():
     form = AddOrderForm()
-    client = Client()
-    produit = Produit()
-    
-    clients = client.get_clients()
-    produits = produit.get_products()
     
-    # Vérifiez si des clients ou produits sont disponibles
-    if not clients:
+    # Vérifiez si des clients ou produits sont disponibles (une ligne suffit)
+    if not Client().get_clients_page(limit=1)[0]:
         flash("Aucun client disponible pour passer une commande.", 'danger')
         return redirect(url_for('list_commandes'))
-    if not produits:
+    if not Produit().get_products_page(limit=1)[0]:
         flash("Aucun produit disponible pour passer une commande.", 'danger')
         return redirect(url_for('list_commandes'))
-    
-    # Générer les choix pour le formulaire
-    form.client_id.choices = [(c[0], c[1]) for c in clients]
-    form.produit_id.choices = [(p.id, p.nom) for p in produits]
 
     if form.validate_on_submit():
-        commande = Commande(
-            client_id=form.client_id.data,
-            produit_id=form.produit_id.data,
-            quantite=form.quantite.data
-        )
+        # Tout le panier est passé en une seule transaction
+        commande = Commande(client_id=form.client_id.data, lignes=order_lines(form))
         try:
             commande.add_commande()
             flash('Commande ajoutée avec succès.', 'success')
@@ -344,47 +473,89 @@ def add_order():
         except ValueError as e:
             flash(str(e), 'danger')
 
-    return render_template('add_order.html', form=form)
+    return render_template('add_order.html', form=form, **order_labels(form))
 
 # Création de la route '/edit_order/<int:order_id>'
-@app.route('/edit_order/<int:order_id>', methods=['GET', 'POST'])
+@route('/edit_order/<int:order_id>', methods=['GET', 'POST'])
+@log_action
 def edit_order(order_id):
-    form = AddOrderForm()
-    
-    clients = Client("", "", "")
-    clients_list = clients.get_clients()
-    form.client_id.choices = [(c[0], c[1]) for c in clients_list]
-    
-    produits = Produit()
-    produits_list = produits.get_products()
-    form.produit_id.choices = [(p.id, p.nom) for p in produits_list]
-    
     commande = Commande()
     current_order = commande.get_order_by_id(order_id)
-    
+    if current_order is None:
+        flash('Commande non trouvée.', 'error')
+        return redirect(url_for('list_commandes'))
+
     if request.method == 'GET':
-        # Pre-fill the form with current values
-        form.client_id.data = current_order[1]  
-        form.produit_id.data = current_order[2] 
-        form.quantite.data = current_order[3] 
+        # Pre-fill the form with current values (une entrée par ligne de la commande)
+        form = AddOrderForm(client_id=current_order[1],
+                            lignes=[{'produit_id': p, 'quantite': q} for p, q in current_order[2]] or None)
+    else:
+        form = AddOrderForm()
     
     if form.validate_on_submit():
         try:
-            updated_order = Commande(
-                client_id=form.client_id.data,
-                produit_id=form.produit_id.data,
-                quantite=form.quantite.data
-            )
+            updated_order = Commande(client_id=form.client_id.data, lignes=order_lines(form))
             updated_order.update_commande(order_id)
             flash('Commande mise à jour avec succès.', 'success')
             return redirect(url_for('list_commandes'))
         except ValueError as e:
             flash(str(e), 'error')
     
-    return render_template('edit_order.html', form=form, order_id=order_id)
+    return render_template('edit_order.html', form=form, order_id=order_id, **order_labels(form))
+
+# Lignes du panier envoyé : [(produit_id, quantite), ...]
+def order_lines(form):
+    return [(ligne.produit_id.data, ligne.quantite.data) for ligne in form.lignes]
+
+# Libellés affichés dans les champs d'autocomplétion pour les ID du formulaire
+def order_labels(form):
+    client = Client().get_by_id(form.client_id.data) if form.client_id.data else None
+    # Les produits de toutes les lignes sont lus en une requête
+    produits = Produit().get_many([ligne.produit_id.data for ligne in form.lignes if ligne.produit_id.data])
+    produit_labels = []
+    for ligne in form.lignes:
+        produit = produits.get(ligne.produit_id.data)
+        produit_labels.append(f"{produit.nom} (#{produit.id})" if produit else '')
+    return {
+        'client_label': f"{client[1]} (#{client[0]})" if client else '',
+        'produit_labels': produit_labels,
+    }
+
+#------------------------Autocomplétion (JSON)------------------------
+
+AUTOCOMPLETE_LIMIT = 20 # Nombre de suggestions par défaut
+MAX_AUTOCOMPLETE_LIMIT = 50
+
+# Lecture des paramètres : ?q=<début du nom>&limit=<n>&after_nom=<nom>&after_id=<id>
+def get_autocomplete_args():
+    q = request.args.get('q', '').strip()
+    limit = request.args.get('limit', AUTOCOMPLETE_LIMIT, type=int)
+    limit = min(max(limit, 1), MAX_AUTOCOMPLETE_LIMIT)
+    after_id = request.args.get('after_id', type=int)
+    after = (request.args.get('after_nom', ''), after_id) if after_id is not None else None
+    return q, limit, after
+
+def autocomplete_response(results, next_cursor):
+    return jsonify(results=results,
+                   next={'after_nom': next_cursor[0], 'after_id': next_cursor[1]} if next_cursor else None)
+
+# Création de la route '/autocomplete/clients'
+@route('/autocomplete/clients')
+def autocomplete_clients():
+    q, limit, after = get_autocomplete_args()
+    rows, next_cursor = Client().search_by_name(q, limit, after)
+    return autocomplete_response([{'id': r[0], 'nom': r[1], 'email': r[2]} for r in rows], next_cursor)
+
+# Création de la route '/autocomplete/produits'
+@route('/autocomplete/produits')
+def autocomplete_produits():
+    q, limit, after = get_autocomplete_args()
+    rows, next_cursor = Produit().search_by_name(q, limit, after)
+    return autocomplete_response([{'id': r[0], 'nom': r[1], 'prix': r[2], 'stock': r[3]} for r in rows], next_cursor)
 
 # Création de la route '/delete_order/<int:order_id>'
-@app.route('/delete_order/<int:order_id>', methods=['POST'])
+@route('/delete_order/<int:order_id>', methods=['POST'])
+@log_action
 def delete_order(order_id):
     try:
         commande = Commande()
@@ -393,20 +564,7 @@ def delete_order(order_id):
             flash('Commande non trouvée.', 'error')
             return redirect(url_for('list_commandes'))
 
-        produit = Produit()
-        product = next((p for p in produit.get_products() if p.id == order[2]), None)  
-        if product:
-            product.stock += order[3]  
-            produit.update_product(
-                produit_id=product.id,
-                nom=product.nom,
-                prix=product.prix,
-                description=product.description,
-                stock=product.stock,
-                type_produit=product.type_produit
-            )
-
-        commande.delete_commande(order_id)
+        commande.delete_commande(order_id)  # Supprime la commande et rend son stock au produit
 
         flash('Commande supprimée avec succès.', 'success')
     except Exception as e:
@@ -416,90 +574,285 @@ def delete_order(order_id):
  
 
 
+# ----------------------- Schéma de la base -----------------------
+
+# Commande à lancer au déploiement : flask --app app migrate
+@cli.command('migrate')
+def migrate_command():
+    User().create_table_user()
+    version = migrate(log=click.echo)
+    click.echo(f"Schéma en version {version}")
+
+
+# ----------------------- Serveur de production -----------------------
+
+# Commande : flask --app app serve --workers 4 --threads 4 (arrêt : SIGTERM, rechargement : SIGHUP)
+@cli.command('serve')
+@click.option('--host', default='127.0.0.1', show_default=True)
+@click.option('--port', default=8000, show_default=True)
+@click.option('--workers', default=WORKERS, show_default=True, help="Nombre de processus workers")
+@click.option('--threads', default=THREADS, show_default=True, help="Threads par worker")
+@click.option('--max-requests', default=MAX_REQUESTS, show_default=True, help="Requêtes avant le remplacement d'un worker (0 : jamais)")
+@click.option('--graceful-timeout', default=GRACEFUL_TIMEOUT, show_default=True, help="Secondes laissées aux requêtes en cours à l'arrêt")
+@click.option('--access-log', is_flag=True, help="Journal d'accès sur la sortie d'erreur")
+def serve_command(host, port, workers, threads, max_requests, graceful_timeout, access_log):
+    app = current_app._get_current_object()
+    WorkerRequestHandler.access_log = access_log
+
+    # Appelée par le maître avant chaque fork (démarrage et SIGHUP) : les workers héritent d'un état prêt
+    def prepare():
+        check_schema()
+        warm_templates(app)
+        templates_signature(refresh=True)
+        import catalogue  # NumPy, importé à la demande en développement
+
+    # Appelée par chaque worker au démarrage : un fichier de journal par place (user_actions.<place>.log)
+    def worker_init(slot):
+        journal.configure(suffix=slot)
+
+    # Appelée par chaque worker avant de se terminer : tâche en cours puis journal
+    def worker_exit():
+        taches.shutdown(graceful_timeout)
+        journal.shutdown()
+
+    try:
+        serve(app, host, port, workers=workers, threads=threads, max_requests=max_requests,
+              graceful_timeout=graceful_timeout, prepare=prepare, worker_init=worker_init,
+              worker_exit=worker_exit, log=click.echo)
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+
+
+# ----------------------- Import en masse -----------------------
+
+# Route pour importer un fichier de produits ou de clients
+@route('/import', methods=['GET', 'POST'])
+@log_action
+def import_data():
+    if request.method == 'POST':
+        entity = request.form.get('entity')
+        fichier = request.files.get('fichier')
+        if entity not in ENTITIES or fichier is None or not fichier.filename:
+            flash("Veuillez choisir un type de données et un fichier.", 'danger')
+        else:
+            try:
+                fmt = detect_format(fichier.filename)
+            except ValueError as e:
+                flash(str(e), 'danger')
+                return render_template('import.html', job=None)
+            # Le fichier est enregistré puis importé par une tâche de fond (lu ligne par ligne, inséré par lots)
+            os.makedirs(os.path.join(taches.JOBS_DIR, 'uploads'), exist_ok=True)
+            path = os.path.join(taches.JOBS_DIR, 'uploads', f"{uuid.uuid4().hex}.{fmt}")
+            fichier.save(path)
+            job_id = taches.submit('import', {'entity': entity, 'path': path, 'format': fmt}, user=current_user())
+            return redirect(url_for('import_data', job=job_id))
+
+    # Page de suivi : ?job=<id> affiche la progression, puis le rapport d'import
+    job_id = request.args.get('job', type=int)
+    job = taches.get_job(job_id) if job_id else None
+    return render_template('import.html', job=job)
+
+
+# Commande : flask --app app import produits catalogue.csv
+@cli.command('import')
+@click.argument('entity', type=click.Choice(sorted(ENTITIES)))
+@click.argument('fichier', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl', 'ndjson']), help="Format du fichier (déduit de l'extension par défaut)")
+@click.option('--batch-size', default=BATCH_SIZE, show_default=True, help="Nombre de lignes par transaction")
+def import_command(entity, fichier, fmt, batch_size):
+    start = time.perf_counter()
+    def progress(report):
+        click.echo(f"{report['inserted']} ligne(s) importée(s), {report['rejected']} rejetée(s)")
+    with open(fichier, 'rb') as stream:
+        report = import_file(entity, stream, fmt or detect_format(fichier), batch_size, progress)
+    for line, message in report['errors']:
+        click.echo(f"Ligne {line} : {message}", err=True)
+    elapsed = time.perf_counter() - start
+    click.echo(f"Terminé : {report['inserted']} importée(s), {report['rejected']} rejetée(s) "
+               f"en {elapsed:.1f} s ({report['inserted'] / max(elapsed, 1e-9):.0f} lignes/s)")
+
+
+# ----------------------- Export en flux -----------------------
+
+# Route pour exporter une table : /export/commandes.csv, /export/produits.ndjson...
+@route('/export/<entity>.<any(csv, ndjson):fmt>')
+@limited('lourd')
+def export_data(entity, fmt):
+    if entity not in EXPORTS:
+        return "Export inconnu", 404
+    # Compression gzip à la volée si le client l'accepte
+    compress = 'gzip' in request.accept_encodings
+    response = Response(export(entity, fmt, compress), content_type=FORMATS[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename={entity}.{fmt}'
+    response.vary.add('Accept-Encoding')
+    if compress:
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
+# Route pour lancer un export en tâche de fond : réponse 202, fichier sur /jobs/<id>/download
+@route('/jobs/export/<entity>.<any(csv, ndjson):fmt>', methods=['POST'])
+@log_action
+def export_job(entity, fmt):
+    if entity not in EXPORTS:
+        return "Export inconnu", 404
+    params = {'entity': entity, 'format': fmt, 'compress': request.args.get('gzip') == '1'}
+    job_id = taches.submit('export', params, user=current_user())
+    return job_response(job_id, 202)
+
+
+# Commande : flask --app app export commandes commandes.csv (ou "-" pour la sortie standard)
+@cli.command('export')
+@click.argument('entity', type=click.Choice(sorted(EXPORTS)))
+@click.argument('fichier', default='-')
+@click.option('--format', 'fmt', type=click.Choice(sorted(FORMATS)), help="Format de sortie (déduit de l'extension par défaut)")
+@click.option('--gzip', 'compress', is_flag=True, help="Compresser la sortie en gzip")
+def export_command(entity, fichier, fmt, compress):
+    if fmt is None:
+        fmt = 'ndjson' if fichier.removesuffix('.gz').endswith(('.ndjson', '.jsonl')) else 'csv'
+    output = sys.stdout.buffer if fichier == '-' else open(fichier, 'wb')
+    try:
+        for chunk in export(entity, fmt, compress):
+            output.write(chunk)
+    finally:
+        if output is not sys.stdout.buffer:
+            output.close()
+
+
+# ----------------------- Tâches de fond -----------------------
+
+# Nom de l'utilisateur connecté, enregistré avec les tâches qu'il lance
+def current_user():
+    return (session.get('user') or {}).get('username')
+
+# État d'une tâche en JSON, avec l'adresse où l'interroger
+def job_response(job_id, status=200):
+    job = taches.get_job(job_id)
+    if job is None:
+        abort(404)
+    job['url'] = url_for('job_status', job_id=job_id)
+    if job['status'] == taches.DONE and job['kind'] == 'export':
+        job['download_url'] = url_for('job_download', job_id=job_id)
+    response = jsonify(job)
+    response.status_code = status
+    response.headers['Location'] = job['url']
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+# Création de la route '/jobs/<int:job_id>' (interrogée par les pages en attente d'une tâche)
+@route('/jobs/<int:job_id>')
+def job_status(job_id):
+    return job_response(job_id)
+
+# Création de la route '/jobs/<int:job_id>/download' (fichier produit par une tâche d'export)
+@route('/jobs/<int:job_id>/download')
+def job_download(job_id):
+    job = taches.get_job(job_id)
+    if job is None or job['status'] != taches.DONE or not (job['result'] or {}).get('file'):
+        abort(404)
+    filename = job['result']['file']
+    return send_file(os.path.join(taches.job_dir(job_id), filename), as_attachment=True, download_name=filename)
+
+# Commande : flask --app app jobs --threads 2 (exécute les tâches ; JOB_THREADS=0 côté serveur web)
+@cli.command('jobs')
+@click.option('--threads', default=2, show_default=True, help="Tâches exécutées en parallèle")
+def jobs_command(threads):
+    runner = taches.Runner(threads)
+    stop = threading.Event()
+    # SIGTERM comme Ctrl+C : les tâches en cours se terminent avant l'arrêt
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    runner.start()
+    click.echo(f"Exécution des tâches ({threads} thread(s)), Ctrl+C pour arrêter")
+    try:
+        while not stop.wait(1):
+            pass
+    except KeyboardInterrupt:
+        pass
+    click.echo("Arrêt après les tâches en cours...")
+    runner.stop()
+
+
+# Commande : flask --app app snapshot analytics.db [--every 300] (copie lue par les rapports
+# si APP_ANALYTICS_DATABASE la désigne)
+@cli.command('snapshot')
+@click.argument('target', required=False)
+@click.option('--every', type=int, default=0, help="Recopie toutes les N secondes (0 : une seule copie)")
+def snapshot_command(target, every):
+    target = target or database.ANALYTICS_DATABASE
+    if not target:
+        raise click.UsageError("Indiquez le fichier de la copie (ou APP_ANALYTICS_DATABASE).")
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    try:
+        while True:
+            elapsed = database.backup_database(target)
+            click.echo(f"Copie {target} écrite en {elapsed:.2f} s")
+            if not every or stop.wait(every):
+                break
+    except KeyboardInterrupt:
+        pass
+
+
 #-----------------------Methodes et Routes pour les Graphiques -----------------------
 
-# Création de la fonction pour générer le graphique circulaire
-def generate_pie_chart(app):
-    with app.open_resource('app_database.db') as db_file:
-        conn = sqlite3.connect(db_file.name)
-        cursor = conn.cursor()
-        cursor.execute('SELECT type_produit, COUNT(*) FROM produits GROUP BY type_produit')
-        rows = cursor.fetchall()
-        types = [row[0] for row in rows]
-        counts = [row[1] for row in rows]
-        plt.figure(figsize=(8, 6)) 
-        plt.pie(counts, labels=types, autopct='%1.1f%%', startangle=90)
-        plt.axis('equal')
-        plt.title('Répartition des Produits par Type')
-        plt.savefig('static/product_share.png', transparent=True)
-        plt.close()
-
-# Création de la fonction pour générer le graphique en barres
-def generate_category_bar_chart(app):
-    with app.open_resource('app_database.db') as db_file:
-        conn = sqlite3.connect(db_file.name)
-        cursor = conn.cursor()
-
-        # Requête pour récupérer les données des catégories
-        cursor.execute('SELECT stock, COUNT(*) FROM produits GROUP BY stock ORDER BY COUNT(*) DESC LIMIT 3')
-        rows = cursor.fetchall()
-
-        # Extraire les noms de catégories et les comptes
-        categories = [row[0] for row in rows]
-        counts = [row[1] for row in rows]
-
-        # Créer le graphique en barres
-        plt.bar(categories, counts)
-        plt.xlabel('Catégorie')
-        plt.ylabel('Nombre de Produits')
-        plt.title('Top 5 des Catégories par Nombre de Produits')
-
-        # Sauvegarder le graphique dans un fichier
-        plt.savefig('static/category_bar_chart.png', transparent=True)
-        plt.close()
-
-# Création de la fonction pour générer l'histogramme
-def generate_price_histogram(app):
-    # Connexion à la base de données
-    with app.open_resource('app_database.db') as db_file:
-        conn = sqlite3.connect(db_file.name)
-        cursor = conn.cursor()
-
-        # Requête pour récupérer les données de prix
-        cursor.execute('SELECT prix FROM produits')
-        rows = cursor.fetchall()
-
-        # Extraire les valeurs des prix
-        prices = [row[0] for row in rows]
-
-        # Créer l'histogramme
-        plt.hist(prices, bins=50)
-        plt.xlabel('Prix')
-        plt.ylabel('Fréquence')
-        plt.title('Répartition des Prix des Produits')
-
-        # Sauvegarder le graphique dans un fichier
-        plt.savefig('static/price_histogram.png', transparent=True)
-        plt.close()
+# Création de la route '/api/ventes' : ?par=categorie|produit|client|jour&jours=90&limit=20
+# (lit les cumuls par jour de ventes.py, pas les commandes)
+@route('/api/ventes')
+@limited('lourd')
+def api_ventes():
+    try:
+        report = ventes.sales_report(request.args.get('par', 'categorie'),
+                                     request.args.get('jours', 90, type=int),
+                                     request.args.get('limit', type=int))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    response = jsonify(report)
+    response.headers['Cache-Control'] = 'private, max-age=60'
+    return response
+
+
+# Création de la route '/metrics' (format texte Prometheus, propre à ce processus)
+# Avec flask --app app serve, chaque worker a ses propres compteurs : la réponse ne
+# décrit que le worker qui l'a servie, et un worker recyclé (--max-requests) repart
+# de zéro. Les mesures ne sont pas additionnées entre les workers.
+@route('/metrics')
+def metrics():
+    return Response(metriques.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 
 # Création de la route pour afficher les graphiques
-@app.route('/graph')
+@route('/graph')
+@limited('lourd')
 def graph():
-    # Générer les graphiques à chaque chargement de la page
-    generate_pie_chart(current_app)
-    generate_category_bar_chart(current_app)
-    generate_price_histogram(current_app)
+    # Les graphiques ne sont régénérés que si les produits ou les catégories ont changé depuis le
+    # dernier rendu ; le rendu est fait par une tâche de fond, la page se recharge quand il est terminé
+    charts_dir = os.path.join(current_app.static_folder, 'charts')
+    version = chart_version()
+    charts = ready_charts(charts_dir, version)
+    job_id = None
+    if charts is None:
+        # La version fait partie des paramètres : une tâche déjà lancée pour une version
+        # précédente n'est pas reprise pour celle-ci (unique=True compare les paramètres)
+        job_id = taches.submit('graphiques', {'charts_dir': charts_dir, 'version': list(version)},
+                               user=current_user(), unique=True)
+    # Résumé par type calculé sur le catalogue en colonnes (import local : NumPy)
+    from catalogue import get_catalogue
+    catalogue = get_catalogue()
 
     # Rendre la page avec les graphiques
     return render_template('graph.html', 
-        product_share='static/product_share.png', 
-        category_bar_chart='static/category_bar_chart.png', 
-        price_histogram='static/price_histogram.png')
+        job_id=job_id,
+        product_share=charts and 'charts/' + charts['product_share'], 
+        category_bar_chart=charts and 'charts/' + charts['category_bar_chart'], 
+        price_histogram=charts and 'charts/' + charts['price_histogram'],
+        resume=catalogue.summary_by_type(),
+        valeur_stock=catalogue.stock_value())
 
 if __name__ == '__main__':
 
-    # Initialize the database by pushing the app context
-    app.app_context().push()
-    db.create_all()
+    # Serveur de développement : met les bases à jour au lancement
+    app = create_app()
+    User().create_table_user()
+    migrate()
     app.run(debug=True)
 
@@ -0,0 +1,164 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+'''--------------------Génération d'une base de test volumineuse--------------------'''
+
+# Usage : python -m benchmarks.dataset --db bench_database.db [--produits 1000000]
+#         [--clients 100000] [--commandes 5000000] [--force]
+# La base est créée par les migrations puis remplie par lots, comme un import en masse
+# (une transaction et un executemany par lot). Ne jamais viser app_database.db.
+
+PRODUITS = 1_000_000
+CLIENTS = 100_000
+COMMANDES = 5_000_000
+LIGNES_MAX = 3 # Produits différents par commande (2 en moyenne)
+JOURS = 365    # Commandes réparties sur la dernière année
+BATCH_SIZE = 50_000
+
+ALIMENTS = ("pomme", "banane", "tomate", "salade", "brocoli", "lait", "pain", "fromage", "jus", "riz",
+            "pâtes", "café", "thé", "chocolat", "yaourt", "carotte", "poulet", "saumon", "oeufs", "farine")
+QUALIFICATIFS = ("bio", "frais", "local", "surgelé", "entier", "allégé", "artisanal", "premium")
+RUES = ("rue de la Paix", "avenue Foch", "boulevard Voltaire", "rue Victor Hugo", "place de la Mairie")
+VILLES = ("Paris", "Lyon", "Marseille", "Lille", "Dakar", "Nantes", "Bordeaux", "Toulouse")
+
+
+'''fonction pour generer les lignes produits (nom, prix, description, stock, categorie_id)'''
+def generate_produits(rng, count):
+    from gestion_produit import Categorie
+    categories = [categorie_id for categorie_id, _ in Categorie.get_categories()]
+    for i in range(1, count + 1):
+        aliment = rng.choice(ALIMENTS)
+        qualificatif = rng.choice(QUALIFICATIFS)
+        yield (f"{aliment} {qualificatif} {i}", round(rng.uniform(0.1, 100), 2),
+               f"{aliment.capitalize()} {qualificatif}, lot {rng.randint(1, 9999)}",
+               rng.randint(1, 1000), rng.choice(categories))
+
+
+'''fonction pour generer les lignes clients (nom, email, adresse)'''
+def generate_clients(rng, count):
+    for i in range(1, count + 1):
+        yield (f"Client {i}", f"client{i}@exemple.fr",
+               f"{rng.randint(1, 200)} {rng.choice(RUES)}, {rng.choice(VILLES)}")
+
+
+'''fonction pour generer les commandes (client_id, created_at, [(produit_id, quantite), ...])'''
+def generate_commandes(rng, count, max_client_id, max_produit_id, now=None):
+    now = int(now or time.time())
+    for _ in range(count):
+        produits = {rng.randint(1, max_produit_id) for _ in range(rng.randint(1, LIGNES_MAX))}
+        yield (rng.randint(1, max_client_id), now - rng.randint(0, JOURS * 86400),
+               [(produit_id, rng.randint(1, 10)) for produit_id in sorted(produits)])
+
+
+'''fonction pour decouper un generateur en lots'''
+def batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+'''fonction pour inserer les commandes d'un lot (pas de verification de stock : donnees de test)'''
+def insert_commandes(cursor, batch):
+    from database import set_bulk_mode, bump_version
+    set_bulk_mode(cursor, True)
+    # Les id sont attribués ici (transaction en cours) pour insérer les lignes d'un seul executemany
+    first_id = cursor.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM commandes").fetchone()[0]
+    cursor.executemany("INSERT INTO commandes (id, client_id, created_at) VALUES (?, ?, ?)",
+                       [(first_id + i, client_id, created_at) for i, (client_id, created_at, _) in enumerate(batch)])
+    # Prix d'achat : le prix courant du produit
+    cursor.executemany("""
+        INSERT INTO lignes_commande (commande_id, produit_id, quantite, prix_unitaire)
+        SELECT ?, id, ?, prix FROM produits WHERE id = ?
+    """, [(first_id + i, quantite, produit_id)
+          for i, (_, _, lignes) in enumerate(batch) for produit_id, quantite in lignes])
+    bump_version(cursor, "commandes")
+    bump_version(cursor, "lignes_commande")
+    set_bulk_mode(cursor, False)
+
+
+'''fonction pour creer et remplir une base de test (retourne les volumes inseres)'''
+def seed(path, produits=PRODUITS, clients=CLIENTS, commandes=COMMANDES, seed=0, batch_size=BATCH_SIZE, log=print):
+    import database
+    from database import run_in_transaction
+    from import_donnees import insert_batch
+    from migrations import migrate
+    from ventes import rebuild_sales_rollups
+
+    if os.path.basename(path) == "app_database.db":
+        raise ValueError("Refus de remplir app_database.db : choisir une base jetable.")
+    database.configure(path)
+    migrate(log=lambda message: None)
+    rng = random.Random(seed)
+
+    for entity, rows in (("produits", generate_produits(rng, produits)), ("clients", generate_clients(rng, clients))):
+        start = time.perf_counter()
+        for batch in batches(rows, batch_size):
+            run_in_transaction(lambda cursor: insert_batch(cursor, entity, batch))
+        log(f"{entity} : {time.perf_counter() - start:.1f} s")
+
+    connection = database.get_connection()
+    max_client_id = connection.execute("SELECT MAX(id) FROM clients").fetchone()[0] or 0
+    max_produit_id = connection.execute("SELECT MAX(id) FROM produits").fetchone()[0] or 0
+    if commandes and max_client_id and max_produit_id:
+        start = time.perf_counter()
+        for batch in batches(generate_commandes(rng, commandes, max_client_id, max_produit_id), batch_size):
+            run_in_transaction(lambda cursor: insert_commandes(cursor, batch))
+        # Les cumuls des ventes ne sont pas tenus pendant l'import : calculés une fois
+        run_in_transaction(rebuild_sales_rollups)
+        log(f"commandes : {time.perf_counter() - start:.1f} s")
+
+    connection.execute("ANALYZE")
+    return volumes()
+
+
+'''fonction pour compter les lignes de chaque table de la base courante'''
+def volumes():
+    from database import get_connection
+    connection = get_connection()
+    return {table: connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            for table in ("produits", "clients", "commandes", "lignes_commande")}
+
+
+'''fonction pour ajouter les options de volume a un parseur'''
+def add_arguments(parser):
+    parser.add_argument("--db", default="bench_database.db", help="base jetable à créer")
+    parser.add_argument("--produits", type=int, default=PRODUITS)
+    parser.add_argument("--clients", type=int, default=CLIENTS)
+    parser.add_argument("--commandes", type=int, default=COMMANDES)
+    parser.add_argument("--seed", type=int, default=0, help="graine du générateur aléatoire")
+
+
+'''fonction pour supprimer une base et ses fichiers WAL'''
+def remove_database(path):
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Crée une base de test volumineuse")
+    add_arguments(parser)
+    parser.add_argument("--force", action="store_true", help="remplace la base si elle existe")
+    args = parser.parse_args(argv)
+
+    if os.path.exists(args.db):
+        if not args.force:
+            print(f"{args.db} existe déjà (--force pour la remplacer)")
+            return 1
+        remove_database(args.db)
+    start = time.perf_counter()
+    counts = seed(args.db, args.produits, args.clients, args.commandes, args.seed)
+    print(f"{counts} en {time.perf_counter() - start:.1f} s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
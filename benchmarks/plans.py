@@ -0,0 +1,288 @@
+import argparse
+import contextlib
+import json
+import os
+import random
+import re
+import sqlite3
+import statistics
+import sys
+import time
+from benchmarks import dataset
+
+'''--------------------Audit des plans de requête (EXPLAIN QUERY PLAN)--------------------'''
+
+# Usage : python -m benchmarks.plans --db bench_database.db [--repeat 5] [--save plans.json]
+# Appelle les méthodes de Produit, Client et Commande, les lectures des graphiques et les
+# rapports des ventes sur une base volumineuse (générée par benchmarks.dataset si besoin),
+# et relève chaque instruction SQL exécutée. Pour chacune : EXPLAIN QUERY PLAN et durée
+# médiane d'une nouvelle exécution (dans une transaction annulée, écritures comprises).
+# Code de sortie 1 si une instruction parcourt toute une grande table (SCAN) sans que
+# son cas ne l'autorise : un index supprimé ou inutilisable est vu avant la production.
+# Les routes modifient la base : elle est jetable.
+
+REPEAT = 5
+
+# Tables dont un parcours complet est une régression (les autres restent petites)
+LARGE_TABLES = frozenset({"produits", "clients", "commandes", "lignes_commande",
+                          "ventes_jour_produit", "ventes_jour_client", "ventes_jour_categorie"})
+
+AUDITED = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+
+# Nom de table suivi d'un alias éventuel, après FROM, JOIN, INTO ou UPDATE
+TABLE_REF = re.compile(r"\b(?:FROM|JOIN|INTO|UPDATE)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?", re.IGNORECASE)
+KEYWORDS = frozenset({"WHERE", "JOIN", "LEFT", "INNER", "CROSS", "ON", "USING", "GROUP", "ORDER", "LIMIT",
+                      "SET", "VALUES", "SELECT", "DEFAULT", "AS", "UNION", "HAVING", "WINDOW"})
+
+
+'''classe qui releve les instructions SQL executees pendant un cas'''
+# L'instruction telle qu'écrite dans le code vient de database.statement_hooks ; la même,
+# valeurs des paramètres incluses, vient du trace callback de SQLite (exécutable seule).
+class StatementCollector:
+    def __init__(self):
+        self.case = None
+        self.statements = {} # sql du code -> {"sql", "expanded", "calls", "cases"}
+        self._pending = None
+
+    '''methode appelee avant chaque execute (database.statement_hooks)'''
+    def on_statement(self, sql):
+        if self.case is not None and sql.lstrip().split(None, 1)[0].upper() in AUDITED:
+            self._pending = sql
+        else:
+            self._pending = None
+
+    '''methode appelee par SQLite au debut de chaque instruction (set_trace_callback)'''
+    def on_trace(self, expanded):
+        sql = self._pending
+        # Les instructions des triggers commencent par "--" ; le BEGIN implicite est ignoré
+        if sql is None or expanded.startswith("--"):
+            return
+        if expanded.lstrip().split(None, 1)[0].upper() != sql.lstrip().split(None, 1)[0].upper():
+            return
+        self._pending = None
+        entry = self.statements.get(sql)
+        if entry is None:
+            entry = self.statements[sql] = {"sql": sql, "expanded": expanded, "calls": 0, "cases": []}
+        entry["calls"] += 1
+        if self.case not in entry["cases"]:
+            entry["cases"].append(self.case)
+
+    '''methode pour brancher le trace callback sur une connexion (database.connection_hooks)'''
+    def on_connect(self, connection):
+        connection.set_trace_callback(self.on_trace)
+
+
+'''fonction pour construire les cas audites : nom -> (fonction sans argument, grandes tables qu'il peut parcourir)'''
+def audit_cases(rng, max_ids):
+    import catalogue
+    import graphiques
+    import ventes
+    from gestion_produit import Produit, Client, Commande, Categorie
+    produit, client, commande = Produit(), Client(), Commande()
+    categories = [categorie_id for categorie_id, _ in Categorie.get_categories()]
+    pid = lambda: rng.randint(1, max_ids["produits"])
+    cid = lambda: rng.randint(1, max_ids["clients"])
+    oid = lambda: rng.randint(1, max_ids["commandes"])
+    created = {}
+
+    def add_product():
+        new = Produit("Produit audit", 2.5, "audit des plans", 10, rng.choice(categories))
+        new.add_product()
+        created["produit"] = new.id
+
+    def add_client():
+        new = Client(nom="Client audit", email="audit@exemple.fr", adresse="1 rue du Test")
+        new.add_client()
+        created["client"] = new.id
+
+    def add_commande():
+        new = Commande(client_id=cid(), lignes=[(created["produit"], 1), (pid(), 1)])
+        new.add_commande()
+        created["commande"] = new.id
+
+    def update_commande():
+        Commande(client_id=cid(), lignes=[(created["produit"], 2)]).update_commande(created["commande"])
+
+    return {
+        "Produit.search": (lambda: produit.search("pomme"), ()),
+        "Produit.search_categorie": (lambda: produit.search("pomme", categorie_id=rng.choice(categories)), ()),
+        "Produit.count_by_type": (produit.count_by_type, ()),
+        "Produit.stock_frequencies": (lambda: produit.stock_frequencies(limit=3), ()),
+        "Produit.price_histogram": (produit.price_histogram, ()),
+        "Produit.exists": (lambda: produit.exists(pid()), ()),
+        "Produit.get_by_id": (lambda: produit.get_by_id(pid()), ()),
+        "Produit.get_many": (lambda: produit.get_many([pid() for _ in range(20)]), ()),
+        "Produit.get_products_page": (lambda: produit.get_products_page(pid()), ()),
+        "Produit.get_products_page_categorie": (
+            lambda: produit.get_products_page(pid(), categorie_id=rng.choice(categories)), ()),
+        "Produit.search_by_name": (lambda: produit.search_by_name("pom"), ()),
+        "Produit.filter_products_by_type": (lambda: produit.filter_products_by_type(rng.choice(categories)), ()),
+        # Liste complète : le parcours est attendu
+        "Produit.get_products": (produit.get_products, ("produits",)),
+        "Produit.add_product": (add_product, ()),
+        "Produit.update_product": (lambda: produit.update_product(
+            created["produit"], "Produit audit", 3.0, "audit des plans", rng.choice(categories), 5), ()),
+        "Client.exists": (lambda: client.exists(cid()), ()),
+        "Client.get_by_id": (lambda: client.get_by_id(cid()), ()),
+        "Client.get_many": (lambda: client.get_many([cid() for _ in range(20)]), ()),
+        "Client.get_clients_page": (lambda: client.get_clients_page(cid()), ()),
+        "Client.search_by_name": (lambda: client.search_by_name("Client 12"), ()),
+        "Client.get_clients": (client.get_clients, ("clients",)),
+        "Client.add_client": (add_client, ()),
+        "Client.update_client": (lambda: Client(nom="Client audit", email="audit2@exemple.fr",
+                                                adresse="2 rue du Test").update_client(created["client"]), ()),
+        "Commande.add_commande": (add_commande, ()),
+        "Commande.get_order_by_id": (lambda: commande.get_order_by_id(oid()), ()),
+        "Commande.get_many": (lambda: commande.get_many([oid() for _ in range(20)]), ()),
+        "Commande.get_commandes_with_details_page": (lambda: commande.get_commandes_with_details_page(oid()), ()),
+        "Commande.update_commande": (update_commande, ()),
+        "Commande.get_commandes": (commande.get_commandes, ("commandes",)),
+        "Commande.get_commandes_with_details": (commande.get_commandes_with_details, ("commandes",)),
+        "Commande.delete_commande": (lambda: commande.delete_commande(created["commande"]), ()),
+        "Client.delete_client": (lambda: client.delete_client(created["client"]), ()),
+        "Produit.delete_product": (lambda: produit.delete_product(created["produit"]), ()),
+        # Page des graphiques (app.graph) : statistiques, puis catalogue en colonnes, lu en entier
+        "graphiques.load_chart_data": (graphiques.load_chart_data, ()),
+        "catalogue.load": (catalogue.CatalogueSnapshot.load, ("produits",)),
+        **{f"ventes.sales_report_{par}": ((lambda par=par: ventes.sales_report(par, limit=20)), ())
+           for par in ventes.RAPPORTS},
+    }
+
+
+'''fonction pour associer les alias d'une requete a leur table (alias -> table)'''
+def table_aliases(sql):
+    aliases = {}
+    for table, alias in TABLE_REF.findall(sql):
+        aliases[table] = table
+        if alias and alias.upper() not in KEYWORDS:
+            aliases[alias] = table
+    return aliases
+
+
+'''fonction pour lire le plan d'une instruction et les grandes tables qu'il parcourt'''
+def explain(connection, entry):
+    plan = [row[3] for row in connection.execute("EXPLAIN QUERY PLAN " + entry["expanded"])]
+    aliases = table_aliases(entry["sql"])
+    scans = []
+    for detail in plan:
+        match = re.match(r"SCAN (\w+)", detail)
+        # "SCAN v" d'une sous-requête ou d'une table virtuelle (FTS5) n'est pas une table du schéma
+        table = aliases.get(match.group(1)) if match else None
+        if table in LARGE_TABLES and "VIRTUAL TABLE" not in detail and table not in scans:
+            scans.append(table)
+    return plan, scans
+
+
+'''fonction pour mesurer une instruction : duree mediane (ms), transaction annulee apres chaque execution'''
+def time_statement(connection, entry, repeat=REPEAT):
+    durations = []
+    for _ in range(repeat):
+        connection.execute("BEGIN")
+        try:
+            start = time.perf_counter()
+            connection.execute(entry["expanded"]).fetchall()
+            durations.append(time.perf_counter() - start)
+        finally:
+            connection.rollback()
+    return round(statistics.median(durations) * 1000, 3)
+
+
+'''fonction pour executer l'audit sur une base (retourne le rapport)'''
+def run(path, repeat=REPEAT, seed=0):
+    import database
+    from benchmarks.run import max_ids
+
+    collector = StatementCollector()
+    database.statement_hooks.append(collector.on_statement)
+    database.connection_hooks.append(collector.on_connect)
+    # Les connexions déjà ouvertes n'ont pas le trace callback : configure() les ferme
+    database.configure(path)
+    cases = audit_cases(random.Random(seed), max_ids())
+    errors = {}
+    try:
+        for name, (func, _) in cases.items():
+            collector.case = name
+            try:
+                # Les méthodes du modèle affichent leurs messages sur la sortie standard
+                with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                    func()
+            except Exception as e:
+                errors[name] = repr(e)
+            collector.case = None
+    finally:
+        database.statement_hooks.remove(collector.on_statement)
+        database.connection_hooks.remove(collector.on_connect)
+        database.configure(path)
+
+    connection = database.get_connection()
+    connection.commit()
+    statements = []
+    for entry in collector.statements.values():
+        plan, scans = explain(connection, entry)
+        median_ms = error = None
+        try:
+            median_ms = time_statement(connection, entry, repeat)
+        except sqlite3.Error as e:
+            # Par exemple une ligne de commande dont la commande a été supprimée depuis par un
+            # autre cas : seule la durée manque, le plan est vérifié
+            error = repr(e)
+        allowed = set.intersection(*(set(cases[name][1]) for name in entry["cases"]))
+        statements.append({
+            "sql": " ".join(entry["sql"].split()),
+            "cases": entry["cases"],
+            "calls": entry["calls"],
+            "plan": plan,
+            "scans": scans,
+            "unexpected_scans": [table for table in scans if table not in allowed],
+            "median_ms": median_ms,
+            "timing_error": error,
+        })
+    statements.sort(key=lambda statement: statement["median_ms"] or 0, reverse=True)
+    return {"volumes": dataset.volumes(), "statements": statements, "errors": errors}
+
+
+'''fonction pour afficher le rapport : une ligne par instruction, puis le plan des instructions en defaut'''
+def print_report(report, log=print):
+    log(f"Volumes : {report['volumes']}")
+    for statement in report["statements"]:
+        flag = "SCAN " + ",".join(statement["unexpected_scans"]) if statement["unexpected_scans"] else "ok"
+        sql = statement["sql"] if len(statement["sql"]) <= 90 else statement["sql"][:87] + "..."
+        median = "-" if statement["median_ms"] is None else f"{statement['median_ms']:.3f}"
+        log(f"{median:>10} ms  {flag:<28} {statement['cases'][0]:<44} {sql}")
+        if statement["timing_error"]:
+            log(f"{'':>14}durée non mesurée : {statement['timing_error']}")
+    for name, error in report["errors"].items():
+        log(f"Erreur dans {name} : {error}")
+    for statement in report["statements"]:
+        if statement["unexpected_scans"]:
+            log(f"\nParcours complet inattendu ({', '.join(statement['cases'])}) :\n  {statement['sql']}")
+            for detail in statement["plan"]:
+                log(f"    {detail}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Audit des plans de requête du modèle")
+    dataset.add_arguments(parser)
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="exécutions mesurées par instruction")
+    parser.add_argument("--save", help="fichier JSON où enregistrer le rapport")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.db):
+        print(f"Création de {args.db}")
+        print(dataset.seed(args.db, args.produits, args.clients, args.commandes, args.seed))
+    report = run(args.db, args.repeat, args.seed)
+    print_report(report)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+    failures = sum(1 for statement in report["statements"] if statement["unexpected_scans"])
+    if failures or report["errors"]:
+        print(f"\n{failures} instruction(s) en parcours complet inattendu, {len(report['errors'])} cas en erreur")
+        return 1
+    print(f"\n{len(report['statements'])} instructions, aucun parcours complet inattendu")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
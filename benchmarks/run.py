@@ -0,0 +1,278 @@
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import random
+import resource
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from benchmarks import dataset
+
+'''--------------------Banc d'essai des modèles et des routes--------------------'''
+
+# Usage : python -m benchmarks.run --db bench_database.db [--produits ... --clients ... --commandes ...]
+#         [--iterations 100] [--max-seconds 10] [--save resultats.json] [--baseline reference.json]
+# La base est générée par benchmarks.dataset si elle n'existe pas. Chaque cas est appelé
+# --iterations fois (au plus --max-seconds secondes) après un appel de chauffe non compté.
+# Les routes modifient la base : elle est jetable.
+
+ITERATIONS = 100
+MAX_SECONDS = 10.0
+
+
+'''fonction pour lire le pic de memoire (Ko) du processus et de ses workers'''
+def peak_rss_kb():
+    return {
+        "self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    }
+
+
+'''fonction pour calculer un centile (rang le plus proche) d'une liste triee'''
+def percentile(values, p):
+    index = max(0, min(len(values) - 1, round(p / 100 * len(values)) - 1))
+    return values[index]
+
+
+'''fonction pour mesurer un cas : latences p50/p99 et debit'''
+def measure(func, iterations=ITERATIONS, max_seconds=MAX_SECONDS):
+    errors = 0
+    try:
+        func()  # Chauffe : caches, requêtes préparées, premier rendu des graphiques
+    except Exception:
+        errors += 1
+    durations = []
+    start = time.perf_counter()
+    while len(durations) < iterations and time.perf_counter() - start < max_seconds:
+        t = time.perf_counter()
+        try:
+            func()
+        except Exception:
+            errors += 1
+        durations.append(time.perf_counter() - t)
+    elapsed = time.perf_counter() - start
+    durations.sort()
+    return {
+        "n": len(durations),
+        "errors": errors,
+        "p50_ms": round(percentile(durations, 50) * 1000, 3),
+        "p99_ms": round(percentile(durations, 99) * 1000, 3),
+        "mean_ms": round(sum(durations) / len(durations) * 1000, 3),
+        "max_ms": round(durations[-1] * 1000, 3),
+        "throughput_per_s": round(len(durations) / elapsed, 1),
+    }
+
+
+'''fonction pour construire les cas des methodes du modele (nom -> fonction sans argument)'''
+def model_cases(rng, max_ids):
+    from gestion_produit import Produit, Client, Commande, Categorie
+    import ventes
+    produit, client, commande = Produit(), Client(), Commande()
+    categories = [categorie_id for categorie_id, _ in Categorie.get_categories()]
+    pid = lambda: rng.randint(1, max_ids["produits"])
+    cid = lambda: rng.randint(1, max_ids["clients"])
+    oid = lambda: rng.randint(1, max_ids["commandes"])
+
+    def add_commande(nb_lignes):
+        def call():
+            try:
+                Commande(client_id=cid(), lignes=[(pid(), 1) for _ in range(nb_lignes)]).add_commande()
+            except ValueError:
+                pass  # Stock épuisé : refus normal
+        return call
+
+    return {
+        "model.produit.get_by_id": lambda: produit.get_by_id(pid()),
+        "model.produit.get_many_100": lambda: produit.get_many([pid() for _ in range(100)]),
+        "model.produit.get_products_page": lambda: produit.get_products_page(after_id=pid()),
+        "model.produit.get_products_page_type": lambda: produit.get_products_page(
+            after_id=pid(), categorie_id=rng.choice(categories)),
+        "model.produit.search": lambda: produit.search(rng.choice(dataset.ALIMENTS)),
+        "model.produit.count_by_type": produit.count_by_type,
+        "model.produit.price_histogram": produit.price_histogram,
+        "model.produit.search_by_name": lambda: produit.search_by_name(rng.choice(dataset.ALIMENTS)[:3]),
+        "model.client.get_by_id": lambda: client.get_by_id(cid()),
+        "model.client.search_by_name": lambda: client.search_by_name(f"Client {rng.randint(1, 99)}"),
+        "model.client.get_clients_page": lambda: client.get_clients_page(after_id=cid()),
+        "model.commande.get_by_id": lambda: commande.get_by_id(oid()),
+        "model.commande.get_commandes_with_details_page": lambda: commande.get_commandes_with_details_page(after_id=oid()),
+        "model.commande.add_commande": add_commande(1),
+        "model.commande.add_commande_30": add_commande(30),
+        "model.ventes.sales_report_categorie": lambda: ventes.sales_report("categorie", 90),
+        "model.ventes.sales_report_client_20": lambda: ventes.sales_report("client", 90, limit=20),
+    }
+
+
+'''fonction pour construire les cas des routes, appelees par le client de test Flask'''
+def route_cases(rng, max_ids, client):
+    from gestion_produit import Categorie
+    categories = [categorie_id for categorie_id, _ in Categorie.get_categories()]
+    pid = lambda: rng.randint(1, max_ids["produits"])
+    cid = lambda: rng.randint(1, max_ids["clients"])
+    oid = lambda: rng.randint(1, max_ids["commandes"])
+
+    def get(url):
+        def call():
+            response = client.get(url() if callable(url) else url)
+            response.get_data()  # Consomme les réponses en flux
+            response.close()
+            if response.status_code >= 400:
+                raise RuntimeError(f"statut {response.status_code}")
+        return call
+
+    def basket(nb_lignes):
+        data = {"client_id": cid()}
+        for i in range(nb_lignes):
+            data[f"lignes-{i}-produit_id"] = pid()
+            data[f"lignes-{i}-quantite"] = 1
+        return data
+
+    def post(url, data):
+        def call():
+            response = client.post(url, data=data())
+            response.close()
+            if response.status_code >= 400:
+                raise RuntimeError(f"statut {response.status_code}")
+        return call
+
+    return {
+        "route.index": get("/"),
+        "route.dashboard": get("/dashboard"),
+        "route.list": get("/list"),
+        "route.list_page": get(lambda: f"/list?after={pid()}"),
+        "route.list_type": get(lambda: f"/list?categorie={rng.choice(categories)}"),
+        "route.list_search": get(lambda: f"/list?q={rng.choice(dataset.ALIMENTS)}"),
+        "route.list_stream_all": get("/list?stream=1"),
+        "route.list_clients": get(lambda: f"/list_clients?after={cid()}"),
+        "route.commandes": get(lambda: f"/commandes?after={oid()}"),
+        "route.add_form": get("/add"),
+        "route.update_form": get(lambda: f"/update/{pid()}"),
+        "route.edit_client_form": get(lambda: f"/edit_client/{cid()}"),
+        "route.add_order_form": get("/add_order"),
+        "route.edit_order_form": get(lambda: f"/edit_order/{oid()}"),
+        "route.autocomplete_clients": get(lambda: f"/autocomplete/clients?q=Client {rng.randint(1, 99)}"),
+        "route.autocomplete_produits": get(lambda: f"/autocomplete/produits?q={rng.choice(dataset.ALIMENTS)[:3]}"),
+        "route.graph": get("/graph"),
+        "route.metrics": get("/metrics"),
+        "route.export_clients_csv": get("/export/clients.csv"),
+        "route.api_ventes": get("/api/ventes?par=categorie&jours=90"),
+        "route.add_product": post("/add", lambda: {
+            "nom": f"Produit bench {rng.randint(1, 10 ** 9)}", "prix": "2.50", "description": "banc d'essai",
+            "stock": "10", "categorie_id": rng.choice(categories)}),
+        "route.add_client": post("/add_client", lambda: {
+            "nom": "Client bench", "email": f"bench{rng.randint(1, 10 ** 9)}@exemple.fr", "adresse": "1 rue du Test"}),
+        "route.add_order": post("/add_order", lambda: basket(1)),
+        "route.add_order_30": post("/add_order", lambda: basket(30)),
+    }
+
+
+'''fonction pour lire le plus grand id de chaque table'''
+def max_ids():
+    from database import get_connection
+    connection = get_connection()
+    return {table: connection.execute(f"SELECT COALESCE(MAX(id), 1) FROM {table}").fetchone()[0]
+            for table in ("produits", "clients", "commandes")}
+
+
+'''fonction pour recuperer le commit courant (pour comparer les resultats entre commits)'''
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+'''fonction pour executer tout le banc d'essai sur une base (retourne le rapport)'''
+def run(path, iterations=ITERATIONS, max_seconds=MAX_SECONDS, only=None, seed=0, log=print):
+    import database
+    database.configure(path)
+    from app import create_app
+
+    rng = random.Random(seed)
+    ids = max_ids()
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "volumes": dataset.volumes(),
+            "iterations": iterations,
+            "max_seconds": max_seconds,
+        },
+        "cases": {},
+        "peak_rss_kb": {},
+    }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app({"TESTING": True, "WTF_CSRF_ENABLED": False,
+                          "AUDIT_LOG": os.path.join(tmp, "user_actions.log")})
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['user'] = {'username': 'bench'}
+
+        for phase, cases in (("model", model_cases(rng, ids)), ("routes", route_cases(rng, ids, client))):
+            for name, func in cases.items():
+                if only and only not in name:
+                    continue
+                # Les vues affichent les formulaires validés sur la sortie standard
+                with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                    result = report["cases"][name] = measure(func, iterations, max_seconds)
+                log(f"{name:<52} p50 {result['p50_ms']:>9.2f} ms  p99 {result['p99_ms']:>9.2f} ms  "
+                    f"{result['throughput_per_s']:>8.1f}/s  n={result['n']}"
+                    + (f"  erreurs={result['errors']}" if result["errors"] else ""))
+            report["peak_rss_kb"][phase] = peak_rss_kb()
+    return report
+
+
+'''fonction pour comparer un rapport a une reference (liste des regressions de p50/p99)'''
+def compare(report, baseline, max_regression):
+    regressions = []
+    for name, result in report["cases"].items():
+        reference = baseline.get("cases", {}).get(name)
+        if not reference:
+            continue
+        for metric in ("p50_ms", "p99_ms"):
+            if reference[metric] and result[metric] > reference[metric] * (1 + max_regression):
+                regressions.append(f"{name} {metric} : {result[metric]} ms (référence {reference[metric]} ms)")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Banc d'essai des modèles et des routes")
+    dataset.add_arguments(parser)
+    parser.add_argument("--iterations", type=int, default=ITERATIONS, help="appels mesurés par cas")
+    parser.add_argument("--max-seconds", type=float, default=MAX_SECONDS, help="durée maximale par cas")
+    parser.add_argument("--only", help="ne lance que les cas dont le nom contient ce texte")
+    parser.add_argument("--save", help="fichier JSON où enregistrer les résultats")
+    parser.add_argument("--baseline", help="fichier JSON de référence (résultat d'un --save précédent)")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="écart toléré par rapport à la référence (0.2 = 20 %%)")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.db):
+        print(f"Création de {args.db}")
+        print(dataset.seed(args.db, args.produits, args.clients, args.commandes, args.seed))
+    report = run(args.db, args.iterations, args.max_seconds, args.only, args.seed)
+    print(f"Pic mémoire : {report['peak_rss_kb']}")
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.max_regression)
+        for regression in regressions:
+            print(f"Régression : {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,90 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+'''--------------------Mesure du temps de démarrage d'un worker--------------------'''
+
+# Usage : python -m benchmarks.startup [--runs 10] [--save resultats.json] [--baseline reference.json]
+# Chaque mesure est faite dans un nouveau processus Python : c'est le coût payé par
+# chaque worker au démarrage, modules non encore chargés.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Script exécuté dans le processus mesuré ; il affiche ses mesures en JSON (ms)
+PROBE = """
+import json, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+application = app.create_app({"TESTING": True})
+created = time.perf_counter()
+status = application.test_client().get("/").status_code
+first_request = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - start) * 1000,
+    "create_app_ms": (created - imported) * 1000,
+    "first_request_ms": (first_request - created) * 1000,
+    "total_ms": (first_request - start) * 1000,
+    "status": status,
+}))
+"""
+
+METRICS = ("import_ms", "create_app_ms", "first_request_ms", "total_ms")
+
+
+'''fonction pour lancer une mesure dans un nouveau processus'''
+def run_probe():
+    result = subprocess.run([sys.executable, "-c", PROBE], cwd=ROOT, capture_output=True, text=True, check=True)
+    sample = json.loads(result.stdout.strip().splitlines()[-1])
+    if sample["status"] != 200:
+        raise RuntimeError(f"La première requête a répondu {sample['status']}")
+    return sample
+
+
+'''fonction pour mesurer le demarrage plusieurs fois et garder la mediane de chaque mesure'''
+def measure(runs=10):
+    run_probe() # Premier lancement non compté : remplit le cache du système de fichiers et les .pyc
+    samples = [run_probe() for _ in range(runs)]
+    return {metric: round(statistics.median(sample[metric] for sample in samples), 1) for metric in METRICS}
+
+
+'''fonction pour comparer les mesures a une reference (liste des regressions)'''
+def compare(results, baseline, max_regression):
+    regressions = []
+    for metric in METRICS:
+        reference = baseline.get(metric)
+        if reference and results[metric] > reference * (1 + max_regression):
+            regressions.append(f"{metric} : {results[metric]} ms (référence {reference} ms)")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Temps d'import et de première requête de app.py")
+    parser.add_argument("--runs", type=int, default=10, help="nombre de processus mesurés")
+    parser.add_argument("--save", help="fichier JSON où enregistrer les résultats")
+    parser.add_argument("--baseline", help="fichier JSON de référence (résultat d'un --save précédent)")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="écart toléré par rapport à la référence (0.2 = 20 %%)")
+    args = parser.parse_args(argv)
+
+    results = measure(args.runs)
+    for metric in METRICS:
+        print(f"{metric:<18} {results[metric]:>8.1f}")
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.max_regression)
+        for regression in regressions:
+            print(f"Régression : {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,102 @@
+import datetime
+import gzip
+import hashlib
+import os
+import time
+import zlib
+from functools import wraps
+from flask import Response, current_app, request, session
+from database import get_data_versions
+
+'''--------------------Requêtes conditionnelles (ETag) et compression gzip--------------------'''
+
+GZIP_MIN_SIZE = 1024 # En dessous, la compression ne fait rien gagner
+GZIP_LEVEL = 6
+
+_templates_signature = None
+
+
+'''fonction pour calculer la signature des templates (une page change si son template change)'''
+# refresh=True la recalcule (rechargement du serveur, voir serveur.py)
+def templates_signature(refresh=False):
+    global _templates_signature
+    if _templates_signature is None or refresh:
+        folder = os.path.join(current_app.root_path, current_app.template_folder)
+        entries = sorted((name, os.path.getmtime(os.path.join(folder, name))) for name in os.listdir(folder))
+        _templates_signature = hashlib.sha1(repr(entries).encode()).hexdigest()
+    return _templates_signature
+
+
+'''decorateur pour repondre 304 Not Modified sans executer la vue si les tables n'ont pas change'''
+# L'ETag est calculé à partir des versions des tables lues par la page (voir data_versions),
+# de l'URL, de l'utilisateur et des templates : aucune requête sur les données, aucun rendu.
+def conditional(*tables):
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if '_flashes' in session:
+                # Un message en attente doit être affiché : la page est différente
+                return func(*args, **kwargs)
+
+            versions = get_data_versions(tables)
+            user = (session.get('user') or {}).get('username')
+            key = repr((request.full_path, user, templates_signature(), sorted(versions.items())))
+            etag = hashlib.sha1(key.encode()).hexdigest()[:32]
+            last_modified = datetime.datetime.fromtimestamp(max(updated for _, updated in versions.values()),
+                                                            datetime.timezone.utc)
+
+            # Une même page compressée a son propre ETag (voir gzip_response)
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains(etag) or request.if_none_match.contains(etag + "-gz")
+            else:
+                # Précision d'une seconde : une écriture dans la seconde en cours n'est pas encore datable
+                not_modified = (request.if_modified_since is not None and last_modified <= request.if_modified_since
+                                and last_modified.timestamp() < int(time.time()))
+            if not_modified:
+                response = Response(status=304)
+            else:
+                response = current_app.make_response(func(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            response.last_modified = last_modified
+            response.headers['Cache-Control'] = 'private, no-cache' # Revalidation à chaque affichage
+            response.vary.add('Cookie')
+            response.vary.add('Accept-Encoding')
+            return response
+        return wrapper
+    return decorator
+
+
+'''fonction pour compresser les morceaux d'une reponse en flux'''
+def _gzip_chunks(chunks):
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31) # wbits=31 : en-tête gzip
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8") if isinstance(chunk, str) else chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+'''fonction (after_request) pour compresser les pages HTML si le client accepte gzip'''
+def gzip_response(response):
+    if (response.mimetype != 'text/html' or response.status_code != 200
+            or 'Content-Encoding' in response.headers or response.direct_passthrough):
+        return response
+    response.vary.add('Accept-Encoding')
+    if 'gzip' not in request.accept_encodings:
+        return response
+
+    if response.is_streamed:
+        response.response = _gzip_chunks(response.response)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < GZIP_MIN_SIZE:
+            return response
+        response.set_data(gzip.compress(data, GZIP_LEVEL, mtime=0)) # mtime=0 : même page, mêmes octets
+    response.headers['Content-Encoding'] = 'gzip'
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(etag + "-gz", weak)
+    return response
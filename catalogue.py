@@ -0,0 +1,136 @@
+import os
+import threading
+import time
+import numpy as np
+from database import get_read_connection, get_data_versions
+
+'''--------------------Catalogue des produits en colonnes (NumPy)--------------------'''
+
+# Copie en lecture seule des colonnes numériques de la table produits : un tableau
+# NumPy par colonne et l'ID de la catégorie comme code du type, soit environ 25 octets
+# par produit. Les statistiques sont calculées sur les tableaux, sans objet Python par
+# ligne. La copie n'est relue que lorsque la version de la table produits ou celle de la
+# table categories (noms des types) change, par un thread de fond : en attendant, les
+# requêtes utilisent la copie précédente.
+
+FETCH_SIZE = 50000 # Nombre de lignes lues par fetchmany lors du chargement
+RELOAD_INTERVAL = 5.0 # Secondes minimales entre deux rechargements
+VERSION_TABLES = ("produits", "categories") # Tables dont la version identifie la copie
+
+_snapshot = None
+_loaded_at = 0.0
+_reload_pid = None # Processus dont le thread recharge la copie (None : aucun rechargement en cours)
+_lock = threading.Lock()
+
+
+'''classe d'une copie en colonnes du catalogue, aux versions donnees des tables produits et categories'''
+class CatalogueSnapshot:
+    __slots__ = ("version", "ids", "prix", "stock", "type_codes", "types", "_summary")
+
+    def __init__(self, version, ids, prix, stock, type_codes, types):
+        self.version = version
+        self.ids = ids
+        self.prix = prix
+        self.stock = stock
+        self.type_codes = type_codes
+        self.types = types # Nom du type pour chaque code (ID de catégorie), None si l'ID n'existe pas
+        self._summary = None
+        for array in (ids, prix, stock, type_codes):
+            array.flags.writeable = False # Partagée entre les threads : lecture seule
+
+    '''methode pour charger les tables produits et categories (versions et lignes lues dans la meme transaction)'''
+    @staticmethod
+    def load():
+        connection = get_read_connection()
+        ids, prix, stock, type_codes = [], [], [], []
+        connection.execute("BEGIN")
+        try:
+            cursor = connection.cursor()
+            cursor.execute("SELECT table_name, version FROM data_versions WHERE table_name IN (?, ?)", VERSION_TABLES)
+            versions = dict(cursor.fetchall())
+            version = tuple(versions.get(table, 0) for table in VERSION_TABLES)
+            cursor.execute("SELECT id, nom FROM categories")
+            names = dict(cursor.fetchall())
+            types = [names.get(code) for code in range(max(names, default=0) + 1)]
+            cursor.execute("SELECT id, prix, stock, categorie_id FROM produits ORDER BY id")
+            while True:
+                rows = cursor.fetchmany(FETCH_SIZE)
+                if not rows:
+                    break
+                columns = list(zip(*rows))
+                ids.append(np.array(columns[0], dtype=np.int64))
+                prix.append(np.array(columns[1], dtype=np.float64))
+                stock.append(np.array(columns[2], dtype=np.int64))
+                type_codes.append(np.array(columns[3], dtype=np.int16))
+        finally:
+            connection.rollback()
+        concat = lambda arrays, dtype: np.concatenate(arrays) if arrays else np.empty(0, dtype=dtype)
+        return CatalogueSnapshot(version, concat(ids, np.int64), concat(prix, np.float64),
+                                 concat(stock, np.int64), concat(type_codes, np.int16), tuple(types))
+
+    '''methode pour recuperer la valeur totale du stock'''
+    def stock_value(self):
+        return round(float(np.dot(self.prix, self.stock)), 2)
+
+    '''methode pour recuperer le resume par type affiche avec les graphiques'''
+    def summary_by_type(self):
+        # La copie ne change pas : le résumé est calculé une fois
+        if self._summary is None:
+            self._summary = self._compute_summary()
+        return self._summary
+
+    def _compute_summary(self):
+        nb = np.bincount(self.type_codes, minlength=len(self.types))
+        stock = np.bincount(self.type_codes, weights=self.stock, minlength=len(self.types))
+        value = np.bincount(self.type_codes, weights=self.prix * self.stock, minlength=len(self.types))
+        return [
+            {"type_produit": name, "nb": int(nb[code]), "stock": int(stock[code]), "valeur": round(float(value[code]), 2)}
+            for code, name in enumerate(self.types) if nb[code]
+        ]
+
+
+'''fonction pour recuperer la copie du catalogue, rechargee en arriere-plan si les produits ou les categories ont change'''
+# Chaque commande change la version (stock) : la requête ne recharge jamais elle-même la
+# copie, sauf au premier appel du processus. Elle rend la copie précédente et démarre au
+# besoin un thread de rechargement, au plus un à la fois et un toutes les RELOAD_INTERVAL s.
+def get_catalogue():
+    global _snapshot, _loaded_at
+    versions = get_data_versions(VERSION_TABLES)
+    version = tuple(versions[table][0] for table in VERSION_TABLES)
+    snapshot = _snapshot
+    if snapshot is not None and snapshot.version == version:
+        return snapshot
+    if snapshot is None:
+        with _lock:
+            if _snapshot is None:
+                _snapshot, _loaded_at = CatalogueSnapshot.load(), time.monotonic()
+            return _snapshot
+    _start_reload()
+    return snapshot
+
+
+'''fonction pour demarrer le thread de rechargement, s'il n'y en a pas deja un dans ce processus'''
+def _start_reload():
+    global _reload_pid
+    with _lock:
+        # Après un fork, le thread du parent n'existe pas dans l'enfant : on compare le pid
+        if _reload_pid == os.getpid() or time.monotonic() - _loaded_at < RELOAD_INTERVAL:
+            return
+        _reload_pid = os.getpid()
+    threading.Thread(target=_reload, name="catalogue", daemon=True).start()
+
+
+'''fonction executee par le thread de rechargement'''
+def _reload():
+    global _snapshot, _loaded_at, _reload_pid
+    try:
+        snapshot = CatalogueSnapshot.load()
+    except Exception as e:
+        snapshot = None
+        print(f"Erreur lors du rechargement du catalogue : {e}")
+    finally:
+        with _lock:
+            if snapshot is not None:
+                _snapshot = snapshot
+            _loaded_at = time.monotonic()
+            _reload_pid = None
@@ -0,0 +1,313 @@
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from urllib.request import pathname2url
+
+'''--------------------Gestion des connexions SQLite--------------------'''
+
+# Chemin de la base de données, configurable par variable d'environnement
+DATABASE_PATH = os.environ.get("APP_DATABASE", "app_database.db")
+
+# Réglages appliqués à chaque nouvelle connexion
+PRAGMAS = {
+    "journal_mode": "WAL",       # les lecteurs ne bloquent plus l'écrivain
+    "synchronous": "NORMAL",     # suffisant en WAL, évite un fsync par commit
+    "busy_timeout": 5000,        # attend le verrou (ms) au lieu d'échouer tout de suite
+    "cache_size": -20000,        # cache de pages d'environ 20 Mo
+    "mmap_size": 268435456,      # lecture des pages par mmap (256 Mo)
+    "temp_store": "MEMORY",
+    "foreign_keys": "ON",        # les REFERENCES du schéma sont appliquées
+}
+
+# Connexions de lecture (rapports, graphiques, exports) : fichier ouvert en lecture seule
+# (mode=ro) et query_only, pour qu'un rapport ne puisse jamais prendre le verrou d'écriture
+READ_PRAGMAS = {
+    "busy_timeout": 5000,
+    "cache_size": -20000,
+    "mmap_size": 268435456,
+    "temp_store": "MEMORY",      # tris et GROUP BY des rapports en mémoire
+    "query_only": "ON",
+}
+
+# Copie de la base pour les rapports lourds (voir backup_database), facultative : sans
+# elle, les rapports lisent la base principale en lecture seule
+ANALYTICS_DATABASE = os.environ.get("APP_ANALYTICS_DATABASE")
+BACKUP_PAGES = 256      # Pages copiées par étape (1 Mo avec des pages de 4 Ko)
+BACKUP_SLEEP = 0.005    # Pause entre deux étapes (secondes)
+BACKUP_RESTARTS = 5     # Copie reprise du début au plus 5 fois avant de se faire en une passe
+
+_local = threading.local()
+_generation = 0  # incrémenté par configure() pour invalider les connexions ouvertes
+
+# Observateurs (voir metriques.py) : connection_hooks(connection) à chaque connexion
+# ouverte, statement_hooks(sql) à chaque instruction exécutée
+connection_hooks = []
+statement_hooks = []
+
+
+'''fonction pour changer le chemin de la base de données'''
+def configure(path):
+    global DATABASE_PATH, _generation
+    DATABASE_PATH = path
+    _generation += 1
+    close_connection()
+
+
+'''fonction pour ouvrir une connexion réglée'''
+def _open_connection(path):
+    connection = sqlite3.connect(path, timeout=PRAGMAS["busy_timeout"] / 1000, factory=ObservedConnection)
+    for name, value in PRAGMAS.items():
+        connection.execute(f"PRAGMA {name} = {value}")
+    for hook in connection_hooks:
+        hook(connection)
+    return connection
+
+
+'''fonction pour ouvrir une connexion en lecture seule'''
+def _open_read_connection(path):
+    uri = f"file:{pathname2url(os.path.abspath(path))}?mode=ro"
+    # isolation_level=None : pas de BEGIN implicite, les transactions de lecture sont explicites
+    connection = sqlite3.connect(uri, uri=True, timeout=READ_PRAGMAS["busy_timeout"] / 1000,
+                                 factory=ObservedConnection, isolation_level=None)
+    for name, value in READ_PRAGMAS.items():
+        connection.execute(f"PRAGMA {name} = {value}")
+    for hook in connection_hooks:
+        hook(connection)
+    return connection
+
+
+'''classe de curseur qui signale chaque instruction aux statement_hooks'''
+# Un executemany compte pour une instruction. set_trace_callback compterait aussi les
+# triggers, mais développe chaque requête et ralentit l'import en masse de 40 %.
+class ObservedCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        for hook in statement_hooks:
+            hook(sql)
+        return super().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        for hook in statement_hooks:
+            hook(sql)
+        return super().executemany(sql, seq_of_parameters)
+
+
+'''classe de connexion dont les curseurs sont observes (connection.execute compris)'''
+class ObservedConnection(sqlite3.Connection):
+    def cursor(self, factory=ObservedCursor):
+        return super().cursor(factory)
+
+
+'''fonction pour recuperer la connexion du thread courant'''
+# La connexion est ouverte une seule fois par thread (et par processus, pour rester
+# sûre après un fork) puis réutilisée d'une requête à l'autre. Elle s'utilise comme
+# sqlite3.connect() : "with get_connection() as connection:" valide ou annule la
+# transaction, sans fermer la connexion.
+def get_connection():
+    connection = getattr(_local, "connection", None)
+    if connection is not None and _local.key == (os.getpid(), _generation):
+        return connection
+    connection = _open_connection(DATABASE_PATH)
+    _local.connection = connection
+    _local.key = (os.getpid(), _generation)
+    return connection
+
+
+'''fonction pour recuperer la connexion de lecture du thread courant'''
+# analytics=True : la copie ANALYTICS_DATABASE si elle existe, rouverte quand elle est
+# remplacée par une copie plus récente ; sinon la base principale. Sans transaction
+# ouverte, chaque instruction lit l'état courant : voir read_snapshot.
+def get_read_connection(analytics=False):
+    path = DATABASE_PATH
+    file_id = None
+    if analytics and ANALYTICS_DATABASE:
+        try:
+            stat = os.stat(ANALYTICS_DATABASE)
+            path, file_id = ANALYTICS_DATABASE, (stat.st_ino, stat.st_mtime_ns)
+        except FileNotFoundError:
+            pass # Pas encore de copie
+    attribute = "analytics_connection" if analytics else "read_connection"
+    key = (os.getpid(), _generation, path, file_id)
+    entry = getattr(_local, attribute, None)
+    if entry is not None and entry[1] == key:
+        return entry[0]
+    if entry is not None and entry[1][0] == os.getpid():
+        entry[0].close()
+    connection = _open_read_connection(path)
+    setattr(_local, attribute, (connection, key))
+    return connection
+
+
+'''fonction pour lire dans un instantane coherent : "with read_snapshot() as cursor:"'''
+# Toutes les requêtes du bloc voient la base au même instant (transaction de lecture
+# WAL) : les écritures continuent pendant ce temps sans attendre ni être vues. Le bloc
+# ne doit pas durer trop longtemps : le checkpoint ne recycle pas le WAL qu'il lit.
+@contextmanager
+def read_snapshot(analytics=False):
+    connection = get_read_connection(analytics)
+    if connection.in_transaction:
+        # Instantané déjà ouvert plus haut dans la pile
+        yield connection.cursor()
+        return
+    connection.execute("BEGIN")
+    try:
+        yield connection.cursor()
+    finally:
+        connection.rollback() # Lecture seule : rien à valider, l'instantané est libéré
+
+
+'''fonction pour fermer les connexions du thread courant'''
+def close_connection():
+    connection = getattr(_local, "connection", None)
+    if connection is not None:
+        # Une connexion héritée d'un fork ne doit pas être fermée par l'enfant
+        if _local.key[0] == os.getpid():
+            connection.close()
+        _local.connection = None
+    for attribute in ("read_connection", "analytics_connection"):
+        entry = getattr(_local, attribute, None)
+        if entry is not None:
+            if entry[1][0] == os.getpid():
+                entry[0].close()
+            setattr(_local, attribute, None)
+
+
+'''fonction pour executer func(cursor) dans une transaction BEGIN IMMEDIATE'''
+# Le verrou d'écriture est pris dès le début : les vérifications faites dans func
+# restent vraies jusqu'au commit. En cas de SQLITE_BUSY, la transaction est annulée
+# puis rejouée avec un délai croissant.
+def run_in_transaction(func, retries=5):
+    connection = get_connection()
+    for attempt in range(retries + 1):
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            result = func(connection.cursor())
+            connection.commit()
+            return result
+        except sqlite3.OperationalError as e:
+            if connection.in_transaction:
+                connection.rollback()
+            if "locked" not in str(e) and "busy" not in str(e):
+                raise
+            if attempt == retries:
+                raise
+            time.sleep(0.05 * 2 ** attempt)
+        except BaseException:
+            if connection.in_transaction:
+                connection.rollback()
+            raise
+
+
+'''--------------------Copie en ligne de la base (API de sauvegarde)--------------------'''
+
+'''fonction pour copier la base dans target sans bloquer les ecritures (duree en secondes)'''
+# La copie se fait par étapes de BACKUP_PAGES pages avec une pause entre elles : chaque
+# étape ne garde qu'un court instant de lecture. Si la base est modifiée entre deux
+# étapes, SQLite reprend la copie du début ; après BACKUP_RESTARTS reprises, elle est
+# faite en une passe (une seule transaction de lecture, qui en WAL ne bloque pas les
+# écritures). La copie est écrite à côté puis renommée : ses lecteurs ne voient jamais
+# un fichier à moitié copié.
+def backup_database(target, pages=BACKUP_PAGES, sleep=BACKUP_SLEEP):
+    start = time.perf_counter()
+    tmp_path = f"{target}.{os.getpid()}.tmp"
+    restarts = 0
+    last_remaining = None
+
+    def progress(status, remaining, total):
+        nonlocal restarts, last_remaining
+        if last_remaining is not None and remaining > last_remaining:
+            restarts += 1
+            if restarts > BACKUP_RESTARTS:
+                raise InterruptedError("copie reprise trop souvent")
+        last_remaining = remaining
+
+    source = _open_read_connection(DATABASE_PATH)
+    try:
+        destination = sqlite3.connect(tmp_path)
+        try:
+            try:
+                source.backup(destination, pages=pages, progress=progress, sleep=sleep)
+            except InterruptedError:
+                source.backup(destination, pages=-1)
+            # Copie autonome : pas de fichiers -wal/-shm à côté d'elle
+            destination.execute("PRAGMA journal_mode = DELETE")
+        finally:
+            destination.close()
+        os.replace(tmp_path, target)
+    finally:
+        source.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return time.perf_counter() - start
+
+
+'''--------------------Compteurs de versions des tables--------------------'''
+
+# Date de la dernière écriture, en secondes (précision de l'en-tête Last-Modified)
+NOW = "CAST(strftime('%s', 'now') AS INTEGER)"
+
+'''fonction pour creer le compteur de versions d'une table, incremente par triggers'''
+def create_version_tracking(cursor, table):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS data_versions (
+            table_name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0,
+            updated_at INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    cursor.execute(f"INSERT OR IGNORE INTO data_versions (table_name, version, updated_at) VALUES (?, 0, {NOW})",
+                   (table,))
+    create_bulk_mode(cursor)
+    # Les triggers couvrent toutes les écritures, y compris celles d'autres processus
+    for event in ("INSERT", "UPDATE", "DELETE"):
+        # En mode import, les insertions sont comptées une fois par lot (voir set_bulk_mode)
+        when = "WHEN NOT (SELECT active FROM bulk_mode)" if event == "INSERT" else ""
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_version_{event.lower()}
+            AFTER {event} ON {table} {when}
+            BEGIN
+                UPDATE data_versions SET version = version + 1, updated_at = {NOW}
+                WHERE table_name = '{table}';
+            END
+        """)
+
+
+'''fonction pour creer l'indicateur du mode import en masse'''
+def create_bulk_mode(cursor):
+    cursor.execute("CREATE TABLE IF NOT EXISTS bulk_mode (active INTEGER NOT NULL)")
+    cursor.execute("INSERT INTO bulk_mode (active) SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM bulk_mode)")
+
+
+'''fonction pour activer ou desactiver le mode import en masse dans la transaction en cours'''
+# Tant qu'il est actif, les triggers AFTER INSERT sont ignorés : l'appelant met lui-même
+# à jour les compteurs une fois par lot. Il doit être désactivé avant le commit ; un
+# rollback le désactive aussi, et les autres connexions ne le voient jamais actif.
+def set_bulk_mode(cursor, active):
+    cursor.execute("UPDATE bulk_mode SET active = ?", (1 if active else 0,))
+
+
+'''fonction pour incrementer la version d'une table dans la transaction en cours'''
+def bump_version(cursor, table):
+    cursor.execute(f"UPDATE data_versions SET version = version + 1, updated_at = {NOW} WHERE table_name = ?",
+                   (table,))
+
+
+'''fonction pour lire la version courante d'une table'''
+def get_data_version(table):
+    with get_connection() as connection:
+        cursor = connection.cursor()
+        cursor.execute("SELECT version FROM data_versions WHERE table_name = ?", (table,))
+        row = cursor.fetchone()
+    return row[0] if row else 0
+
+
+'''fonction pour lire la version et la date de modification de plusieurs tables en une requete'''
+def get_data_versions(tables):
+    placeholders = ", ".join("?" * len(tables))
+    with get_connection() as connection:
+        cursor = connection.cursor()
+        cursor.execute(f"SELECT table_name, version, updated_at FROM data_versions WHERE table_name IN ({placeholders})",
+                       tuple(tables))
+        rows = {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
+    return {table: rows.get(table, (0, 0)) for table in tables}
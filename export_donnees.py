@@ -0,0 +1,100 @@
+import csv
+import io
+import json
+import zlib
+from database import get_read_connection
+
+'''--------------------Export en flux des produits, clients et commandes--------------------'''
+
+FETCH_SIZE = 1000 # Nombre de lignes lues par fetchmany
+
+# Pour chaque table : colonnes exportées et requête
+EXPORTS = {
+    "produits": (("id", "nom", "prix", "description", "stock", "type_produit"), """
+        SELECT p.id, p.nom, p.prix, p.description, p.stock, c.nom
+        FROM produits p
+        JOIN categories c ON c.id = p.categorie_id
+        ORDER BY p.id
+    """),
+    "clients": (("id", "nom", "email", "adresse"), """
+        SELECT id, nom, email, adresse
+        FROM clients
+        ORDER BY id
+    """),
+    # Une ligne exportée par ligne de commande (l'id de la commande se répète)
+    "commandes": (("id", "date", "client_id", "client", "produit_id", "produit", "quantite", "prix_unitaire"), """
+        SELECT c.id, datetime(c.created_at, 'unixepoch'), c.client_id, cl.nom, l.produit_id, p.nom, l.quantite,
+               l.prix_unitaire
+        FROM commandes c
+        JOIN clients cl ON c.client_id = cl.id
+        JOIN lignes_commande l ON l.commande_id = c.id
+        JOIN produits p ON l.produit_id = p.id
+        ORDER BY c.id, l.produit_id
+    """),
+}
+
+FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson; charset=utf-8",
+}
+
+
+'''fonction pour parcourir une table par lots de lignes (memoire constante)'''
+# progress(n) est appelée après chaque lot de n lignes (tâche d'export, voir taches.py)
+def iter_batches(entity, fetch_size=FETCH_SIZE, progress=None):
+    query = EXPORTS[entity][1]
+    # Une seule requête, donc un seul instantané, sur une connexion en lecture seule
+    cursor = get_read_connection().cursor()
+    try:
+        cursor.execute(query)
+        while True:
+            rows = cursor.fetchmany(fetch_size)
+            if not rows:
+                break
+            yield rows
+            if progress:
+                progress(len(rows))
+    finally:
+        # Libère la lecture même si le client interrompt le téléchargement
+        cursor.close()
+
+
+'''fonction pour produire le CSV par morceaux de texte (un morceau par lot)'''
+def format_csv(columns, batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for rows in batches:
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+'''fonction pour produire le NDJSON par morceaux de texte (un objet JSON par ligne)'''
+def format_ndjson(columns, batches):
+    for rows in batches:
+        yield "".join(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + "\n" for row in rows)
+
+
+'''fonction pour encoder les morceaux en UTF-8, compresses en gzip a la volee si demande'''
+def encode_chunks(chunks, compress=False):
+    if not compress:
+        for chunk in chunks:
+            yield chunk.encode("utf-8")
+        return
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) # wbits=31 : en-tête gzip
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+'''fonction pour exporter une table (generateur d'octets)'''
+def export(entity, fmt, compress=False, fetch_size=FETCH_SIZE, progress=None):
+    columns = EXPORTS[entity][0]
+    formatter = format_csv if fmt == "csv" else format_ndjson
+    return encode_chunks(formatter(columns, iter_batches(entity, fetch_size, progress)), compress)
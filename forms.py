@@ -1,35 +1,40 @@
 from flask_wtf import FlaskForm
-from wtforms import StringField, DecimalField, TextAreaField, IntegerField, SubmitField, SelectField, EmailField
-from wtforms.validators import DataRequired, Length, NumberRange, Email, ValidationError
-from gestion_produit import Client, Produit
+from wtforms import Form, StringField, DecimalField, TextAreaField, IntegerField, SubmitField, SelectField, EmailField
+from wtforms import FieldList, FormField, HiddenField
+from wtforms.validators import DataRequired, Length, NumberRange, Email
+from gestion_produit import MAX_LIGNES_COMMANDE, Categorie
 
 
+# Règles partagées avec l'import en masse (import_donnees.py)
+NOM_PRODUIT_MAX = 50
+DESCRIPTION_MAX = 200
+
 #-------------class add form produit------------
 class AddProductForm(FlaskForm):
-    nom = StringField('Nom du produit', validators=[DataRequired(), Length(max=50)])  
+    nom = StringField('Nom du produit', validators=[DataRequired(), Length(max=NOM_PRODUIT_MAX)])  
     # Champ pour saisir le prix avec validation numérique et précision de 2 décimales
     prix = DecimalField('Prix', validators=[DataRequired(), NumberRange(min=0)], places=2)  
     # Champ pour une description avec validation de longueur maximale
-    description = TextAreaField('Description', validators=[Length(max=200)])  
+    description = TextAreaField('Description', validators=[Length(max=DESCRIPTION_MAX)])  
     # Champ pour le stock avec une validation pour garantir un nombre entier positif
     stock = IntegerField('Stock', validators=[DataRequired(), NumberRange(min=0)])  
-    # Liste déroulante pour sélectionner un type de produit, avec des choix prédéfinis
-    type_produit = SelectField('Type de produit', choices=[
-        ('Fruits et légumes', 'Fruits et légumes'),
-        ('Produits laitiers', 'Produits laitiers'),
-        ('Viandes et protéines', 'Viandes et protéines'),
-        ('Produits de boulangerie', 'Produits de boulangerie'),
-        ('Céréales et grains', 'Céréales et grains'),
-        ('Conserves et produits secs', 'Conserves et produits secs'),
-        ('Condiments et épices', 'Condiments et épices'),
-        ('Boissons', 'Boissons'),
-        ('Produits surgelés', 'Produits surgelés'),
-        ('Snacks et confiseries', 'Snacks et confiseries'),
-        ('Produits non alimentaires', 'Produits non alimentaires')
-    ], validators=[DataRequired()])  # Validation pour s'assurer qu'une option est sélectionnée
+    # Liste déroulante pour sélectionner un type de produit (ID de la catégorie)
+    categorie_id = SelectField('Type de produit', coerce=int,
+                               validators=[DataRequired()])  # Validation pour s'assurer qu'une option est sélectionnée
     # Bouton de soumission pour le formulaire
     submit = SubmitField('Effectuer')
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Choix lus à chaque formulaire dans la liste des catégories en cache
+        self.categorie_id.choices = list(Categorie.get_categories())
+
+#-------------class edit form produit------------
+class EditProductForm(AddProductForm):
+    # Stock affiché à l'ouverture du formulaire : seul l'écart saisi est appliqué au stock,
+    # les commandes passées entre-temps restent décomptées
+    stock_initial = HiddenField()
+
 #-------------class add form client------------
 class AddClientForm(FlaskForm):
     # Champ pour le nom du client, obligatoire
@@ -52,25 +57,20 @@ class EditClientForm(FlaskForm):
     # Bouton de soumission pour enregistrer les modifications
     submit = SubmitField('Modifier')
 
+#-------------ligne de commande------------
+# Sous-formulaire sans jeton CSRF : il est protégé par celui du formulaire de commande
+class LigneCommandeForm(Form):
+    # ID du produit choisi par autocomplétion (champ caché rempli par autocomplete.js)
+    produit_id = IntegerField('Produit', validators=[DataRequired(message="Choisissez un produit dans la liste.")])
+    # Champ pour indiquer la quantité de produit commandée, avec validation pour être un entier >= 1
+    quantite = IntegerField('Quantité', validators=[DataRequired(), NumberRange(min=1)])
+
 #-------------class add form commande------------
 class AddOrderForm(FlaskForm):
-    # Liste déroulante pour sélectionner un client par ID (converti en entier)
-    client_id = SelectField('Client', coerce=int, validators=[DataRequired()])  
-    # Liste déroulante pour sélectionner un produit par ID (converti en entier)
-    produit_id = SelectField('Produit', coerce=int, validators=[DataRequired()])  
-    # Champ pour indiquer la quantité de produit commandée, avec validation pour être un entier >= 1
-    quantite = IntegerField('Quantité', validators=[DataRequired(), NumberRange(min=1)])  
+    # ID du client choisi par autocomplétion (champ caché rempli par autocomplete.js)
+    client_id = IntegerField('Client', validators=[DataRequired(message="Choisissez un client dans la liste.")])
+    # Panier : une ligne par produit (lignes-0-produit_id, lignes-0-quantite, ...)
+    lignes = FieldList(FormField(LigneCommandeForm), min_entries=1, max_entries=MAX_LIGNES_COMMANDE)
     # Bouton de soumission pour valider la commande
     submit = SubmitField('Effectuer')
-
-    def validate_client_id(self, field):
-        # Méthode pour valider que l'ID du client existe dans la base de données
-        client = Client()  # Instanciation de la classe `Client`
-        if not client.exists(field.data):  # Vérifie si le client avec l'ID donné n'existe pas
-            raise ValidationError("Le client sélectionné n'existe pas.")  # Lève une erreur si le client est introuvable
-
-    def validate_produit_id(self, field):
-        # Méthode pour valider que l'ID du produit existe dans la base de données
-        produit = Produit()  # Instanciation de la classe `Produit`
-        if not produit.exists(field.data):  # Vérifie si le produit avec l'ID donné n'existe pas
-            raise ValidationError('Le produit sélectionné n\'existe pas.')  # Lève une erreur si le produit est introuvable
\ No newline at end of file
+    # Seuls les ID envoyés sont vérifiés, par Commande, dans la transaction qui passe la commande
@@ -1,37 +1,311 @@
 import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from collections import Counter
+from database import get_connection, run_in_transaction, read_snapshot, get_data_version, get_data_versions, NOW
+
+
+'''--------------------Cache des enregistrements--------------------'''
+
+SYNC_INTERVAL = 1.0 # Secondes entre deux lectures de data_versions par un cache
+
+# Chaque processus (worker de flask --app app serve, flask --app app jobs...) a son propre
+# cache : les écritures des autres processus ne le vident pas. sync() compare les versions
+# des tables (data_versions, tenues par les triggers) à celles connues du cache et le vide
+# si l'une d'elles a changé, comme Categorie._load. Pour qu'un accès au cache ne coûte pas
+# de requête, les versions ne sont relues qu'une fois par SYNC_INTERVAL : une écriture d'un
+# autre processus est vue au plus tard une seconde après. Les écritures de ce processus
+# retirent tout de suite leur ligne (invalidate).
+class EntityCache:
+    def __init__(self, tables, maxsize=1024):
+        self.tables = tuple(tables)
+        self.maxsize = maxsize
+        self.version = None
+        self._synced_at = None
+        self._rows = OrderedDict()
+        self._lock = threading.Lock()
+
+    '''methode pour vider le cache si une des tables a change (au plus une lecture par SYNC_INTERVAL)'''
+    def sync(self):
+        now = time.monotonic()
+        if self._synced_at is not None and now - self._synced_at < SYNC_INTERVAL:
+            return self.version
+        versions = get_data_versions(self.tables)
+        version = tuple(versions[table][0] for table in self.tables)
+        with self._lock:
+            if version != self.version:
+                self._rows.clear()
+                self.version = version
+            self._synced_at = now
+        return version
+
+    '''methode pour recuperer une ligne en cache (None si absente)'''
+    def get(self, key):
+        with self._lock:
+            row = self._rows.get(key)
+            if row is not None:
+                self._rows.move_to_end(key)
+            return row
+
+    '''methode pour mettre en cache une ligne lue apres sync() en evincant la plus ancienne'''
+    def put(self, key, row, version):
+        with self._lock:
+            # La table a changé depuis la lecture : la ligne est peut-être déjà périmée
+            if version != self.version:
+                return
+            self._rows[key] = row
+            self._rows.move_to_end(key)
+            while len(self._rows) > self.maxsize:
+                self._rows.popitem(last=False)
+
+    '''methode pour retirer une ligne du cache'''
+    def invalidate(self, key):
+        with self._lock:
+            self._rows.pop(key, None)
+
+    '''methode pour vider le cache'''
+    def clear(self):
+        with self._lock:
+            self._rows.clear()
+
+
+'''fonction pour chercher les lignes dont le nom commence par un prefixe (ordre nom, id)'''
+# Le filtre est un intervalle sur nom COLLATE NOCASE : l'index idx_<table>_nom sert à la
+# fois au filtre et au tri, sans parcourir la table. after = (nom, id) de la dernière
+# ligne de la page précédente ; retourne (lignes, curseur de la page suivante ou None).
+def search_by_prefix(table, columns, prefix, limit=20, after=None):
+    sql = f"""
+        SELECT id, nom, {columns}
+        FROM {table}
+        WHERE nom COLLATE NOCASE >= ? AND nom COLLATE NOCASE < ?
+    """
+    # U+10FFFF est le plus grand caractère : toutes les suites du préfixe sont avant
+    params = [prefix, prefix + "\U0010ffff"]
+    if after:
+        # La borne basse de l'intervalle avance aussi : la page suivante reprend dans l'index
+        params[0] = after[0]
+        sql += " AND (nom COLLATE NOCASE, id) > (?, ?)"
+        params += [after[0], after[1]]
+    sql += " ORDER BY nom COLLATE NOCASE, id LIMIT ?"
+    params.append(limit + 1)
+    with get_connection() as connection:
+        cursor = connection.cursor()
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    next_cursor = (rows[limit - 1][1], rows[limit - 1][0]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+'''fonction pour recuperer plusieurs lignes par ID, en passant par le cache'''
+def fetch_many(cache, query, ids, chunk_size=500):
+    version = cache.sync()
+    rows = {}
+    missing = []
+    for key in dict.fromkeys(ids):
+        row = cache.get(key)
+        if row is None:
+            missing.append(key)
+        else:
+            rows[key] = row
+    with get_connection() as connection:
+        cursor = connection.cursor()
+        # SQLite limite le nombre de paramètres par requête
+        for start in range(0, len(missing), chunk_size):
+            chunk = missing[start:start + chunk_size]
+            placeholders = ", ".join("?" * len(chunk))
+            cursor.execute(query.format(placeholders=placeholders), chunk)
+            for row in cursor.fetchall():
+                cache.put(row[0], row, version)
+                rows[row[0]] = row
+    return rows
+
+'''--------------------Class Categorie--------------------'''
+
+# Liste des types de produit (table categories), lue une fois puis gardée en mémoire
+# jusqu'au prochain changement de la table (compteur data_versions) : formulaires,
+# filtres, import et affichage lisent tous cette même liste.
+class Categorie:
+    _cache = None # (version, ((id, nom), ...), {id: nom}, {nom: id})
+    _lock = threading.Lock()
+
+    '''methode pour recuperer la liste en cache, relue si la table categories a change'''
+    @staticmethod
+    def _load():
+        version = get_data_version("categories")
+        cache = Categorie._cache
+        if cache is not None and cache[0] == version:
+            return cache
+        with Categorie._lock:
+            if Categorie._cache is None or Categorie._cache[0] != version:
+                with get_connection() as connection:
+                    cursor = connection.cursor()
+                    cursor.execute("SELECT id, nom FROM categories ORDER BY id")
+                    rows = tuple(cursor.fetchall())
+                Categorie._cache = (version, rows, dict(rows), {nom: id for id, nom in rows})
+            return Categorie._cache
+
+    '''methode pour recuperer toutes les categories (id, nom), dans l'ordre des id'''
+    @staticmethod
+    def get_categories():
+        return Categorie._load()[1]
+
+    '''methode pour recuperer le dictionnaire id -> nom des categories'''
+    @staticmethod
+    def names_by_id():
+        return Categorie._load()[2]
+
+    '''methode pour recuperer le dictionnaire nom -> id des categories'''
+    @staticmethod
+    def ids_by_name():
+        return Categorie._load()[3]
+
+    '''methode pour recuperer le nom d'une categorie (None si inconnue)'''
+    # Appelée pour chaque produit affiché : la version n'est pas relue, la liste est
+    # rafraîchie par les méthodes ci-dessus ; un ID absent de la liste la fait relire
+    @staticmethod
+    def get_name(categorie_id):
+        cache = Categorie._cache
+        if cache is None or categorie_id not in cache[2]:
+            cache = Categorie._load()
+        return cache[2].get(categorie_id)
+
 
 '''Class Produit'''
 
+PRICE_BUCKET_WIDTH = 0.25 # Largeur des tranches de l'histogramme des prix (utilisée par les triggers)
+
 class Produit:
-    def __init__(self, nom="", prix=0.0, description="", stock=0, type_produit="", id=None):
+    # Pas de __dict__ par instance : un produit chargé occupe environ deux fois moins de mémoire
+    __slots__ = ("nom", "prix", "description", "stock", "categorie_id", "id")
+    _cache = EntityCache(("produits",))
+
+    def __init__(self, nom="", prix=0.0, description="", stock=0, categorie_id=None, id=None):
         self.nom = nom  
         self.prix = prix  
         self.description = description  
         self.stock = stock  
-        self.type_produit = type_produit  
+        self.categorie_id = categorie_id  
         self.id = id 
 
-    '''methode pour créer la table produit'''
-    def create_table_product(self):
-        try:
-            with sqlite3.connect("app_database.db") as connection:  
-                cursor = connection.cursor() 
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS produits (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        nom TEXT NOT NULL,  
-                        prix REAL NOT NULL,  
-                        description TEXT NOT NULL,  
-                        stock INTEGER NOT NULL,  
-                        type_produit TEXT NOT NULL  
-                    )
-                """)
-        except sqlite3.Error as e:
-            print(f"Erreur lors de la création de la table : {e}")
+    '''methode pour construire un produit a partir d'une ligne (id, nom, prix, description, stock, categorie_id)'''
+    @staticmethod
+    def from_row(row):
+        return Produit(nom=row[1], prix=row[2], description=row[3], stock=row[4], categorie_id=row[5], id=row[0])
+
+    '''propriete : nom de la categorie du produit (liste des categories en cache)'''
+    @property
+    def categorie(self):
+        return Categorie.get_name(self.categorie_id)
+
+    '''methode pour convertir une saisie libre en requete FTS5 (tous les mots, en prefixe)'''
+    @staticmethod
+    def _fts_query(text):
+        words = text.split()
+        # Chaque mot est mis entre guillemets : la saisie ne peut pas injecter de syntaxe FTS5
+        return " ".join('"' + word.replace('"', '""') + '"*' for word in words)
+
+    '''methode pour rechercher des produits par pertinence (page suivante : offset retourne)'''
+    def search(self, text, offset=0, limit=50, categorie_id=None):
+        query = Produit._fts_query(text)
+        if not query:
+            return [], None
+        # Le tri par pertinence porte sur toutes les correspondances : la page suit un offset
+        sql = """
+            SELECT p.id, p.nom, p.prix, p.description, p.stock, p.categorie_id
+            FROM produits_fts
+            JOIN produits p ON p.id = produits_fts.rowid
+            WHERE produits_fts MATCH ?
+        """
+        params = [query]
+        if categorie_id:
+            sql += " AND p.categorie_id = ?"
+            params.append(categorie_id)
+        sql += " ORDER BY produits_fts.rank, p.id LIMIT ? OFFSET ?"
+        params += [limit + 1, offset]
+        with get_connection() as connection:
+            cursor = connection.cursor()
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+        next_cursor = offset + limit if len(rows) > limit else None
+        return [Produit.from_row(row) for row in rows[:limit]], next_cursor
+
+    '''methode pour parcourir tous les resultats d'une recherche par lots'''
+    def iter_search(self, text, offset=0, categorie_id=None, batch_size=500):
+        while offset is not None:
+            produits, offset = self.search(text, offset, batch_size, categorie_id)
+            yield from produits
+
+    '''methode pour mettre a jour statistiques et index apres un lot insere en mode bulk (ids > after_id)'''
+    @staticmethod
+    def after_bulk_insert(cursor, rows, after_id):
+        Produit.add_batch_to_stats(cursor, rows)
+        # Indexer le lot en une requête est bien plus rapide qu'un trigger par ligne
+        cursor.execute("""
+            INSERT INTO produits_fts (rowid, nom, description)
+            SELECT id, nom, description FROM produits WHERE id > ?
+        """, (after_id,))
+
+    '''methode pour ajouter aux statistiques un lot de lignes (nom, prix, description, stock, categorie_id) importees en mode bulk'''
+    @staticmethod
+    def add_batch_to_stats(cursor, rows):
+        categories = Counter(row[4] for row in rows)
+        stocks = Counter(row[3] for row in rows)
+        buckets = Counter(int(row[1] / PRICE_BUCKET_WIDTH) for row in rows)
+        cursor.executemany("""
+            INSERT INTO stats_categories VALUES (?, ?)
+                ON CONFLICT(categorie_id) DO UPDATE SET nb = nb + excluded.nb
+        """, categories.items())
+        cursor.executemany("""
+            INSERT INTO stats_stocks VALUES (?, ?)
+                ON CONFLICT(stock) DO UPDATE SET nb = nb + excluded.nb
+        """, stocks.items())
+        cursor.executemany("""
+            INSERT INTO stats_prix VALUES (?, ?)
+                ON CONFLICT(bucket) DO UPDATE SET nb = nb + excluded.nb
+        """, buckets.items())
+
+    '''methode pour recalculer entierement les statistiques (initialisation ou reparation)'''
+    def rebuild_stats(self):
+        with get_connection() as connection:
+            connection.executescript(f"""
+                BEGIN;
+                DELETE FROM stats_categories;
+                DELETE FROM stats_stocks;
+                DELETE FROM stats_prix;
+                INSERT INTO stats_categories SELECT categorie_id, COUNT(*) FROM produits GROUP BY categorie_id;
+                INSERT INTO stats_stocks SELECT stock, COUNT(*) FROM produits GROUP BY stock;
+                INSERT INTO stats_prix
+                    SELECT CAST(prix / {PRICE_BUCKET_WIDTH} AS INTEGER), COUNT(*) FROM produits GROUP BY 1;
+                COMMIT;
+            """)
+
+    '''methode pour recuperer le nombre de produits par type'''
+    def count_by_type(self):
+        with read_snapshot() as cursor:
+            cursor.execute("""
+                SELECT c.nom, s.nb
+                FROM stats_categories s
+                JOIN categories c ON c.id = s.categorie_id
+                ORDER BY c.nom
+            """)
+            return cursor.fetchall()
+
+    '''methode pour recuperer les valeurs de stock les plus frequentes'''
+    def stock_frequencies(self, limit=None):
+        with read_snapshot() as cursor:
+            cursor.execute("SELECT stock, nb FROM stats_stocks ORDER BY nb DESC LIMIT ?", (-1 if limit is None else limit,))
+            return cursor.fetchall()
+
+    '''methode pour recuperer l'histogramme des prix (debut de la tranche, nombre de produits)'''
+    def price_histogram(self):
+        with read_snapshot() as cursor:
+            cursor.execute("SELECT bucket, nb FROM stats_prix ORDER BY bucket")
+            return [(bucket * PRICE_BUCKET_WIDTH, nb) for bucket, nb in cursor.fetchall()]
 
     '''methode pour verifier l'existence d'un produit'''
     def exists(self, produit_id):
-        with sqlite3.connect("app_database.db") as connection:
+        with get_connection() as connection:
             cursor = connection.cursor()
             cursor.execute("SELECT 1 FROM produits WHERE id = ?", (produit_id,))
             result = cursor.fetchone() 
@@ -40,99 +314,150 @@ class Produit:
     '''methode pour ajouter un produit'''
     def add_product(self):
         try:
-            with sqlite3.connect("app_database.db") as connection:
+            with get_connection() as connection:
                 cursor = connection.cursor()
                 cursor.execute("""
-                    INSERT INTO produits (nom, prix, description, stock, type_produit)
+                    INSERT INTO produits (nom, prix, description, stock, categorie_id)
                     VALUES (?, ?, ?, ?, ?)
-                """, (self.nom, format(self.prix, ".2f"), self.description, self.stock, self.type_produit))
+                """, (self.nom, format(self.prix, ".2f"), self.description, self.stock, self.categorie_id))
                 self.id = cursor.lastrowid 
                 connection.commit()
+            Produit._cache.invalidate(self.id)
         except sqlite3.Error as e:
             print(f"Erreur lors de l'ajout du produit : {e}")
 
     '''methode pour recuperer tous les produits'''
     def get_products(self):
         try:
-            with sqlite3.connect("app_database.db") as connection:
+            with get_connection() as connection:
                 cursor = connection.cursor()
                 cursor.execute("SELECT * FROM produits") 
                 produits = cursor.fetchall()
-                return [Produit(nom=row[1], prix=row[2], description=row[3], stock=row[4], type_produit=row[5], id=row[0]) for row in produits]
+                return [Produit.from_row(row) for row in produits]
         except sqlite3.Error as e:
             print(f"Erreur lors de la récupération des produits : {e}")
             return []
 
-    '''methode pour filtrer les produits par type'''
-    def filter_products_by_type(self, type_produit):
-        with sqlite3.connect("app_database.db") as connection:
+    '''methode pour recuperer une page de produits apres l'ID donne (pagination par curseur)'''
+    def get_products_page(self, after_id=0, limit=50, categorie_id=None):
+        with get_connection() as connection:
+            cursor = connection.cursor()
+            if categorie_id:
+                cursor.execute("""
+                    SELECT id, nom, prix, description, stock, categorie_id
+                    FROM produits
+                    WHERE categorie_id = ? AND id > ?
+                    ORDER BY id
+                    LIMIT ?
+                """, (categorie_id, after_id, limit + 1))
+            else:
+                cursor.execute("""
+                    SELECT id, nom, prix, description, stock, categorie_id
+                    FROM produits
+                    WHERE id > ?
+                    ORDER BY id
+                    LIMIT ?
+                """, (after_id, limit + 1))
+            rows = cursor.fetchall()
+        # Une ligne de plus que demandé indique qu'il existe une page suivante
+        next_cursor = rows[limit - 1][0] if len(rows) > limit else None
+        return [Produit.from_row(row) for row in rows[:limit]], next_cursor
+
+    '''methode pour l'autocompletion : produits (id, nom, prix, stock) dont le nom commence par prefix'''
+    def search_by_name(self, prefix, limit=20, after=None):
+        return search_by_prefix("produits", "prix, stock", prefix, limit, after)
+
+    '''methode pour parcourir les produits par lots sans tout charger en memoire'''
+    def iter_products(self, after_id=0, categorie_id=None, batch_size=500):
+        while after_id is not None:
+            produits, after_id = self.get_products_page(after_id, batch_size, categorie_id)
+            yield from produits
+
+    '''methode pour recuperer un produit par son ID'''
+    def get_by_id(self, produit_id):
+        version = Produit._cache.sync()
+        row = Produit._cache.get(produit_id)
+        if row is None:
+            with get_connection() as connection:
+                cursor = connection.cursor()
+                cursor.execute("""
+                    SELECT id, nom, prix, description, stock, categorie_id
+                    FROM produits
+                    WHERE id = ?
+                """, (produit_id,))
+                row = cursor.fetchone()
+            if row is None:
+                return None
+            Produit._cache.put(produit_id, row, version)
+        return Produit.from_row(row)
+
+    '''methode pour recuperer plusieurs produits par ID (dictionnaire id -> Produit)'''
+    def get_many(self, ids):
+        rows = fetch_many(Produit._cache, """
+            SELECT id, nom, prix, description, stock, categorie_id
+            FROM produits
+            WHERE id IN ({placeholders})
+        """, ids)
+        return {key: Produit.from_row(row) for key, row in rows.items()}
+
+    '''methode pour filtrer les produits par type (ID de la categorie)'''
+    def filter_products_by_type(self, categorie_id):
+        with get_connection() as connection:
             cursor = connection.cursor()
             cursor.execute("""
-                SELECT id, nom, prix, type_produit, description, stock
+                SELECT id, nom, prix, description, stock, categorie_id
                 FROM produits
-                WHERE type_produit = ?
-            """, (type_produit,)) 
-            rows = cursor.fetchall()
-            columns = ['id', 'nom', 'prix', 'type_produit', 'description', 'stock']
-            produits = [dict(zip(columns, row)) for row in rows]
-            return produits
+                WHERE categorie_id = ?
+            """, (categorie_id,)) 
+            return [Produit.from_row(row) for row in cursor.fetchall()]
         
     '''methode pour mettre à jour un produit'''
-    def update_product(self, produit_id, nom, prix, description, stock, type_produit):
+    # Le stock n'est pas réécrit : les commandes le décrémentent pendant que le formulaire
+    # est ouvert. variation_stock est ajoutée au stock courant (sans descendre sous 0).
+    def update_product(self, produit_id, nom, prix, description, categorie_id, variation_stock=0):
         try:
-            with sqlite3.connect("app_database.db") as connection: 
+            with get_connection() as connection: 
                 cursor = connection.cursor() 
                 cursor.execute("""
                     UPDATE produits
-                    SET nom = ?, prix = ?, description = ?, stock = ?, type_produit = ?
+                    SET nom = ?, prix = ?, description = ?, stock = MAX(stock + ?, 0), categorie_id = ?
                     WHERE id = ?
-                """, (nom, prix, description, stock, type_produit, produit_id)) 
+                """, (nom, prix, description, variation_stock, categorie_id, produit_id)) 
                 connection.commit() 
                 print(f"Produit avec ID {produit_id} mis à jour.")
+            Produit._cache.invalidate(produit_id)
         except sqlite3.Error as e:
             print(f"Erreur lors de la mise à jour du produit : {e}")
 
     '''methode pour supprimer un produit'''
     def delete_product(self, product_id):
         try:
-            with sqlite3.connect("app_database.db") as connection: 
+            with get_connection() as connection: 
                 cursor = connection.cursor()
                 cursor.execute("DELETE FROM produits WHERE id = ?", (product_id,))
                 connection.commit()
+            Produit._cache.invalidate(product_id)
+        except sqlite3.IntegrityError:
+            # Les clés étrangères sont appliquées : un produit commandé ne peut pas disparaître
+            raise ValueError("Ce produit figure dans des commandes et ne peut pas être supprimé.")
         except sqlite3.Error as e:
             print(f"Erreur lors de la suppression du produit : {e}")
 
-'''Creation de la table produit'''
-produit = Produit()
-produit.create_table_product()
-
 
 '''--------------------Class Client--------------------'''
 
 class Client:
+    _cache = EntityCache(("clients",))
+
     def __init__(self, id=None, nom=None, email=None, adresse=None):
         self.id = id  
         self.nom = nom 
         self.email = email  
         self.adresse = adresse  
 
-    '''methode pour créer la table client'''
-    def create_table_client(self):
-        with sqlite3.connect("app_database.db") as connection:  
-            cursor = connection.cursor() 
-            cursor.execute(""" 
-                CREATE TABLE IF NOT EXISTS clients (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,  
-                    nom TEXT NOT NULL,  
-                    email TEXT NOT NULL, 
-                    adresse TEXT NOT NULL 
-                )
-            """) 
-            connection.commit()
-
     '''methode pour verifier l'existence d'un client'''
     def exists(self, client_id):
-        with sqlite3.connect("app_database.db") as connection: 
+        with get_connection() as connection: 
             cursor = connection.cursor() 
             cursor.execute("SELECT 1 FROM clients WHERE id = ?", (client_id,))
             result = cursor.fetchone()
@@ -141,33 +466,74 @@ class Client:
     '''methode pour ajouter un client'''
     def add_client(self):
         try:
-            with sqlite3.connect("app_database.db") as connection: 
+            with get_connection() as connection: 
                 cursor = connection.cursor() 
                 cursor.execute("""
                     INSERT INTO clients (nom, email, adresse) 
                     VALUES (?, ?, ?)
                 """, (self.nom, self.email, self.adresse))  
+                self.id = cursor.lastrowid
                 connection.commit() 
+            Client._cache.invalidate(self.id)
         except sqlite3.Error as e:
             print(f"Erreur lors de l'ajout du client : {e}")
 
     '''methode pour recuperer tous les clients'''
     def get_clients(self):
-        with sqlite3.connect("app_database.db") as connection: 
+        with get_connection() as connection: 
             cursor = connection.cursor() 
             cursor.execute("SELECT id, nom, email FROM clients")
             return cursor.fetchall() 
 
+    '''methode pour recuperer une page de clients (id, nom, email, adresse) apres l'ID donne'''
+    def get_clients_page(self, after_id=0, limit=50):
+        with get_connection() as connection: 
+            cursor = connection.cursor() 
+            cursor.execute("""
+                SELECT id, nom, email, adresse
+                FROM clients
+                WHERE id > ?
+                ORDER BY id
+                LIMIT ?
+            """, (after_id, limit + 1))
+            rows = cursor.fetchall()
+        next_cursor = rows[limit - 1][0] if len(rows) > limit else None
+        return rows[:limit], next_cursor
+
+    '''methode pour l'autocompletion : clients (id, nom, email) dont le nom commence par prefix'''
+    def search_by_name(self, prefix, limit=20, after=None):
+        return search_by_prefix("clients", "email", prefix, limit, after)
+
+    '''methode pour parcourir les clients par lots sans tout charger en memoire'''
+    def iter_clients(self, after_id=0, batch_size=500):
+        while after_id is not None:
+            clients, after_id = self.get_clients_page(after_id, batch_size)
+            yield from clients
+
     '''methode pour recuperer un client par son ID'''
     def get_client_by_id(self, client_id):
-        with sqlite3.connect("app_database.db") as connection: 
-            cursor = connection.cursor() 
-            cursor.execute("SELECT id, nom, email, adresse FROM clients WHERE id = ?", (client_id,))  
-            return cursor.fetchone() 
+        return self.get_by_id(client_id)
+
+    '''methode pour recuperer un client (id, nom, email, adresse) par son ID, en passant par le cache'''
+    def get_by_id(self, client_id):
+        version = Client._cache.sync()
+        row = Client._cache.get(client_id)
+        if row is None:
+            with get_connection() as connection: 
+                cursor = connection.cursor() 
+                cursor.execute("SELECT id, nom, email, adresse FROM clients WHERE id = ?", (client_id,))  
+                row = cursor.fetchone() 
+            if row is not None:
+                Client._cache.put(client_id, row, version)
+        return row
+
+    '''methode pour recuperer plusieurs clients par ID (dictionnaire id -> ligne)'''
+    def get_many(self, ids):
+        return fetch_many(Client._cache, "SELECT id, nom, email, adresse FROM clients WHERE id IN ({placeholders})", ids)
 
     '''methode pour mettre à jour les informations d'un client'''
     def update_client(self, client_id):
-        with sqlite3.connect("app_database.db") as connection:
+        with get_connection() as connection:
             cursor = connection.cursor() 
             cursor.execute("""
                 UPDATE clients
@@ -175,117 +541,254 @@ class Client:
                 WHERE id = ?
             """, (self.nom, self.email, self.adresse, client_id)) 
             connection.commit()
+        Client._cache.invalidate(client_id)
 
     '''methode pour supprimer un client par son ID'''  
     def delete_client(self, client_id):
         try:
-            with sqlite3.connect("app_database.db") as connection:
+            with get_connection() as connection:
                 cursor = connection.cursor()
                 cursor.execute("DELETE FROM clients WHERE id = ?", (client_id,))
                 connection.commit()
+            Client._cache.invalidate(client_id)
+        except sqlite3.IntegrityError:
+            raise ValueError("Ce client a des commandes et ne peut pas être supprimé.")
         except sqlite3.Error as e:
             print(f"Erreur lors de la suppression du client : {str(e)}") 
 
-'''Creation de la table client'''
-client = Client()
-client.create_table_client()
-
 
 '''--------------------Class Commande--------------------'''
 
+MAX_LIGNES_COMMANDE = 500 # Produits différents par commande (une seule requête IN pour les vérifier)
+
 class Commande:
-    def __init__(self, client_id=0, produit_id=0, quantite=0):
+    _cache = EntityCache(("commandes", "lignes_commande"))
+
+    # Une ligne par commande : produits et quantités regroupés, total au prix d'achat, date
+    _DETAILS_QUERY = """
+        SELECT c.id, cl.nom, GROUP_CONCAT(p.nom, ', '), SUM(l.quantite), ROUND(SUM(l.quantite * l.prix_unitaire), 2),
+               c.created_at
+        FROM commandes c
+        JOIN clients cl ON c.client_id = cl.id
+        JOIN lignes_commande l ON l.commande_id = c.id
+        JOIN produits p ON l.produit_id = p.id
+        {where}
+        GROUP BY c.id
+        ORDER BY c.id
+        {limit}
+    """
+
+    def __init__(self, client_id=0, lignes=()):
         self.client_id = client_id
-        self.produit_id = produit_id
-        self.quantite = quantite
+        self.lignes = list(lignes) # [(produit_id, quantite), ...]
 
-    def create_table_commande(self):
-        with sqlite3.connect("app_database.db") as connection:
-            cursor = connection.cursor()
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS commandes (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    client_id INTEGER NOT NULL,
-                    produit_id INTEGER NOT NULL,
-                    quantite INTEGER NOT NULL,
-                    FOREIGN KEY (client_id) REFERENCES clients (id),
-                    FOREIGN KEY (produit_id) REFERENCES produits (id)
-                )
-            """)
-            connection.commit()
+    '''methode pour verifier l'existence du client dans la transaction en cours'''
+    @staticmethod
+    def _check_client(cursor, client_id):
+        cursor.execute("SELECT 1 FROM clients WHERE id = ?", (client_id,))
+        if cursor.fetchone() is None:
+            raise ValueError("Le client n'existe pas.")
+
+    '''methode pour regrouper les lignes par produit ({produit_id: quantite})'''
+    @staticmethod
+    def _merge_lines(lignes):
+        merged = {}
+        for produit_id, quantite in lignes:
+            if quantite < 1:
+                raise ValueError("La quantité doit être d'au moins 1.")
+            merged[produit_id] = merged.get(produit_id, 0) + quantite
+        if not merged:
+            raise ValueError("La commande doit contenir au moins un produit.")
+        if len(merged) > MAX_LIGNES_COMMANDE:
+            raise ValueError(f"Une commande ne peut pas contenir plus de {MAX_LIGNES_COMMANDE} produits différents.")
+        return merged
+
+    '''methode pour reserver le stock de toutes les lignes dans la transaction en cours (retourne {produit_id: prix})'''
+    @staticmethod
+    def _reserve_lines(cursor, lignes):
+        # Une requête IN vérifie tous les produits, un executemany décrémente les stocks.
+        # Le verrou d'écriture est pris (BEGIN IMMEDIATE) : le stock lu ne peut pas changer.
+        ids = list(lignes)
+        placeholders = ", ".join("?" * len(ids))
+        cursor.execute(f"SELECT id, nom, stock, prix FROM produits WHERE id IN ({placeholders})", ids)
+        produits = {row[0]: row for row in cursor.fetchall()}
+        missing = [produit_id for produit_id in ids if produit_id not in produits]
+        if missing:
+            raise ValueError("Produit(s) inexistant(s) : " + ", ".join(f"#{produit_id}" for produit_id in missing) + ".")
+        short = [f"{nom} ({stock} unité(s) disponible(s))" for produit_id, nom, stock, _ in produits.values()
+                 if stock < lignes[produit_id]]
+        if short:
+            raise ValueError("Stock insuffisant : " + ", ".join(short) + ".")
+        cursor.executemany("UPDATE produits SET stock = stock - ? WHERE id = ?",
+                           [(quantite, produit_id) for produit_id, quantite in lignes.items()])
+        return {produit_id: row[3] for produit_id, row in produits.items()}
+
+    '''methode pour inserer les lignes d'une commande dans la transaction en cours, au prix d'achat'''
+    @staticmethod
+    def _insert_lines(cursor, commande_id, lignes, prix):
+        cursor.executemany("""
+            INSERT INTO lignes_commande (commande_id, produit_id, quantite, prix_unitaire) VALUES (?, ?, ?, ?)
+        """, [(commande_id, produit_id, quantite, prix[produit_id]) for produit_id, quantite in lignes.items()])
 
+    '''methode pour rendre aux produits le stock d'une commande (lignes (produit_id, quantite, prix_unitaire), None si elle n'existe pas)'''
+    @staticmethod
+    def _release_order(cursor, commande_id):
+        cursor.execute("SELECT 1 FROM commandes WHERE id = ?", (commande_id,))
+        if cursor.fetchone() is None:
+            return None
+        cursor.execute("SELECT produit_id, quantite, prix_unitaire FROM lignes_commande WHERE commande_id = ?",
+                       (commande_id,))
+        lignes = cursor.fetchall()
+        cursor.executemany("UPDATE produits SET stock = stock + ? WHERE id = ?",
+                           [(quantite, produit_id) for produit_id, quantite, _ in lignes])
+        return lignes
+
+    '''methode pour passer une commande de plusieurs lignes en une transaction'''
     def add_commande(self):
-        produit = Produit()
-        if not produit.exists(self.produit_id):
-            raise ValueError("Le produit n'existe pas.")
-        if not client.exists(self.client_id):
-            raise ValueError("Le client n'existe pas.")
-        
-        with sqlite3.connect("app_database.db") as connection:
-            cursor = connection.cursor()
-            cursor.execute("""
-                INSERT INTO commandes (client_id, produit_id, quantite)
-                VALUES (?, ?, ?)
-            """, (self.client_id, self.produit_id, self.quantite))
-            connection.commit()
+        lignes = Commande._merge_lines(self.lignes)
+
+        def place(cursor):
+            Commande._check_client(cursor, self.client_id)
+            prix = Commande._reserve_lines(cursor, lignes)
+            cursor.execute(f"INSERT INTO commandes (client_id, created_at) VALUES (?, {NOW})", (self.client_id,))
+            commande_id = cursor.lastrowid
+            Commande._insert_lines(cursor, commande_id, lignes, prix)
+            return commande_id
+
+        # Vérifications, insertions et décrément des stocks dans une seule transaction
+        self.id = run_in_transaction(place)
+        for produit_id in lignes:
+            Produit._cache.invalidate(produit_id)
+        Commande._cache.invalidate(self.id)
 
     def get_commandes(self):
-        with sqlite3.connect("app_database.db") as connection:
+        with get_connection() as connection:
             cursor = connection.cursor()
             cursor.execute("SELECT * FROM commandes")
             commandes = cursor.fetchall()
             return commandes
 
+    '''methode pour recuperer les commandes avec client, produits, nombre d'articles et total'''
+    # Rapport complet : lu dans la copie d'analyse (ou en lecture seule), sans gêner les commandes
     def get_commandes_with_details(self):
         try:
-            with sqlite3.connect("app_database.db") as connection:
-                cursor = connection.cursor()
-                cursor.execute("""
-                    SELECT c.id, cl.nom, p.nom, c.quantite
-                    FROM commandes c
-                    JOIN clients cl ON c.client_id = cl.id
-                    JOIN produits p ON c.produit_id = p.id
-                """)
+            with read_snapshot(analytics=True) as cursor:
+                cursor.execute(Commande._DETAILS_QUERY.format(where="", limit=""))
                 orders = cursor.fetchall()
                 return orders
         except sqlite3.Error as e:
             print(f"Erreur lors de la récupération des commandes: {e}")
             return []
 
+    def get_commandes_with_details_page(self, after_id=0, limit=50):
+        with get_connection() as connection:
+            cursor = connection.cursor()
+            cursor.execute(Commande._DETAILS_QUERY.format(where="WHERE c.id > ?", limit="LIMIT ?"),
+                           (after_id, limit + 1))
+            rows = cursor.fetchall()
+        next_cursor = rows[limit - 1][0] if len(rows) > limit else None
+        return rows[:limit], next_cursor
+
+    # Toutes les pages sont lues dans le même instantané : la liste est cohérente
+    def iter_commandes_with_details(self, after_id=0, batch_size=500):
+        with read_snapshot() as cursor:
+            query = Commande._DETAILS_QUERY.format(where="WHERE c.id > ?", limit="LIMIT ?")
+            while True:
+                cursor.execute(query, (after_id, batch_size))
+                orders = cursor.fetchall()
+                if not orders:
+                    break
+                yield from orders
+                after_id = orders[-1][0]
+
     def get_order_by_id(self, order_id):
         try:
-            with sqlite3.connect("app_database.db") as connection:
-                cursor = connection.cursor()
-                cursor.execute("""
-                    SELECT id, client_id, produit_id, quantite
-                    FROM commandes
-                    WHERE id = ?
-                """, (order_id,))
-                order = cursor.fetchone()
-                return order
+            return self.get_by_id(order_id)
         except sqlite3.Error as e:
             print(f"Erreur lors de la récupération de la commande: {e}")
             return None
 
-    def update_commande(self, commande_id):
-        with sqlite3.connect("app_database.db") as connection:
+    '''methode pour lire des commandes par ID : {id: (id, client_id, ((produit_id, quantite), ...))}'''
+    @staticmethod
+    def _load(ids, chunk_size=500):
+        orders = {}
+        with get_connection() as connection:
             cursor = connection.cursor()
-            cursor.execute("""
-                UPDATE commandes
-                SET client_id = ?, produit_id = ?, quantite = ?
-                WHERE id = ?
-            """, (self.client_id, self.produit_id, self.quantite, commande_id))
-            connection.commit()
+            for start in range(0, len(ids), chunk_size):
+                chunk = ids[start:start + chunk_size]
+                placeholders = ", ".join("?" * len(chunk))
+                cursor.execute(f"""
+                    SELECT c.id, c.client_id, l.produit_id, l.quantite
+                    FROM commandes c
+                    LEFT JOIN lignes_commande l ON l.commande_id = c.id
+                    WHERE c.id IN ({placeholders})
+                    ORDER BY c.id, l.produit_id
+                """, chunk)
+                for order_id, client_id, produit_id, quantite in cursor.fetchall():
+                    lignes = orders.setdefault(order_id, (client_id, []))[1]
+                    if produit_id is not None:
+                        lignes.append((produit_id, quantite))
+        return {order_id: (order_id, client_id, tuple(lignes)) for order_id, (client_id, lignes) in orders.items()}
+
+    def get_by_id(self, order_id):
+        version = Commande._cache.sync()
+        order = Commande._cache.get(order_id)
+        if order is None:
+            order = Commande._load([order_id]).get(order_id)
+            if order is not None:
+                Commande._cache.put(order_id, order, version)
+        return order
+
+    def get_many(self, ids):
+        version = Commande._cache.sync()
+        rows = {}
+        missing = []
+        for key in dict.fromkeys(ids):
+            row = Commande._cache.get(key)
+            if row is None:
+                missing.append(key)
+            else:
+                rows[key] = row
+        for key, row in Commande._load(missing).items():
+            Commande._cache.put(key, row, version)
+            rows[key] = row
+        return rows
+
+    '''methode pour remplacer le client et les lignes d'une commande'''
+    def update_commande(self, commande_id):
+        lignes = Commande._merge_lines(self.lignes)
+
+        def update(cursor):
+            # Les anciennes quantités sont rendues avant de réserver les nouvelles
+            old = Commande._release_order(cursor, commande_id)
+            if old is None:
+                raise ValueError("La commande n'existe pas.")
+            Commande._check_client(cursor, self.client_id)
+            prix = Commande._reserve_lines(cursor, lignes)
+            # Les produits déjà commandés gardent leur prix d'achat ; les nouveaux sont au prix courant
+            prix.update((produit_id, prix_unitaire) for produit_id, _, prix_unitaire in old)
+            cursor.execute("UPDATE commandes SET client_id = ? WHERE id = ?", (self.client_id, commande_id))
+            cursor.execute("DELETE FROM lignes_commande WHERE commande_id = ?", (commande_id,))
+            Commande._insert_lines(cursor, commande_id, lignes, prix)
+            return old
+
+        old = run_in_transaction(update)
+        for produit_id in {produit_id for produit_id, _, _ in old} | set(lignes):
+            Produit._cache.invalidate(produit_id)
+        Commande._cache.invalidate(commande_id)
 
     def delete_commande(self, commande_id):
+        def delete(cursor):
+            # Le stock réservé est rendu aux produits dans la même transaction ;
+            # les lignes sont supprimées avant l'en-tête (trigger, voir ventes.py)
+            lignes = Commande._release_order(cursor, commande_id)
+            cursor.execute("DELETE FROM commandes WHERE id = ?", (commande_id,))
+            return lignes
+
         try:
-            with sqlite3.connect("app_database.db") as connection:
-                cursor = connection.cursor()
-                cursor.execute("DELETE FROM commandes WHERE id = ?", (commande_id,))
-                connection.commit()
+            lignes = run_in_transaction(delete)
+            for produit_id, _, _ in lignes or ():
+                Produit._cache.invalidate(produit_id)
+            Commande._cache.invalidate(commande_id)
         except sqlite3.Error as e:
             print(f"Erreur lors de la suppression de la commande : {str(e)}")
-
-
-commande = Commande()
-commande.create_table_commande()
\ No newline at end of file
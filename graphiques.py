@@ -0,0 +1,153 @@
+import glob
+import os
+import threading
+import time
+from database import get_data_versions, read_snapshot
+
+'''--------------------Graphiques des produits (cache sur disque)--------------------'''
+
+CHARTS = ("product_share", "category_bar_chart", "price_histogram")
+# Les libellés viennent des noms de catégories : les fichiers sont liés aux versions des deux tables
+VERSION_TABLES = ("produits", "categories")
+
+_executor = None
+_render_lock = threading.Lock()
+
+
+'''fonction pour recuperer le pool de processus de rendu'''
+def get_executor():
+    global _executor
+    if _executor is None:
+        # Import local : le pool n'est créé qu'au premier rendu
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        # "spawn" : les workers n'héritent ni des threads ni des connexions du serveur
+        _executor = ProcessPoolExecutor(max_workers=len(CHARTS), mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+
+'''fonction pour lire les donnees des trois graphiques dans les statistiques pre-calculees'''
+def load_chart_data():
+    # Import local : les workers de rendu n'ont pas besoin du modèle
+    from gestion_produit import Produit, PRICE_BUCKET_WIDTH
+    produit = Produit()
+    # Les trois graphiques sont lus dans le même instantané, en lecture seule
+    with read_snapshot():
+        return {
+            "product_share": produit.count_by_type(),
+            "category_bar_chart": produit.stock_frequencies(limit=3),
+            # Chaque tranche est représentée par son centre
+            "price_histogram": [(start + PRICE_BUCKET_WIDTH / 2, nb) for start, nb in produit.price_histogram()],
+        }
+
+
+# Création de la fonction pour générer le graphique circulaire
+def generate_pie_chart(rows, path):
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=(8, 6))
+    ax = fig.subplots()
+    types = [row[0] for row in rows]
+    counts = [row[1] for row in rows]
+    ax.pie(counts, labels=types, autopct='%1.1f%%', startangle=90)
+    ax.axis('equal')
+    ax.set_title('Répartition des Produits par Type')
+    fig.savefig(path, transparent=True)
+
+
+# Création de la fonction pour générer le graphique en barres
+def generate_category_bar_chart(rows, path):
+    from matplotlib.figure import Figure
+    fig = Figure()
+    ax = fig.subplots()
+    categories = [row[0] for row in rows]
+    counts = [row[1] for row in rows]
+    ax.bar(categories, counts)
+    ax.set_xlabel('Catégorie')
+    ax.set_ylabel('Nombre de Produits')
+    ax.set_title('Top 5 des Catégories par Nombre de Produits')
+    fig.savefig(path, transparent=True)
+
+
+# Création de la fonction pour générer l'histogramme
+def generate_price_histogram(buckets, path):
+    from matplotlib.figure import Figure
+    fig = Figure()
+    ax = fig.subplots()
+    # Les tranches pré-calculées sont regroupées en 50 barres, pondérées par leur effectif
+    centres = [centre for centre, _ in buckets]
+    counts = [nb for _, nb in buckets]
+    ax.hist(centres, bins=50, weights=counts)
+    ax.set_xlabel('Prix')
+    ax.set_ylabel('Fréquence')
+    ax.set_title('Répartition des Prix des Produits')
+    fig.savefig(path, transparent=True)
+
+
+GENERATORS = {
+    "product_share": generate_pie_chart,
+    "category_bar_chart": generate_category_bar_chart,
+    "price_histogram": generate_price_histogram,
+}
+
+
+'''fonction executee dans un worker : rendu dans un fichier temporaire puis remplacement atomique (duree en secondes)'''
+def render_chart(name, data, path):
+    start = time.perf_counter()
+    tmp_path = f"{path}.{os.getpid()}.tmp.png"
+    GENERATORS[name](data, tmp_path)
+    os.replace(tmp_path, path)
+    return time.perf_counter() - start
+
+
+'''fonction pour lire la version courante des graphiques (version des produits, version des categories)'''
+def chart_version():
+    versions = get_data_versions(VERSION_TABLES)
+    return tuple(versions[table][0] for table in VERSION_TABLES)
+
+
+'''fonction pour recuperer les noms de fichier des graphiques d'une version (produits, categories)'''
+def chart_filenames(version):
+    produits, categories = version
+    return {name: f"{name}-v{produits}-{categories}.png" for name in CHARTS}
+
+
+'''fonction pour recuperer les graphiques deja rendus pour la version courante (None s'il en manque)'''
+# Ne rend rien : la page des graphiques confie le rendu à une tâche de fond (taches.py)
+def ready_charts(charts_dir, version=None):
+    filenames = chart_filenames(version or chart_version())
+    if all(os.path.exists(os.path.join(charts_dir, filename)) for filename in filenames.values()):
+        return filenames
+    return None
+
+
+'''fonction pour recuperer les graphiques a jour, rendus si besoin (nom -> nom de fichier dans charts_dir)'''
+def get_charts(charts_dir):
+    filenames = chart_filenames(chart_version())
+    stale = [name for name in CHARTS if not os.path.exists(os.path.join(charts_dir, filenames[name]))]
+    if stale:
+        with _render_lock:
+            # Un autre thread a peut-être déjà rendu cette version
+            stale = [name for name in stale if not os.path.exists(os.path.join(charts_dir, filenames[name]))]
+            if stale:
+                os.makedirs(charts_dir, exist_ok=True)
+                data = load_chart_data()
+                futures = [get_executor().submit(render_chart, name, data[name], os.path.join(charts_dir, filenames[name]))
+                           for name in stale]
+                # Import local : les workers de rendu n'importent pas Flask
+                from metriques import observe_chart
+                for name, future in zip(stale, futures):
+                    observe_chart(name, future.result())
+                remove_old_charts(charts_dir, filenames)
+    return filenames
+
+
+'''fonction pour supprimer les graphiques des versions precedentes'''
+# "<nom>-v*.png" couvre les noms "<nom>-v<produits>-<categories>.png" et les anciens "<nom>-v<produits>.png"
+def remove_old_charts(charts_dir, current):
+    for name in CHARTS:
+        for path in glob.glob(os.path.join(charts_dir, f"{name}-v*.png")):
+            if os.path.basename(path) != current[name]:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
@@ -0,0 +1,206 @@
+import csv
+import io
+import json
+import re
+from functools import lru_cache, partial
+from database import run_in_transaction, set_bulk_mode, bump_version
+from forms import NOM_PRODUIT_MAX, DESCRIPTION_MAX
+from gestion_produit import Produit, Categorie
+
+'''--------------------Import en masse de produits et de clients--------------------'''
+
+BATCH_SIZE = 5000 # Nombre de lignes insérées par transaction
+MAX_REJETS = 1000 # Nombre de lignes rejetées conservées dans le rapport
+PRIX_MAX = 10 ** 12 # Au-delà, un REAL SQLite ne garde plus les centimes
+
+# Partie locale ASCII "dot-atom", acceptée telle quelle par email_validator
+LOCAL_PART = re.compile(r"[A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+(\.[A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+)*\Z")
+
+
+'''fonction pour lire un fichier CSV ou JSONL ligne par ligne (numero de ligne, dictionnaire)'''
+def read_rows(stream, fmt):
+    if fmt == "csv":
+        # csv.reader + zip : DictReader relit ses noms de colonnes en Python à chaque ligne
+        reader = csv.reader(stream)
+        fieldnames = next(reader, None)
+        if fieldnames is None:
+            return
+        for row in reader:
+            if row: # Lignes vides ignorées, comme DictReader ; colonne absente : None par .get()
+                yield reader.line_num, dict(zip(fieldnames, row))
+    elif fmt in ("jsonl", "ndjson"):
+        for line_num, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_num, e
+                continue
+            yield line_num, row if isinstance(row, dict) else ValueError("objet JSON attendu")
+    else:
+        raise ValueError(f"Format non pris en charge : {fmt}")
+
+
+'''fonction pour deduire le format d'un fichier a partir de son nom'''
+def detect_format(filename):
+    extension = filename.rsplit(".", 1)[-1].lower()
+    if extension not in ("csv", "jsonl", "ndjson"):
+        raise ValueError("Le fichier doit être au format .csv, .jsonl ou .ndjson")
+    return extension
+
+
+'''fonction pour lire un champ texte obligatoire (memes regles que DataRequired)'''
+def _required_text(row, name):
+    value = row.get(name)
+    if type(value) is not str:
+        value = "" if value is None else str(value)
+    if not value.strip():
+        raise ValueError(f"{name} : ce champ est obligatoire")
+    return value
+
+
+'''fonction pour valider une ligne produit avec les regles de AddProductForm'''
+# Le fichier donne le nom du type (colonne type_produit) ; categories : dictionnaire nom -> ID
+def validate_produit(row, categories=None):
+    nom = _required_text(row, "nom")
+    if len(nom) > NOM_PRODUIT_MAX:
+        raise ValueError(f"nom : {NOM_PRODUIT_MAX} caractères maximum")
+    # float() et int() acceptent les espaces autour du nombre : pas de str()/strip() par ligne
+    prix = row.get("prix")
+    try:
+        if isinstance(prix, bool):
+            raise ValueError
+        prix = float(prix)
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError("prix : nombre décimal attendu")
+    # NaN échoue aux deux comparaisons ; l'infini et 1e400 (inf) à la seconde
+    if not prix > 0:
+        raise ValueError("prix : doit être supérieur à 0")
+    if not prix < PRIX_MAX:
+        raise ValueError(f"prix : doit être inférieur à {PRIX_MAX}")
+    description = row.get("description") or ""
+    if not isinstance(description, str):
+        raise ValueError("description : texte attendu")
+    if len(description) > DESCRIPTION_MAX:
+        raise ValueError(f"description : {DESCRIPTION_MAX} caractères maximum")
+    stock = row.get("stock")
+    try:
+        if isinstance(stock, (bool, float)):
+            raise ValueError
+        stock = int(stock)
+    except (TypeError, ValueError):
+        raise ValueError("stock : nombre entier attendu")
+    if stock <= 0:
+        raise ValueError("stock : doit être supérieur à 0")
+    type_produit = row.get("type_produit")
+    if not isinstance(type_produit, str):
+        raise ValueError(f"type_produit : valeur inconnue {type_produit!r}")
+    categorie_id = (categories or Categorie.ids_by_name()).get(type_produit)
+    if categorie_id is None:
+        raise ValueError(f"type_produit : valeur inconnue {type_produit!r}")
+    return nom, round(prix, 2), description, stock, categorie_id
+
+
+'''fonction pour valider un email comme le validateur Email() de WTForms'''
+def is_valid_email(email):
+    local, sep, domain = email.rpartition("@")
+    if sep and len(email) <= 254 and len(local) <= 64 and LOCAL_PART.match(local):
+        # Cas courant : seul le domaine demande la validation complète, mise en cache
+        return _is_valid_domain(domain)
+    return _validate_email(email)
+
+
+@lru_cache(maxsize=4096)
+def _is_valid_domain(domain):
+    return _validate_email("a@" + domain)
+
+
+'''fonction pour valider un email complet avec email_validator'''
+def _validate_email(email):
+    # Import local : email_validator n'est chargé qu'à la première validation
+    from email_validator import validate_email, EmailNotValidError
+    try:
+        validate_email(email, check_deliverability=False)
+        return True
+    except EmailNotValidError:
+        return False
+
+
+'''fonction pour valider une ligne client avec les regles de AddClientForm'''
+def validate_client(row):
+    nom = _required_text(row, "nom")
+    email = _required_text(row, "email")
+    if not is_valid_email(email):
+        raise ValueError("email : adresse invalide")
+    adresse = _required_text(row, "adresse")
+    return nom, email, adresse
+
+
+# Pour chaque table : validation d'une ligne, requête d'insertion, mise à jour des agrégats et index par lot
+ENTITIES = {
+    "produits": (validate_produit, """
+        INSERT INTO produits (nom, prix, description, stock, categorie_id)
+        VALUES (?, ?, ?, ?, ?)
+    """, Produit.after_bulk_insert),
+    "clients": (validate_client, """
+        INSERT INTO clients (nom, email, adresse)
+        VALUES (?, ?, ?)
+    """, None),
+}
+
+
+'''fonction pour inserer un lot dans la transaction en cours, triggers d'insertion suspendus'''
+def insert_batch(cursor, entity, batch):
+    _, query, after_insert = ENTITIES[entity]
+    cursor.execute(f"SELECT COALESCE(MAX(id), 0) FROM {entity}")
+    after_id = cursor.fetchone()[0]
+    set_bulk_mode(cursor, True)
+    cursor.executemany(query, batch)
+    if after_insert:
+        after_insert(cursor, batch, after_id)
+    bump_version(cursor, entity)
+    set_bulk_mode(cursor, False)
+
+
+'''fonction pour importer des lignes par lots (une transaction et un executemany par lot)'''
+def import_rows(entity, rows, batch_size=BATCH_SIZE, progress=None):
+    validate = ENTITIES[entity][0]
+    if entity == "produits":
+        # Liste des catégories lue une fois pour tout le fichier
+        validate = partial(validate_produit, categories=Categorie.ids_by_name())
+    report = {"inserted": 0, "rejected": 0, "errors": []}
+    batch = []
+
+    def flush():
+        run_in_transaction(lambda cursor: insert_batch(cursor, entity, batch))
+        report["inserted"] += len(batch)
+        batch.clear()
+        if progress:
+            progress(report)
+
+    for line_num, row in rows:
+        try:
+            if isinstance(row, Exception):
+                raise ValueError(f"ligne illisible : {row}")
+            batch.append(validate(row))
+        except ValueError as e:
+            report["rejected"] += 1
+            if len(report["errors"]) < MAX_REJETS:
+                report["errors"].append((line_num, str(e)))
+            continue
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    return report
+
+
+'''fonction pour importer un fichier binaire (upload ou fichier ouvert en 'rb')'''
+def import_file(entity, binary_stream, fmt, batch_size=BATCH_SIZE, progress=None):
+    stream = io.TextIOWrapper(binary_stream, encoding="utf-8-sig", newline="")
+    try:
+        return import_rows(entity, read_rows(stream, fmt), batch_size, progress)
+    finally:
+        # Le flux binaire appartient à l'appelant
+        stream.detach()
@@ -0,0 +1,157 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+
+'''--------------------Journal des actions (JSON, écriture en arrière-plan)--------------------'''
+
+# Le thread de la requête ne fait que mettre l'enregistrement en file ; un thread
+# d'écriture vide la file par lots, avec un seul flush par lot, dans un fichier
+# tourné par taille. Avec des workers pré-forkés (serveur.py), chaque worker écrit dans
+# le fichier de sa place (user_actions.<place>.log) : une rotation n'est jamais faite par
+# deux processus sur le même fichier, et un worker remplacé laisse le fichier au suivant.
+
+AUDIT_LOG_PATH = "user_actions.log"
+AUDIT_LOG_MAX_BYTES = 10 * 1024 * 1024 # Taille maximale du fichier avant rotation
+AUDIT_LOG_BACKUPS = 5 # Nombre d'anciens fichiers conservés (user_actions.log.1 ...)
+BATCH_SIZE = 500 # Nombre maximal d'enregistrements écrits par lot
+
+# Champs transmis par extra={...} et recopiés dans l'objet JSON
+FIELDS = ("user", "method", "route", "endpoint", "status", "duration_ms")
+
+logger = logging.getLogger("audit")
+logger.setLevel(logging.INFO)
+logger.propagate = False # Le journal d'audit ne se mélange pas aux logs de werkzeug
+
+_settings = {"path": AUDIT_LOG_PATH, "max_bytes": AUDIT_LOG_MAX_BYTES, "backups": AUDIT_LOG_BACKUPS,
+             "suffix": None}
+_listener = None
+_listener_pid = None
+_setup_lock = threading.Lock()
+
+
+'''classe pour formater un enregistrement en une ligne JSON'''
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)) + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "action": record.getMessage(),
+        }
+        for field in FIELDS:
+            if hasattr(record, field):
+                entry[field] = getattr(record, field)
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+'''classe de fichier tourne par taille, ecrit par lots (un flush par lot)'''
+class BatchRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    '''methode pour ecrire un lot d'enregistrements'''
+    def emit_batch(self, records):
+        with self.lock:
+            for record in records:
+                try:
+                    if self.shouldRollover(record):
+                        self.doRollover()
+                    self.stream.write(self.format(record) + self.terminator)
+                except Exception:
+                    self.handleError(record)
+            self.flush()
+
+
+'''classe du thread d'ecriture : vide la file par lots'''
+class BatchListener:
+    _stop = object()
+
+    def __init__(self, records, handler, batch_size=BATCH_SIZE):
+        self.records = records
+        self.handler = handler
+        self.batch_size = batch_size
+        self._thread = None
+
+    '''methode pour demarrer le thread d'ecriture'''
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="audit-log", daemon=True)
+        self._thread.start()
+
+    '''methode executee par le thread : attend un enregistrement puis prend tout ce qui suit'''
+    def _run(self):
+        while True:
+            batch = [self.records.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.records.get_nowait())
+                except queue.Empty:
+                    break
+            stop = any(record is self._stop for record in batch)
+            batch = [record for record in batch if record is not self._stop]
+            if batch:
+                self.handler.emit_batch(batch)
+            if stop:
+                return
+
+    '''methode pour ecrire ce qui reste dans la file puis arreter le thread'''
+    def stop(self):
+        if self._thread is not None:
+            self.records.put(self._stop)
+            self._thread.join()
+            self._thread = None
+        self.handler.close()
+
+
+'''fonction pour changer le fichier du journal et sa rotation (avant le premier enregistrement)'''
+def configure(path=None, max_bytes=None, backups=None, suffix=None):
+    if path is not None:
+        _settings["path"] = path
+    if max_bytes is not None:
+        _settings["max_bytes"] = max_bytes
+    if backups is not None:
+        _settings["backups"] = backups
+    if suffix is not None:
+        _settings["suffix"] = suffix
+
+
+'''fonction pour recuperer le chemin du fichier de ce processus (suffixe avant l'extension)'''
+def log_path():
+    path = _settings["path"]
+    if _settings["suffix"] is None:
+        return path
+    root, extension = os.path.splitext(path)
+    return f"{root}.{_settings['suffix']}{extension}"
+
+
+'''fonction pour recuperer le journal d'audit, thread d'ecriture demarre au besoin'''
+# Le thread est démarré une fois par processus : après un fork, l'enfant démarre le sien.
+def get_audit_logger():
+    global _listener, _listener_pid
+    if _listener_pid != os.getpid():
+        with _setup_lock:
+            if _listener_pid != os.getpid():
+                records = queue.SimpleQueue()
+                handler = BatchRotatingFileHandler(log_path(), maxBytes=_settings["max_bytes"],
+                                                   backupCount=_settings["backups"], encoding="utf-8")
+                handler.setFormatter(JsonFormatter())
+                for old in list(logger.handlers):
+                    logger.removeHandler(old)
+                logger.addHandler(logging.handlers.QueueHandler(records))
+                _listener = BatchListener(records, handler)
+                _listener.start()
+                if _listener_pid is None:
+                    atexit.register(shutdown)
+                _listener_pid = os.getpid()
+    return logger
+
+
+'''fonction pour vider la file et fermer le fichier (fin du processus)'''
+def shutdown():
+    global _listener, _listener_pid
+    if _listener is not None and _listener_pid == os.getpid():
+        _listener.stop()
+    _listener = None
+    _listener_pid = None
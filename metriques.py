@@ -0,0 +1,264 @@
+import json
+import logging
+import threading
+import time
+from flask import g, request, template_rendered, before_render_template
+import database
+
+'''--------------------Mesures des requêtes (format texte Prometheus)--------------------'''
+
+# Les compteurs sont propres à chaque processus : avec des workers pré-forkés, /metrics
+# ne montre que le worker qui a répondu, et un worker remplacé repart de zéro (voir
+# serveur.py). Chaque requête mesure sa durée, le nombre d'instructions SQL exécutées,
+# les connexions SQLite ouvertes et le temps passé dans Jinja ; le rendu des graphiques
+# est mesuré dans les workers.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10) # secondes
+STATEMENT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500, 1000)
+MAX_SLOW_STATEMENTS = 1000 # Nombre d'instructions SQL conservées pour le journal des requêtes lentes
+
+slow_logger = logging.getLogger("slow_requests")
+
+_local = threading.local()
+
+
+'''classe d'un histogramme par jeu d'etiquettes (buckets cumulatifs, somme, nombre)'''
+class Histogram:
+    def __init__(self, name, help, labels, buckets):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._values = {}
+        self._lock = threading.Lock()
+
+    '''methode pour enregistrer une observation'''
+    def observe(self, value, *label_values):
+        with self._lock:
+            entry = self._values.get(label_values)
+            if entry is None:
+                entry = self._values[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    '''methode pour produire les lignes au format texte Prometheus'''
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            values = sorted((key, (list(entry[0]), entry[1], entry[2])) for key, entry in self._values.items())
+        for label_values, (counts, total, count) in values:
+            labels = _labels(self.labels, label_values)
+            for bound, nb in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{{{labels}{"," if labels else ""}le="{bound}"}} {nb}')
+            lines.append(f'{self.name}_bucket{{{labels}{"," if labels else ""}le="+Inf"}} {count}')
+            lines.append(f"{self.name}_sum{{{labels}}} {total}")
+            lines.append(f"{self.name}_count{{{labels}}} {count}")
+        return lines
+
+
+'''classe d'un compteur par jeu d'etiquettes'''
+class Counter:
+    def __init__(self, name, help, labels):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    '''methode pour incrementer le compteur'''
+    def inc(self, amount, *label_values):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    '''methode pour produire les lignes au format texte Prometheus'''
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for label_values, value in values:
+            lines.append(f"{self.name}{{{_labels(self.labels, label_values)}}} {value}")
+        return lines
+
+
+'''classe d'une jauge par jeu d'etiquettes (valeur courante)'''
+class Gauge:
+    def __init__(self, name, help, labels):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    '''methode pour fixer la valeur de la jauge'''
+    def set(self, value, *label_values):
+        with self._lock:
+            self._values[label_values] = value
+
+    '''methode pour produire les lignes au format texte Prometheus'''
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for label_values, value in values:
+            lines.append(f"{self.name}{{{_labels(self.labels, label_values)}}} {value}")
+        return lines
+
+
+'''fonction pour ecrire les etiquettes name="valeur" (valeurs echappees)'''
+def _labels(names, values):
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in values)
+    return ",".join(f'{name}="{value}"' for name, value in zip(names, escaped))
+
+
+REQUEST_DURATION = Histogram("http_request_duration_seconds", "Durée des requêtes HTTP.",
+                             ("endpoint", "method"), LATENCY_BUCKETS)
+REQUESTS = Counter("http_requests_total", "Requêtes HTTP par statut.", ("endpoint", "method", "status"))
+SQL_PER_REQUEST = Histogram("sql_statements_per_request", "Instructions SQL exécutées par requête.",
+                            ("endpoint",), STATEMENT_BUCKETS)
+SQL_STATEMENTS = Counter("sql_statements_total", "Instructions SQL exécutées.", ("endpoint",))
+DB_CONNECTIONS = Counter("db_connections_opened_total", "Connexions SQLite ouvertes.", ("endpoint",))
+TEMPLATE_DURATION = Histogram("template_render_seconds", "Durée du rendu Jinja (flux compris).",
+                              ("template",), LATENCY_BUCKETS)
+CHART_DURATION = Histogram("chart_render_seconds", "Durée du rendu matplotlib d'un graphique (dans le worker).",
+                           ("chart",), LATENCY_BUCKETS)
+SLOW_REQUESTS = Counter("slow_requests_total", "Requêtes plus lentes que SLOW_REQUEST_MS.", ("endpoint",))
+# Contrôle d'admission des routes coûteuses (voir admission.py)
+ADMISSION_ACTIVE = Gauge("admission_active_requests", "Requêtes en cours par classe de routes.", ("class",))
+ADMISSION_QUEUED = Gauge("admission_queued_requests", "Requêtes en attente d'une place par classe de routes.",
+                         ("class",))
+ADMISSION_DECISIONS = Counter("admission_requests_total",
+                              "Requêtes admises ou refusées (file pleine, attente trop longue) par classe.",
+                              ("class", "decision"))
+ADMISSION_WAIT = Histogram("admission_wait_seconds", "Attente d'une place avant admission ou refus.",
+                           ("class",), LATENCY_BUCKETS)
+
+METRICS = (REQUEST_DURATION, REQUESTS, SQL_PER_REQUEST, SQL_STATEMENTS, DB_CONNECTIONS,
+           TEMPLATE_DURATION, CHART_DURATION, SLOW_REQUESTS,
+           ADMISSION_ACTIVE, ADMISSION_QUEUED, ADMISSION_DECISIONS, ADMISSION_WAIT)
+
+
+'''fonction pour produire toutes les mesures au format texte Prometheus'''
+def render():
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+'''--------------------Mesures de la requête en cours--------------------'''
+
+'''classe des mesures de la requete en cours (une par thread)'''
+class RequestStats:
+    def __init__(self, keep_statements):
+        self.start = time.perf_counter()
+        self.statements = 0
+        self.connections = 0
+        self.template_time = 0.0
+        self.status = None
+        self.queries = [] if keep_statements else None
+
+
+'''fonction appelee par database.py pour chaque instruction SQL executee'''
+def _trace_statement(sql):
+    stats = getattr(_local, "stats", None)
+    if stats is not None:
+        stats.statements += 1
+        if stats.queries is not None and len(stats.queries) < MAX_SLOW_STATEMENTS:
+            stats.queries.append(sql)
+
+
+'''fonction appelee par database.py a chaque connexion ouverte'''
+def _on_connect(connection):
+    stats = getattr(_local, "stats", None)
+    if stats is not None:
+        stats.connections += 1
+    else:
+        DB_CONNECTIONS.inc(1, "")
+
+
+def _before_request():
+    _local.stats = RequestStats(keep_statements=g.get("slow_request_ms") is not None)
+
+
+def _after_request(response):
+    stats = getattr(_local, "stats", None)
+    if stats is not None:
+        stats.status = response.status_code
+    return response
+
+
+# Appelé à la fin de la requête, après l'envoi complet d'une réponse en flux
+def _teardown_request(exception):
+    stats = getattr(_local, "stats", None)
+    if stats is None:
+        return
+    _local.stats = None
+    duration = time.perf_counter() - stats.start
+    endpoint = request.endpoint or "404"
+    status = stats.status if stats.status is not None else 500
+    REQUEST_DURATION.observe(duration, endpoint, request.method)
+    REQUESTS.inc(1, endpoint, request.method, status)
+    SQL_PER_REQUEST.observe(stats.statements, endpoint)
+    SQL_STATEMENTS.inc(stats.statements, endpoint)
+    DB_CONNECTIONS.inc(stats.connections, endpoint)
+
+    threshold = g.get("slow_request_ms")
+    if threshold is not None and duration * 1000 >= threshold:
+        SLOW_REQUESTS.inc(1, endpoint)
+        slow_logger.warning(json.dumps({
+            "endpoint": endpoint,
+            "method": request.method,
+            "path": request.full_path.rstrip("?"),
+            "status": status,
+            "duration_ms": round(duration * 1000, 3),
+            "template_ms": round(stats.template_time * 1000, 3),
+            "sql_statements": stats.statements,
+            "db_connections": stats.connections,
+            "queries": stats.queries,
+        }, ensure_ascii=False))
+
+
+def _before_render(sender, template, context, **extra):
+    starts = getattr(_local, "template_starts", None)
+    if starts is None:
+        starts = _local.template_starts = {}
+    starts.setdefault(template.name, []).append(time.perf_counter())
+
+
+def _template_rendered(sender, template, context, **extra):
+    starts = getattr(_local, "template_starts", {}).get(template.name)
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    TEMPLATE_DURATION.observe(elapsed, template.name)
+    stats = getattr(_local, "stats", None)
+    if stats is not None:
+        stats.template_time += elapsed
+
+
+'''fonction pour enregistrer la duree de rendu d'un graphique'''
+def observe_chart(name, seconds):
+    CHART_DURATION.observe(seconds, name)
+
+
+'''fonction pour brancher les mesures sur une application Flask'''
+# SLOW_REQUEST_MS (désactivé par défaut) : au-delà de ce seuil, la requête est écrite
+# dans le journal "slow_requests" avec la liste complète de ses instructions SQL.
+def init_app(app):
+    if _on_connect not in database.connection_hooks:
+        database.connection_hooks.append(_on_connect)
+        database.statement_hooks.append(_trace_statement)
+    threshold = app.config.get("SLOW_REQUEST_MS")
+
+    @app.before_request
+    def before_request():
+        g.slow_request_ms = threshold
+        _before_request()
+
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_template_rendered, app)
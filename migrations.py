@@ -0,0 +1,371 @@
+import sys
+from database import get_connection, create_version_tracking, create_bulk_mode, NOW
+from gestion_produit import PRICE_BUCKET_WIDTH
+from taches import create_jobs_table
+from ventes import create_sales_rollups, create_category_rollup
+
+'''--------------------Migrations du schéma (PRAGMA user_version)--------------------'''
+
+# Chaque migration reçoit un curseur déjà dans une transaction ; la base est à la
+# version N une fois les N premières migrations appliquées. Ne jamais modifier une
+# migration publiée : en ajouter une nouvelle à la fin de MIGRATIONS.
+
+
+# Types de produit proposés par le formulaire avant la table categories (ID 1 à 11)
+CATEGORIES_INITIALES = [
+    'Fruits et légumes', 'Produits laitiers', 'Viandes et protéines',
+    'Produits de boulangerie', 'Céréales et grains', 'Conserves et produits secs',
+    'Condiments et épices', 'Boissons', 'Produits surgelés',
+    'Snacks et confiseries', 'Produits non alimentaires'
+]
+
+
+'''fonction pour generer le SQL qui ajoute une ligne (NEW) aux statistiques'''
+# Compteur par type : stats_types (type_produit) jusqu'à la migration 8, stats_categories ensuite
+def _stats_add(row, table="stats_types", column="type_produit"):
+    return f"""
+        INSERT INTO {table} VALUES ({row}.{column}, 1)
+            ON CONFLICT({column}) DO UPDATE SET nb = nb + 1;
+        INSERT INTO stats_stocks VALUES ({row}.stock, 1)
+            ON CONFLICT(stock) DO UPDATE SET nb = nb + 1;
+        INSERT INTO stats_prix VALUES (CAST({row}.prix / {PRICE_BUCKET_WIDTH} AS INTEGER), 1)
+            ON CONFLICT(bucket) DO UPDATE SET nb = nb + 1;
+    """
+
+
+'''fonction pour generer le SQL qui retire une ligne (OLD) des statistiques'''
+def _stats_remove(row, table="stats_types", column="type_produit"):
+    return f"""
+        UPDATE {table} SET nb = nb - 1 WHERE {column} = {row}.{column};
+        DELETE FROM {table} WHERE {column} = {row}.{column} AND nb <= 0;
+        UPDATE stats_stocks SET nb = nb - 1 WHERE stock = {row}.stock;
+        DELETE FROM stats_stocks WHERE stock = {row}.stock AND nb <= 0;
+        UPDATE stats_prix SET nb = nb - 1 WHERE bucket = CAST({row}.prix / {PRICE_BUCKET_WIDTH} AS INTEGER);
+        DELETE FROM stats_prix WHERE bucket = CAST({row}.prix / {PRICE_BUCKET_WIDTH} AS INTEGER) AND nb <= 0;
+    """
+
+
+'''migration 1 : tables, compteurs de versions, statistiques et index plein texte des produits'''
+# Écrite avec IF NOT EXISTS : elle s'applique aussi aux bases créées avant les migrations.
+def migration_001_schema_initial(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS produits (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nom TEXT NOT NULL,
+            prix REAL NOT NULL,
+            description TEXT NOT NULL,
+            stock INTEGER NOT NULL,
+            type_produit TEXT NOT NULL
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS clients (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nom TEXT NOT NULL,
+            email TEXT NOT NULL,
+            adresse TEXT NOT NULL
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS commandes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            client_id INTEGER NOT NULL,
+            produit_id INTEGER NOT NULL,
+            quantite INTEGER NOT NULL,
+            FOREIGN KEY (client_id) REFERENCES clients (id),
+            FOREIGN KEY (produit_id) REFERENCES produits (id)
+        )
+    """)
+    create_bulk_mode(cursor)
+    create_version_tracking(cursor, "produits")
+
+    # Statistiques des produits, tenues à jour par triggers (voir Produit.count_by_type...)
+    cursor.execute("CREATE TABLE IF NOT EXISTS stats_types (type_produit TEXT PRIMARY KEY, nb INTEGER NOT NULL)")
+    cursor.execute("CREATE TABLE IF NOT EXISTS stats_stocks (stock INTEGER PRIMARY KEY, nb INTEGER NOT NULL)")
+    cursor.execute("CREATE TABLE IF NOT EXISTS stats_prix (bucket INTEGER PRIMARY KEY, nb INTEGER NOT NULL)")
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS produits_stats_insert AFTER INSERT ON produits
+        WHEN NOT (SELECT active FROM bulk_mode)
+        BEGIN
+            {_stats_add("NEW")}
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS produits_stats_delete AFTER DELETE ON produits
+        BEGIN
+            {_stats_remove("OLD")}
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS produits_stats_update AFTER UPDATE OF type_produit, stock, prix ON produits
+        BEGIN
+            {_stats_remove("OLD")}
+            {_stats_add("NEW")}
+        END
+    """)
+    cursor.execute("DELETE FROM stats_types")
+    cursor.execute("DELETE FROM stats_stocks")
+    cursor.execute("DELETE FROM stats_prix")
+    cursor.execute("INSERT INTO stats_types SELECT type_produit, COUNT(*) FROM produits GROUP BY type_produit")
+    cursor.execute("INSERT INTO stats_stocks SELECT stock, COUNT(*) FROM produits GROUP BY stock")
+    cursor.execute(f"""
+        INSERT INTO stats_prix
+        SELECT CAST(prix / {PRICE_BUCKET_WIDTH} AS INTEGER), COUNT(*) FROM produits GROUP BY 1
+    """)
+
+    # Index plein texte "external content" : le texte reste dans produits
+    cursor.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS produits_fts USING fts5(
+            nom, description,
+            content='produits', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS produits_fts_insert AFTER INSERT ON produits
+        WHEN NOT (SELECT active FROM bulk_mode)
+        BEGIN
+            INSERT INTO produits_fts (rowid, nom, description) VALUES (NEW.id, NEW.nom, NEW.description);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS produits_fts_delete AFTER DELETE ON produits
+        BEGIN
+            INSERT INTO produits_fts (produits_fts, rowid, nom, description)
+                VALUES ('delete', OLD.id, OLD.nom, OLD.description);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS produits_fts_update AFTER UPDATE OF nom, description ON produits
+        BEGIN
+            INSERT INTO produits_fts (produits_fts, rowid, nom, description)
+                VALUES ('delete', OLD.id, OLD.nom, OLD.description);
+            INSERT INTO produits_fts (rowid, nom, description) VALUES (NEW.id, NEW.nom, NEW.description);
+        END
+    """)
+    cursor.execute("INSERT INTO produits_fts (produits_fts) VALUES ('rebuild')")
+
+
+'''migration 2 : index secondaires sur les cles etrangeres et le type de produit'''
+def migration_002_index(cursor):
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_commandes_client_id ON commandes (client_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_commandes_produit_id ON commandes (produit_id)")
+    # Les entrées d'index sont triées par (type_produit, id) : le filtre paginé n'a pas de tri à faire
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_produits_type_produit ON produits (type_produit)")
+    cursor.execute("ANALYZE")
+
+
+'''migration 3 : compteurs de versions des clients et des commandes, date de derniere ecriture'''
+# Les versions servent d'ETag aux pages des listes, la date d'en-tête Last-Modified.
+def migration_003_versions(cursor):
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(data_versions)")]
+    if "updated_at" not in columns:
+        cursor.execute("ALTER TABLE data_versions ADD COLUMN updated_at INTEGER NOT NULL DEFAULT 0")
+    for table in ("produits", "clients", "commandes"):
+        # Les triggers des produits sont recréés pour mettre à jour la date
+        for event in ("insert", "update", "delete"):
+            cursor.execute(f"DROP TRIGGER IF EXISTS {table}_version_{event}")
+        create_version_tracking(cursor, table)
+    cursor.execute(f"UPDATE data_versions SET updated_at = {NOW} WHERE updated_at = 0")
+
+
+'''migration 4 : index des noms pour l'autocompletion (recherche par prefixe sans casse)'''
+def migration_004_index_noms(cursor):
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_clients_nom ON clients (nom COLLATE NOCASE)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_produits_nom ON produits (nom COLLATE NOCASE)")
+    cursor.execute("ANALYZE")
+
+
+'''migration 5 : commandes en deux tables, l'en-tete (client) et les lignes (produit, quantite)'''
+# Chaque commande existante devient une en-tête avec une seule ligne. La table commandes
+# est reconstruite (SQLite ne supprime pas une colonne citée par une clé étrangère) : les
+# id et la séquence AUTOINCREMENT sont conservés.
+def migration_005_lignes_commande(cursor):
+    cursor.execute("""
+        CREATE TABLE commandes_entetes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            client_id INTEGER NOT NULL,
+            FOREIGN KEY (client_id) REFERENCES clients (id)
+        )
+    """)
+    cursor.execute("INSERT INTO commandes_entetes (id, client_id) SELECT id, client_id FROM commandes")
+    # Les lignes d'une commande sont rangées ensemble (clé primaire commande_id, produit_id)
+    cursor.execute("""
+        CREATE TABLE lignes_commande (
+            commande_id INTEGER NOT NULL,
+            produit_id INTEGER NOT NULL,
+            quantite INTEGER NOT NULL,
+            PRIMARY KEY (commande_id, produit_id),
+            FOREIGN KEY (commande_id) REFERENCES commandes_entetes (id) ON DELETE CASCADE,
+            FOREIGN KEY (produit_id) REFERENCES produits (id)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("""
+        INSERT INTO lignes_commande (commande_id, produit_id, quantite)
+        SELECT id, produit_id, quantite FROM commandes
+    """)
+    row = cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'commandes'").fetchone()
+    cursor.execute("DROP TABLE commandes")  # Emporte ses index et ses triggers
+    # Le renommage met aussi à jour la clé étrangère de lignes_commande
+    cursor.execute("ALTER TABLE commandes_entetes RENAME TO commandes")
+    if row:
+        cursor.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'commandes'", (row[0],))
+
+    cursor.execute("CREATE INDEX idx_commandes_client_id ON commandes (client_id)")
+    cursor.execute("CREATE INDEX idx_lignes_commande_produit_id ON lignes_commande (produit_id)")
+    create_version_tracking(cursor, "commandes")
+    create_version_tracking(cursor, "lignes_commande")
+    cursor.execute("ANALYZE")
+
+
+'''migration 6 : table des taches de fond (voir taches.py)'''
+def migration_006_jobs(cursor):
+    create_jobs_table(cursor)
+
+
+'''migration 7 : date des commandes, prix d'achat des lignes et cumuls des ventes par jour'''
+# La date des commandes existantes est inconnue (NULL : hors des cumuls par jour) ; le
+# prix d'achat de leurs lignes est le prix courant du produit.
+def migration_007_ventes(cursor):
+    cursor.execute("ALTER TABLE commandes ADD COLUMN created_at INTEGER")
+    cursor.execute("ALTER TABLE lignes_commande ADD COLUMN prix_unitaire REAL NOT NULL DEFAULT 0")
+    cursor.execute("""
+        UPDATE lignes_commande
+        SET prix_unitaire = (SELECT prix FROM produits WHERE produits.id = lignes_commande.produit_id)
+        WHERE EXISTS (SELECT 1 FROM produits WHERE produits.id = lignes_commande.produit_id)
+    """)
+    cursor.execute("CREATE INDEX idx_commandes_created_at ON commandes (created_at)")
+    create_sales_rollups(cursor)
+    cursor.execute("ANALYZE")
+
+
+'''migration 8 : types de produit dans une table categories, produits.categorie_id en cle etrangere'''
+# Les 11 types du formulaire gardent les ID 1 à 11 ; les autres valeurs déjà présentes
+# (données anciennes ou importées) deviennent des catégories à la suite. Les triggers et
+# l'index qui citent type_produit sont supprimés avant la colonne, puis recréés sur
+# categorie_id ; la table produits n'est pas reconstruite (id et index plein texte inchangés).
+def migration_008_categories(cursor):
+    cursor.execute("CREATE TABLE categories (id INTEGER PRIMARY KEY, nom TEXT NOT NULL UNIQUE)")
+    cursor.executemany("INSERT INTO categories (nom) VALUES (?)", [(nom,) for nom in CATEGORIES_INITIALES])
+    cursor.execute("INSERT OR IGNORE INTO categories (nom) SELECT DISTINCT type_produit FROM produits ORDER BY 1")
+    create_version_tracking(cursor, "categories")
+
+    for trigger in ("produits_stats_insert", "produits_stats_delete", "produits_stats_update",
+                    "produits_ventes_categorie", "ventes_jour_produit_categorie_insert",
+                    "ventes_jour_produit_categorie_update", "ventes_jour_produit_categorie_delete"):
+        cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    cursor.execute("DROP INDEX IF EXISTS idx_produits_type_produit")
+    cursor.execute("DROP TABLE IF EXISTS stats_types")
+    cursor.execute("DROP TABLE IF EXISTS ventes_jour_categorie")
+
+    # SQLite exige une valeur par défaut pour ajouter une colonne NOT NULL : 0 ne désigne
+    # aucune catégorie, une insertion sans categorie_id est refusée par la clé étrangère
+    cursor.execute("""
+        ALTER TABLE produits ADD COLUMN categorie_id INTEGER NOT NULL DEFAULT 0 REFERENCES categories (id)
+    """)
+    cursor.execute("""
+        UPDATE produits SET categorie_id = (SELECT id FROM categories WHERE nom = produits.type_produit)
+    """)
+    cursor.execute("ALTER TABLE produits DROP COLUMN type_produit")
+    # Entrées triées par (categorie_id, id) : le filtre paginé n'a pas de tri à faire
+    cursor.execute("CREATE INDEX idx_produits_categorie_id ON produits (categorie_id)")
+
+    cursor.execute("CREATE TABLE stats_categories (categorie_id INTEGER PRIMARY KEY, nb INTEGER NOT NULL)")
+    cursor.execute("INSERT INTO stats_categories SELECT categorie_id, COUNT(*) FROM produits GROUP BY categorie_id")
+    stats = {"table": "stats_categories", "column": "categorie_id"}
+    cursor.execute(f"""
+        CREATE TRIGGER produits_stats_insert AFTER INSERT ON produits
+        WHEN NOT (SELECT active FROM bulk_mode)
+        BEGIN
+            {_stats_add("NEW", **stats)}
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER produits_stats_delete AFTER DELETE ON produits
+        BEGIN
+            {_stats_remove("OLD", **stats)}
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER produits_stats_update AFTER UPDATE OF categorie_id, stock, prix ON produits
+        BEGIN
+            {_stats_remove("OLD", **stats)}
+            {_stats_add("NEW", **stats)}
+        END
+    """)
+    create_category_rollup(cursor)
+    cursor.execute("ANALYZE")
+
+
+MIGRATIONS = [
+    migration_001_schema_initial,
+    migration_002_index,
+    migration_003_versions,
+    migration_004_index_noms,
+    migration_005_lignes_commande,
+    migration_006_jobs,
+    migration_007_ventes,
+    migration_008_categories,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+'''fonction pour lire la version du schema de la base'''
+def get_schema_version(connection=None):
+    connection = connection or get_connection()
+    return connection.execute("PRAGMA user_version").fetchone()[0]
+
+
+'''fonction pour verifier que la base est a jour (a appeler au demarrage, sans rien modifier)'''
+def check_schema():
+    version = get_schema_version()
+    if version != SCHEMA_VERSION:
+        raise RuntimeError(f"Schéma de la base en version {version}, version {SCHEMA_VERSION} attendue : "
+                           f"lancer 'flask --app app migrate' (ou 'python migrations.py').")
+
+
+'''fonction pour appliquer les migrations manquantes, une transaction par migration'''
+def migrate(log=print):
+    connection = get_connection()
+    # Une migration qui reconstruit une table recopie aussi les références orphelines
+    # existantes : les clés étrangères sont coupées le temps des migrations (le PRAGMA
+    # est sans effet dans une transaction), puis vérifiées par foreign_key_check.
+    connection.execute("PRAGMA foreign_keys = OFF")
+    try:
+        _apply_migrations(connection, log)
+    finally:
+        connection.execute("PRAGMA foreign_keys = ON")
+
+    # Les clés étrangères ne sont vérifiées que pour les nouvelles écritures : signaler l'existant
+    violations = connection.execute("PRAGMA foreign_key_check").fetchall()
+    if violations:
+        log(f"Attention : {len(violations)} référence(s) orpheline(s) existante(s) (PRAGMA foreign_key_check)")
+    return get_schema_version(connection)
+
+
+'''fonction pour appliquer les migrations manquantes une par une'''
+def _apply_migrations(connection, log):
+    while True:
+        # La version est relue sous le verrou : deux déploiements simultanés ne rejouent rien
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            version = get_schema_version(connection)
+            if version >= SCHEMA_VERSION:
+                connection.rollback()
+                break
+            migration = MIGRATIONS[version]
+            migration(connection.cursor())
+            connection.execute(f"PRAGMA user_version = {version + 1}")
+            connection.commit()
+        except BaseException:
+            connection.rollback()
+            raise
+        log(f"Migration {version + 1} appliquée : {migration.__name__}")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        from database import configure
+        configure(sys.argv[1])
+    print(f"Schéma en version {migrate()}")
@@ -0,0 +1,290 @@
+import os
+import random
+import selectors
+import signal
+import socket
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+import database
+
+'''--------------------Serveur de production : workers pré-forkés--------------------'''
+
+# Usage : flask --app app serve [--workers 4] [--threads 4] [--max-requests 10000]
+# Le maître prépare l'application (schéma vérifié, templates compilés, modules lourds
+# importés), ouvre le socket, puis forke les workers : ils héritent de cet état (pages
+# mémoire partagées) et acceptent les connexions sur le même socket. Signaux du maître :
+#   SIGTERM, SIGINT : arrêt propre, les requêtes en cours se terminent
+#   SIGHUP          : rechargement propre, nouveaux workers puis arrêt des anciens
+#                     (templates relus, schéma revérifié ; le code Python, lui, n'est
+#                     rechargé qu'en redémarrant le maître)
+# Un worker se retire après --max-requests requêtes et il est remplacé.
+# SQLite (WAL) : chaque processus, et chaque thread, ouvre sa propre connexion (voir
+# database.get_connection) ; le maître ferme la sienne avant de forker.
+# Chaque worker occupe une place (0 à N-1), reprise par le worker qui le remplace une fois
+# l'ancien terminé ; pendant un rechargement, les nouveaux workers prennent d'autres places
+# que ceux qui s'arrêtent (au plus 2N places).
+# Journal d'audit : chaque place a son propre fichier (user_actions.<place>.log, voir
+# journal.log_path), écrit et tourné par un seul processus à la fois ; le maître n'écrit
+# rien. Le nombre de fichiers reste borné par le nombre de places.
+# Limite : les mesures (metriques.py) restent propres à chaque worker et ne sont pas
+# additionnées. /metrics ne décrit que le worker qui a répondu, au hasard des connexions,
+# et les compteurs d'un worker recyclé (--max-requests) repartent de zéro.
+
+WORKERS = os.cpu_count() or 1
+THREADS = 4
+MAX_REQUESTS = 10000
+MAX_REQUESTS_JITTER = 0.1 # Écart aléatoire : les workers ne sont pas recyclés tous en même temps
+GRACEFUL_TIMEOUT = 30     # Secondes laissées aux requêtes en cours avant SIGKILL
+REQUEST_TIMEOUT = 30      # Un client qui n'envoie plus rien libère son thread
+BACKLOG = 2048
+POLL_INTERVAL = 0.5
+
+
+'''classe du gestionnaire de requete des workers'''
+class WorkerRequestHandler(WSGIRequestHandler):
+    # Une connexion par requête : un client inactif (keep-alive) n'occupe pas un thread.
+    # Un proxy (nginx...) devant le serveur garde les connexions avec les navigateurs.
+    protocol_version = "HTTP/1.0"
+    timeout = REQUEST_TIMEOUT
+    access_log = False
+
+    def log_request(self, code="-", size="-"):
+        # Les actions sont déjà journalisées par log_action (journal.py)
+        if self.access_log:
+            super().log_request(code, size)
+
+
+'''classe du serveur WSGI d'un worker, sur le socket ouvert par le maitre'''
+class WorkerServer(BaseWSGIServer):
+    multiprocess = True
+
+
+'''classe d'un worker : accepte les connexions et les traite dans un pool de threads'''
+class Worker:
+    def __init__(self, app, listener, threads=THREADS, max_requests=MAX_REQUESTS):
+        self.app = app
+        self.listener = listener
+        self.threads = threads
+        self.max_requests = max_requests
+        self.stopping = threading.Event()
+
+    '''methode pour servir jusqu'a SIGTERM ou jusqu'a max_requests requetes'''
+    def run(self):
+        signal.signal(signal.SIGTERM, lambda signum, frame: self.stopping.set())
+        # Ctrl+C est envoyé à tout le groupe de processus : c'est le maître qui arrête les workers
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+
+        host, port = self.listener.getsockname()[:2]
+        server = WorkerServer(host, port, self.app, handler=WorkerRequestHandler, fd=self.listener.fileno())
+        server.multithread = self.threads > 1
+        server.socket.setblocking(False)
+        # Une connexion n'est acceptée que si un thread est libre : les autres workers la prennent
+        slots = threading.BoundedSemaphore(self.threads)
+        pool = ThreadPoolExecutor(self.threads, thread_name_prefix="requete")
+        selector = selectors.DefaultSelector()
+        selector.register(server.socket, selectors.EVENT_READ)
+        served = 0
+        try:
+            while not self.stopping.is_set() and (not self.max_requests or served < self.max_requests):
+                if not slots.acquire(timeout=POLL_INTERVAL):
+                    continue
+                if not selector.select(POLL_INTERVAL):
+                    slots.release()
+                    continue
+                try:
+                    request, address = server.socket.accept()
+                except (BlockingIOError, InterruptedError):
+                    slots.release() # Un autre worker a pris la connexion
+                    continue
+                request.setblocking(True)
+                served += 1
+                pool.submit(self._handle, server, request, address, slots)
+        finally:
+            pool.shutdown(wait=True) # Les requêtes en cours se terminent
+            selector.close()
+            server.socket.close()
+
+    def _handle(self, server, request, address, slots):
+        try:
+            server.finish_request(request, address)
+        except Exception:
+            server.handle_error(request, address)
+        finally:
+            server.shutdown_request(request)
+            slots.release()
+
+
+'''classe du processus maitre : ouvre le socket, forke et surveille les workers'''
+class Master:
+    def __init__(self, app, host, port, workers=WORKERS, threads=THREADS, max_requests=MAX_REQUESTS,
+                 graceful_timeout=GRACEFUL_TIMEOUT, prepare=None, worker_init=None, worker_exit=None, log=print):
+        self.app = app
+        self.address = (host, port)
+        self.count = workers
+        self.threads = threads
+        self.max_requests = max_requests
+        self.graceful_timeout = graceful_timeout
+        self.prepare = prepare or (lambda: None)
+        self.worker_init = worker_init or (lambda slot: None)
+        self.worker_exit = worker_exit or (lambda: None)
+        self.log = log
+        self.workers = {}  # pid -> date de lancement
+        self.retiring = {} # pid -> date limite d'arrêt (rechargement)
+        self.slots = {}    # pid -> numéro de place (0, 1, ...), repris par le worker suivant
+        self.listener = None
+        self.stopping = False
+        self.reloading = False
+
+    '''methode pour lancer les workers et les surveiller jusqu'a l'arret'''
+    def run(self):
+        if not hasattr(os, "fork"):
+            raise RuntimeError("Le serveur pré-forké a besoin de os.fork (Linux, macOS).")
+        self.prepare()
+        self.listener = socket.create_server(self.address, backlog=BACKLOG)
+        self.listener.setblocking(False)
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+        signal.signal(signal.SIGHUP, self._on_reload)
+        host, port = self.listener.getsockname()[:2]
+        self.log(f"Écoute sur http://{host}:{port} : {self.count} worker(s) x {self.threads} thread(s), "
+                 f"maître {os.getpid()}")
+        try:
+            while not self.stopping:
+                if self.reloading:
+                    self._reload()
+                self._reap()
+                self._kill_overdue()
+                self._spawn_missing()
+                time.sleep(POLL_INTERVAL)
+        finally:
+            self._stop_all()
+            self.listener.close()
+        self.log("Serveur arrêté")
+
+    def _on_stop(self, signum, frame):
+        self.stopping = True
+
+    def _on_reload(self, signum, frame):
+        self.reloading = True
+
+    def _spawn_missing(self):
+        while len(self.workers) < self.count and not self.stopping:
+            self._spawn()
+
+    '''methode pour choisir la plus petite place libre (workers et workers en cours d'arret)'''
+    def _free_slot(self):
+        used = set(self.slots.values())
+        return next(slot for slot in range(len(used) + 1) if slot not in used)
+
+    def _spawn(self):
+        slot = self._free_slot()
+        jitter = int(self.max_requests * MAX_REQUESTS_JITTER)
+        max_requests = self.max_requests + random.randint(0, jitter) if self.max_requests else 0
+        # Rien ne doit être hérité d'une connexion SQLite ouverte ni d'un tampon de sortie
+        database.close_connection()
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                self.worker_init(slot)
+                Worker(self.app, self.listener, self.threads, max_requests).run()
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                try:
+                    self.worker_exit()
+                finally:
+                    # os._exit : l'enfant ne doit pas dérouler la pile ni les atexit du maître
+                    os._exit(code)
+        self.workers[pid] = time.monotonic()
+        self.slots[pid] = slot
+
+    '''methode pour recuperer les workers termines (recycles, arretes ou en erreur)'''
+    def _reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            started = self.workers.pop(pid, None)
+            self.retiring.pop(pid, None)
+            self.slots.pop(pid, None)
+            code = os.waitstatus_to_exitcode(status)
+            if code != 0:
+                self.log(f"Worker {pid} terminé avec le code {code}")
+                if started is not None and time.monotonic() - started < 1:
+                    time.sleep(1) # Échec au démarrage : pas de relance en boucle
+
+    def _kill_overdue(self):
+        now = time.monotonic()
+        for pid, deadline in list(self.retiring.items()):
+            if now > deadline:
+                self._signal(pid, signal.SIGKILL)
+
+    '''methode pour remplacer tous les workers sans couper le service (SIGHUP)'''
+    def _reload(self):
+        self.reloading = False
+        try:
+            self.prepare()
+        except Exception as e:
+            self.log(f"Rechargement annulé, les workers actuels continuent : {e}")
+            return
+        old, self.workers = self.workers, {}
+        # Les nouveaux workers d'abord : le socket n'est jamais sans worker
+        self._spawn_missing()
+        deadline = time.monotonic() + self.graceful_timeout
+        for pid in old:
+            self.retiring[pid] = deadline
+            self._signal(pid, signal.SIGTERM)
+        self.log(f"Rechargement : {len(old)} worker(s) remplacé(s)")
+
+    def _stop_all(self):
+        pids = set(self.workers) | set(self.retiring)
+        for pid in pids:
+            self._signal(pid, signal.SIGTERM)
+        deadline = time.monotonic() + self.graceful_timeout
+        while pids and time.monotonic() < deadline:
+            for pid in list(pids):
+                try:
+                    if os.waitpid(pid, os.WNOHANG)[0] != 0:
+                        pids.discard(pid)
+                except ChildProcessError:
+                    pids.discard(pid)
+            time.sleep(0.05)
+        for pid in pids:
+            self._signal(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+        self.workers.clear()
+        self.retiring.clear()
+        self.slots.clear()
+
+    @staticmethod
+    def _signal(pid, signum):
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+
+'''fonction pour compiler tous les templates (avant le fork : partages par les workers)'''
+def warm_templates(app):
+    env = app.jinja_env
+    # Hors debug, Jinja ne relit pas un template modifié : le cache est vidé à chaque préparation
+    env.cache.clear()
+    for name in env.list_templates():
+        env.get_template(name)
+
+
+'''fonction pour lancer le serveur pre-forke (bloque jusqu'a l'arret)'''
+def serve(app, host="127.0.0.1", port=8000, **options):
+    Master(app, host, port, **options).run()
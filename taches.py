@@ -0,0 +1,319 @@
+import json
+import os
+import shutil
+import socket
+import threading
+import time
+import traceback
+from database import get_connection, run_in_transaction, NOW
+
+'''--------------------Tâches de fond (table jobs)--------------------'''
+
+# Les traitements longs (graphiques, imports, exports) ne tournent pas dans la requête :
+# la route enregistre une tâche (submit), répond tout de suite avec son id, et le client
+# interroge /jobs/<id>. Les tâches sont exécutées :
+#   - par les threads d'exécution du processus web (JOB_THREADS, 1 par défaut), démarrés
+#     à la première soumission ;
+#   - ou par des processus dédiés : flask --app app jobs --threads 2 (avec JOB_THREADS=0).
+# Les deux peuvent coexister : une tâche est réservée par un seul UPDATE ... RETURNING.
+
+JOBS_DIR = os.environ.get(
+    "JOBS_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance", "jobs"))
+JOB_THREADS = int(os.environ.get("JOB_THREADS", 1)) # 0 : tâches exécutées par flask --app app jobs
+POLL_INTERVAL = 0.5       # Attente entre deux recherches de tâche quand il n'y en a pas
+PROGRESS_INTERVAL = 1.0   # Progression écrite au plus une fois par seconde
+STALE_AFTER = 300         # Tâche en cours sans nouvelles depuis 5 min : son processus a disparu
+RETENTION = 7 * 24 * 3600 # Tâches terminées (et leurs fichiers) gardées 7 jours
+PURGE_INTERVAL = 3600
+
+PENDING, RUNNING, DONE, FAILED = "pending", "running", "done", "failed"
+
+# Traitements par type de tâche : handler(job) -> résultat (dictionnaire JSON)
+HANDLERS = {}
+
+_threads = JOB_THREADS
+_runner = None
+_runner_pid = None
+_runner_lock = threading.Lock()
+_wake = threading.Event()
+
+
+'''decorateur pour enregistrer le traitement d'un type de tache'''
+def handler(kind):
+    def decorator(func):
+        HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+'''fonction pour regler le nombre de threads d'execution du processus web (0 : aucun)'''
+def configure(threads=None):
+    global _threads
+    if threads is not None:
+        _threads = threads
+
+
+'''fonction pour creer la table des taches (appelee par la migration 6)'''
+def create_jobs_table(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            params TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            progress INTEGER NOT NULL DEFAULT 0,
+            total INTEGER,
+            result TEXT,
+            error TEXT,
+            worker TEXT,
+            created_by TEXT,
+            created_at INTEGER NOT NULL,
+            started_at INTEGER,
+            updated_at INTEGER NOT NULL,
+            finished_at INTEGER
+        )
+    """)
+    # Recherche de la prochaine tâche en attente et des tâches en cours
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, id)")
+
+
+'''fonction pour enregistrer une tache (retourne son id)'''
+# unique=True : une tâche identique (même type, mêmes paramètres) encore en attente ou
+# en cours est réutilisée au lieu d'en créer une seconde.
+def submit(kind, params=None, user=None, unique=False):
+    if kind not in HANDLERS:
+        raise ValueError(f"Type de tâche inconnu : {kind}")
+    payload = json.dumps(params or {}, sort_keys=True)
+
+    def insert(cursor):
+        if unique:
+            cursor.execute("""
+                SELECT id FROM jobs
+                WHERE status IN ('pending', 'running') AND kind = ? AND params = ?
+                ORDER BY id LIMIT 1
+            """, (kind, payload))
+            row = cursor.fetchone()
+            if row:
+                return row[0]
+        cursor.execute(f"""
+            INSERT INTO jobs (kind, params, created_by, created_at, updated_at)
+            VALUES (?, ?, ?, {NOW}, {NOW})
+        """, (kind, payload, user))
+        return cursor.lastrowid
+
+    job_id = run_in_transaction(insert)
+    _start_local_runner()
+    _wake.set()
+    return job_id
+
+
+'''fonction pour lire l'etat d'une tache (dictionnaire, None si elle n'existe pas)'''
+def get_job(job_id):
+    with get_connection() as connection:
+        cursor = connection.cursor()
+        cursor.execute("""
+            SELECT id, kind, status, progress, total, result, error, created_by,
+                   created_at, started_at, finished_at
+            FROM jobs
+            WHERE id = ?
+        """, (job_id,))
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    job = dict(zip(("id", "kind", "status", "progress", "total", "result", "error", "created_by",
+                    "created_at", "started_at", "finished_at"), row))
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    return job
+
+
+'''fonction pour recuperer le dossier des fichiers d'une tache'''
+def job_dir(job_id):
+    return os.path.join(JOBS_DIR, str(job_id))
+
+
+'''classe d'une tache reservee, passee a son traitement'''
+class Job:
+    def __init__(self, id, kind, params):
+        self.id = id
+        self.kind = kind
+        self.params = params
+        self._last_progress = 0.0
+
+    '''methode pour enregistrer la progression (ecrite au plus une fois par PROGRESS_INTERVAL)'''
+    def progress(self, done, total=None, force=False):
+        now = time.monotonic()
+        if not force and now - self._last_progress < PROGRESS_INTERVAL:
+            return
+        self._last_progress = now
+        run_in_transaction(lambda cursor: cursor.execute(f"""
+            UPDATE jobs SET progress = ?, total = COALESCE(?, total), updated_at = {NOW}
+            WHERE id = ?
+        """, (done, total, self.id)))
+
+    '''methode pour recuperer le chemin d'un fichier produit par la tache'''
+    def path(self, filename):
+        directory = job_dir(self.id)
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, filename)
+
+
+'''fonction pour reserver la plus ancienne tache en attente (None s'il n'y en a pas)'''
+def claim(worker):
+    # Lecture sans verrou d'abord : une boucle au repos ne prend pas le verrou d'écriture
+    with get_connection() as connection:
+        if connection.execute("SELECT 1 FROM jobs WHERE status = 'pending' LIMIT 1").fetchone() is None:
+            return None
+
+    def reserve(cursor):
+        cursor.execute(f"""
+            UPDATE jobs SET status = 'running', worker = ?, started_at = {NOW}, updated_at = {NOW}
+            WHERE id = (SELECT id FROM jobs WHERE status = 'pending' ORDER BY id LIMIT 1)
+            RETURNING id, kind, params
+        """, (worker,))
+        return cursor.fetchall() # Lu jusqu'au bout : l'instruction est terminée avant le commit
+
+    rows = run_in_transaction(reserve)
+    return Job(rows[0][0], rows[0][1], json.loads(rows[0][2])) if rows else None
+
+
+'''fonction pour executer une tache reservee et enregistrer son resultat ou son erreur'''
+def execute(job):
+    try:
+        result = HANDLERS[job.kind](job)
+        status, result, error = DONE, json.dumps(result), None
+    except Exception as e:
+        traceback.print_exc()
+        status, result, error = FAILED, None, str(e) or type(e).__name__
+    run_in_transaction(lambda cursor: cursor.execute(f"""
+        UPDATE jobs SET status = ?, result = ?, error = ?, updated_at = {NOW}, finished_at = {NOW}
+        WHERE id = ?
+    """, (status, result, error, job.id)))
+
+
+'''fonction pour marquer en echec les taches dont le processus a disparu, et purger les anciennes'''
+def cleanup(stale_after=STALE_AFTER, retention=RETENTION):
+    def update(cursor):
+        # Une tâche interrompue n'est pas relancée : un import, par exemple, n'est pas rejouable
+        cursor.execute(f"""
+            UPDATE jobs SET status = 'failed', error = 'Tâche interrompue (processus arrêté).',
+                            finished_at = {NOW}, updated_at = {NOW}
+            WHERE status = 'running' AND updated_at < {NOW} - ?
+        """, (stale_after,))
+        cursor.execute(f"""
+            DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < {NOW} - ?
+            RETURNING id
+        """, (retention,))
+        return [row[0] for row in cursor.fetchall()]
+
+    for job_id in run_in_transaction(update):
+        shutil.rmtree(job_dir(job_id), ignore_errors=True)
+
+
+'''classe des threads d'execution : reservent et executent les taches une par une'''
+class Runner:
+    def __init__(self, threads=1):
+        self.threads = threads
+        self.name = f"{socket.gethostname()}:{os.getpid()}"
+        self.stopping = threading.Event()
+        self._workers = []
+        self._last_cleanup = 0.0
+
+    def start(self):
+        for i in range(self.threads):
+            thread = threading.Thread(target=self.run, name=f"tache-{i}", daemon=True)
+            thread.start()
+            self._workers.append(thread)
+
+    '''methode pour arreter les threads apres leur tache en cours'''
+    def stop(self, timeout=None):
+        self.stopping.set()
+        _wake.set()
+        for thread in self._workers:
+            thread.join(timeout)
+
+    '''methode de la boucle d'un thread : reserver, executer, attendre'''
+    def run(self):
+        while not self.stopping.is_set():
+            if time.monotonic() - self._last_cleanup > PURGE_INTERVAL:
+                self._last_cleanup = time.monotonic()
+                cleanup()
+            try:
+                job = claim(self.name)
+            except Exception:
+                traceback.print_exc()
+                job = None
+            if job is None:
+                _wake.wait(POLL_INTERVAL)
+                _wake.clear()
+                continue
+            execute(job)
+
+
+'''fonction pour demarrer les threads d'execution du processus courant (une fois par processus)'''
+def _start_local_runner():
+    global _runner, _runner_pid
+    if _threads <= 0 or _runner_pid == os.getpid():
+        return
+    with _runner_lock:
+        # Après un fork, les threads du parent n'existent plus dans l'enfant
+        if _runner_pid != os.getpid():
+            _runner = Runner(_threads)
+            _runner.start()
+            _runner_pid = os.getpid()
+
+
+'''fonction pour arreter les threads d'execution du processus courant'''
+def shutdown(timeout=None):
+    global _runner, _runner_pid
+    if _runner is not None and _runner_pid == os.getpid():
+        _runner.stop(timeout)
+    _runner = None
+    _runner_pid = None
+
+
+'''--------------------Traitements--------------------'''
+
+# Imports locaux : matplotlib, l'import et l'export ne sont chargés que par le processus
+# qui exécute la tâche.
+
+'''traitement du rendu des graphiques des produits'''
+@handler("graphiques")
+def run_charts(job):
+    # params["version"] ne sert qu'à distinguer les tâches : le rendu suit la version courante
+    from graphiques import get_charts
+    return {"charts": get_charts(job.params["charts_dir"])}
+
+
+'''traitement d'un import de fichier (le fichier depose est supprime a la fin)'''
+@handler("import")
+def run_import(job):
+    from import_donnees import import_file
+    params = job.params
+    try:
+        with open(params["path"], "rb") as stream:
+            report = import_file(params["entity"], stream, params["format"],
+                                 progress=lambda r: job.progress(r["inserted"] + r["rejected"]))
+    finally:
+        os.remove(params["path"])
+    return report
+
+
+'''traitement d'un export dans un fichier telechargeable (/jobs/<id>/download)'''
+@handler("export")
+def run_export(job):
+    from export_donnees import export
+    params = job.params
+    filename = f"{params['entity']}.{params['format']}" + (".gz" if params.get("compress") else "")
+    rows = 0
+
+    def progress(count):
+        nonlocal rows
+        rows += count
+        job.progress(rows)
+
+    with open(job.path(filename), "wb") as output:
+        for chunk in export(params["entity"], params["format"], params.get("compress", False), progress=progress):
+            output.write(chunk)
+    job.progress(rows, rows, force=True)
+    return {"file": filename, "rows": rows}
@@ -0,0 +1,49 @@
+import os
+import sqlite3
+
+'''--------------------Class User--------------------'''
+
+# Base des utilisateurs, séparée de app_database.db (même fichier et même table qu'avant)
+USERS_DATABASE_PATH = os.environ.get(
+    "USERS_DATABASE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance", "users.db"))
+
+
+class User:
+    def __init__(self, username=None, password=None, id=None):
+        self.id = id
+        self.username = username
+        self.password = password
+
+    def __repr__(self):
+        return '<User %r>' % self.username
+
+    '''methode pour créer la table des utilisateurs'''
+    def create_table_user(self):
+        os.makedirs(os.path.dirname(USERS_DATABASE_PATH), exist_ok=True)
+        with sqlite3.connect(USERS_DATABASE_PATH) as connection:
+            cursor = connection.cursor()
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS user (
+                    id INTEGER NOT NULL,
+                    username VARCHAR(80) NOT NULL,
+                    password VARCHAR(120) NOT NULL,
+                    PRIMARY KEY (id),
+                    UNIQUE (username)
+                )
+            """)
+
+    '''methode pour ajouter un utilisateur'''
+    def add_user(self):
+        with sqlite3.connect(USERS_DATABASE_PATH) as connection:
+            cursor = connection.cursor()
+            cursor.execute("INSERT INTO user (username, password) VALUES (?, ?)", (self.username, self.password))
+            self.id = cursor.lastrowid
+
+    '''methode pour recuperer un utilisateur par son nom'''
+    def get_by_username(self, username):
+        with sqlite3.connect(USERS_DATABASE_PATH) as connection:
+            cursor = connection.cursor()
+            cursor.execute("SELECT id, username, password FROM user WHERE username = ?", (username,))
+            row = cursor.fetchone()
+        return User(id=row[0], username=row[1], password=row[2]) if row else None
@@ -0,0 +1,384 @@
+from database import read_snapshot, set_bulk_mode
+
+'''--------------------Ventes par jour (tables de cumuls)--------------------'''
+
+# Chaque commande datée (commandes.created_at) est cumulée par jour (UTC) dans deux
+# tables : ventes_jour_produit (jour, produit) et ventes_jour_client (jour, client), et
+# ventes_jour_produit dans ventes_jour_categorie (jour, catégorie actuelle du produit). Les
+# montants sont au prix d'achat (lignes_commande.prix_unitaire), en centimes : les ajouts
+# et retraits successifs ne dérivent pas. Les cumuls sont tenus à jour par triggers, à
+# chaque insertion, modification ou suppression de commande ou de ligne ; un rapport sur
+# 90 jours lit quelques centaines de lignes de cumuls au lieu de toutes les commandes.
+# Les commandes passées avant la migration 7 n'ont pas de date : elles ne sont pas cumulées.
+
+RAPPORTS = ("categorie", "produit", "client", "jour")
+JOURS_MAX = 3660
+
+# Jour (UTC) d'une date en secondes
+_JOUR = "date({}, 'unixepoch')"
+
+
+'''fonction pour generer le SQL du montant d'une ligne, en centimes'''
+def _montant(row):
+    return f"CAST(ROUND({row}.quantite * {row}.prix_unitaire * 100) AS INTEGER)"
+
+
+'''fonction pour generer le SQL qui ajoute une ligne de commande (NEW) aux cumuls'''
+def _ligne_add(row):
+    return f"""
+        INSERT INTO ventes_jour_produit (jour, produit_id, quantite, montant)
+            SELECT {_JOUR.format("c.created_at")}, {row}.produit_id, {row}.quantite, {_montant(row)}
+            FROM commandes c WHERE c.id = {row}.commande_id AND c.created_at IS NOT NULL
+            ON CONFLICT(jour, produit_id) DO UPDATE
+                SET quantite = quantite + excluded.quantite, montant = montant + excluded.montant;
+        INSERT INTO ventes_jour_client (jour, client_id, commandes, quantite, montant)
+            SELECT {_JOUR.format("c.created_at")}, c.client_id, 0, {row}.quantite, {_montant(row)}
+            FROM commandes c WHERE c.id = {row}.commande_id AND c.created_at IS NOT NULL
+            ON CONFLICT(jour, client_id) DO UPDATE
+                SET quantite = quantite + excluded.quantite, montant = montant + excluded.montant;
+    """
+
+
+'''fonction pour generer le SQL qui retire une ligne de commande (OLD) des cumuls'''
+def _ligne_remove(row):
+    jour = f"(SELECT {_JOUR.format('created_at')} FROM commandes WHERE id = {row}.commande_id)"
+    client = f"(SELECT client_id FROM commandes WHERE id = {row}.commande_id)"
+    return f"""
+        UPDATE ventes_jour_produit SET quantite = quantite - {row}.quantite, montant = montant - {_montant(row)}
+        WHERE jour = {jour} AND produit_id = {row}.produit_id;
+        DELETE FROM ventes_jour_produit WHERE jour = {jour} AND produit_id = {row}.produit_id AND quantite <= 0;
+        UPDATE ventes_jour_client SET quantite = quantite - {row}.quantite, montant = montant - {_montant(row)}
+        WHERE jour = {jour} AND client_id = {client};
+    """
+
+
+'''fonction pour generer le SQL qui ajoute une commande entiere (NEW) aux cumuls'''
+def _commande_add(row):
+    jour = _JOUR.format(f"{row}.created_at")
+    return f"""
+        INSERT INTO ventes_jour_client (jour, client_id, commandes, quantite, montant)
+            VALUES ({jour}, {row}.client_id, 1,
+                    (SELECT COALESCE(SUM(quantite), 0) FROM lignes_commande WHERE commande_id = {row}.id),
+                    (SELECT COALESCE(SUM({_montant("l")}), 0) FROM lignes_commande l WHERE commande_id = {row}.id))
+            ON CONFLICT(jour, client_id) DO UPDATE
+                SET commandes = commandes + 1, quantite = quantite + excluded.quantite,
+                    montant = montant + excluded.montant;
+        INSERT INTO ventes_jour_produit (jour, produit_id, quantite, montant)
+            SELECT {jour}, l.produit_id, l.quantite, {_montant("l")}
+            FROM lignes_commande l WHERE l.commande_id = {row}.id
+            ON CONFLICT(jour, produit_id) DO UPDATE
+                SET quantite = quantite + excluded.quantite, montant = montant + excluded.montant;
+    """
+
+
+'''fonction pour generer le SQL qui retire une commande entiere (OLD) des cumuls'''
+def _commande_remove(row):
+    jour = _JOUR.format(f"{row}.created_at")
+    return f"""
+        UPDATE ventes_jour_client
+        SET commandes = commandes - 1,
+            quantite = quantite - (SELECT COALESCE(SUM(quantite), 0) FROM lignes_commande WHERE commande_id = {row}.id),
+            montant = montant - (SELECT COALESCE(SUM({_montant("l")}), 0) FROM lignes_commande l WHERE commande_id = {row}.id)
+        WHERE jour = {jour} AND client_id = {row}.client_id;
+        DELETE FROM ventes_jour_client WHERE jour = {jour} AND client_id = {row}.client_id AND commandes <= 0;
+        UPDATE ventes_jour_produit
+        SET quantite = ventes_jour_produit.quantite - l.quantite, montant = ventes_jour_produit.montant - l.montant
+        FROM (SELECT produit_id, quantite, {_montant("lc")} AS montant
+              FROM lignes_commande lc WHERE commande_id = {row}.id) AS l
+        WHERE ventes_jour_produit.jour = {jour} AND ventes_jour_produit.produit_id = l.produit_id;
+        DELETE FROM ventes_jour_produit
+        WHERE jour = {jour} AND quantite <= 0
+          AND produit_id IN (SELECT produit_id FROM lignes_commande WHERE commande_id = {row}.id);
+    """
+
+
+'''fonction pour creer les cumuls par produit et par client et leurs triggers (appelee par la migration 7)'''
+def create_sales_rollups(cursor):
+    # Clé primaire (jour, ...) : un rapport sur une période lit une plage contiguë
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ventes_jour_produit (
+            jour TEXT NOT NULL,
+            produit_id INTEGER NOT NULL,
+            quantite INTEGER NOT NULL,
+            montant INTEGER NOT NULL,
+            PRIMARY KEY (jour, produit_id)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ventes_jour_client (
+            jour TEXT NOT NULL,
+            client_id INTEGER NOT NULL,
+            commandes INTEGER NOT NULL,
+            quantite INTEGER NOT NULL,
+            montant INTEGER NOT NULL,
+            PRIMARY KEY (jour, client_id)
+        ) WITHOUT ROWID
+    """)
+
+    # Historique d'un produit, déplacé quand sa catégorie change
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_ventes_jour_produit_produit_id ON ventes_jour_produit (produit_id)")
+
+    # Lignes : en mode import (voir set_bulk_mode), les cumuls sont recalculés à la fin
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS lignes_commande_ventes_insert AFTER INSERT ON lignes_commande
+        WHEN NOT (SELECT active FROM bulk_mode)
+        BEGIN
+            {_ligne_add("NEW")}
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS lignes_commande_ventes_delete AFTER DELETE ON lignes_commande
+        BEGIN
+            {_ligne_remove("OLD")}
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS lignes_commande_ventes_update
+        AFTER UPDATE OF commande_id, produit_id, quantite, prix_unitaire ON lignes_commande
+        BEGIN
+            {_ligne_remove("OLD")}
+            {_ligne_add("NEW")}
+        END
+    """)
+
+    # En-têtes : une commande compte pour 1 dans ventes_jour_client (ses lignes arrivent ensuite)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS commandes_ventes_insert AFTER INSERT ON commandes
+        WHEN NEW.created_at IS NOT NULL AND NOT (SELECT active FROM bulk_mode)
+        BEGIN
+            INSERT INTO ventes_jour_client (jour, client_id, commandes, quantite, montant)
+                VALUES ({_JOUR.format("NEW.created_at")}, NEW.client_id, 1, 0, 0)
+                ON CONFLICT(jour, client_id) DO UPDATE SET commandes = commandes + 1;
+        END
+    """)
+    # Les lignes sont supprimées avant l'en-tête (et non par ON DELETE CASCADE) : leurs
+    # triggers trouvent encore la date et le client de la commande
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS commandes_ventes_delete_lignes BEFORE DELETE ON commandes
+        BEGIN
+            DELETE FROM lignes_commande WHERE commande_id = OLD.id;
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS commandes_ventes_delete AFTER DELETE ON commandes
+        WHEN OLD.created_at IS NOT NULL
+        BEGIN
+            UPDATE ventes_jour_client SET commandes = commandes - 1
+            WHERE jour = {_JOUR.format("OLD.created_at")} AND client_id = OLD.client_id;
+            DELETE FROM ventes_jour_client
+            WHERE jour = {_JOUR.format("OLD.created_at")} AND client_id = OLD.client_id AND commandes <= 0;
+        END
+    """)
+    # Changement de client ou de date : la commande entière passe d'un cumul à l'autre
+    changed = "(OLD.client_id IS NOT NEW.client_id OR OLD.created_at IS NOT NEW.created_at)"
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS commandes_ventes_update_remove AFTER UPDATE OF client_id, created_at ON commandes
+        WHEN {changed} AND OLD.created_at IS NOT NULL
+        BEGIN
+            {_commande_remove("OLD")}
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS commandes_ventes_update_add AFTER UPDATE OF client_id, created_at ON commandes
+        WHEN {changed} AND NEW.created_at IS NOT NULL
+        BEGIN
+            {_commande_add("NEW")}
+        END
+    """)
+    _fill_sales_rollups(cursor)
+
+
+'''fonction pour creer le cumul par type de produit et ses triggers (appelee par la migration 8)'''
+# Tenu à partir des cumuls par produit (un upsert DO UPDATE déclenche les triggers UPDATE) ;
+# ignoré pendant un recalcul complet (mode import). Clé : l'ID de la catégorie actuelle du produit.
+def create_category_rollup(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ventes_jour_categorie (
+            jour TEXT NOT NULL,
+            categorie_id INTEGER NOT NULL,
+            quantite INTEGER NOT NULL,
+            montant INTEGER NOT NULL,
+            PRIMARY KEY (jour, categorie_id)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS ventes_jour_produit_categorie_insert AFTER INSERT ON ventes_jour_produit
+        WHEN NOT (SELECT active FROM bulk_mode)
+        BEGIN
+            {_categorie_add("NEW.jour", "NEW.produit_id", "NEW.quantite", "NEW.montant")}
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS ventes_jour_produit_categorie_update AFTER UPDATE ON ventes_jour_produit
+        WHEN NOT (SELECT active FROM bulk_mode)
+        BEGIN
+            {_categorie_add("NEW.jour", "NEW.produit_id", "NEW.quantite - OLD.quantite", "NEW.montant - OLD.montant")}
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS ventes_jour_produit_categorie_delete AFTER DELETE ON ventes_jour_produit
+        WHEN NOT (SELECT active FROM bulk_mode)
+        BEGIN
+            {_categorie_add("OLD.jour", "OLD.produit_id", "-OLD.quantite", "-OLD.montant")}
+        END
+    """)
+    # Produit changé de catégorie : son historique passe d'un cumul à l'autre
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS produits_ventes_categorie AFTER UPDATE OF categorie_id ON produits
+        WHEN OLD.categorie_id IS NOT NEW.categorie_id
+        BEGIN
+            UPDATE ventes_jour_categorie
+            SET quantite = ventes_jour_categorie.quantite - v.quantite,
+                montant = ventes_jour_categorie.montant - v.montant
+            FROM (SELECT jour, quantite, montant FROM ventes_jour_produit WHERE produit_id = OLD.id) AS v
+            WHERE ventes_jour_categorie.jour = v.jour AND ventes_jour_categorie.categorie_id = OLD.categorie_id;
+            DELETE FROM ventes_jour_categorie
+            WHERE categorie_id = OLD.categorie_id AND quantite <= 0
+              AND jour IN (SELECT jour FROM ventes_jour_produit WHERE produit_id = OLD.id);
+            INSERT INTO ventes_jour_categorie (jour, categorie_id, quantite, montant)
+                SELECT jour, NEW.categorie_id, quantite, montant FROM ventes_jour_produit WHERE produit_id = NEW.id
+                ON CONFLICT(jour, categorie_id) DO UPDATE
+                    SET quantite = quantite + excluded.quantite, montant = montant + excluded.montant;
+        END
+    """)
+    _fill_category_rollup(cursor)
+
+
+'''fonction pour generer le SQL qui ajoute une variation des ventes d'un produit au cumul de sa categorie'''
+def _categorie_add(jour, produit_id, quantite, montant):
+    return f"""
+        INSERT INTO ventes_jour_categorie (jour, categorie_id, quantite, montant)
+            SELECT {jour}, categorie_id, {quantite}, {montant} FROM produits WHERE id = {produit_id}
+            ON CONFLICT(jour, categorie_id) DO UPDATE
+                SET quantite = quantite + excluded.quantite, montant = montant + excluded.montant;
+        DELETE FROM ventes_jour_categorie
+        WHERE jour = {jour} AND quantite <= 0
+          AND categorie_id = (SELECT categorie_id FROM produits WHERE id = {produit_id});
+    """
+
+
+'''fonction pour remplir les cumuls par produit et par client a partir des commandes'''
+def _fill_sales_rollups(cursor):
+    cursor.execute(f"""
+        INSERT INTO ventes_jour_produit (jour, produit_id, quantite, montant)
+        SELECT {_JOUR.format("c.created_at")}, l.produit_id, SUM(l.quantite), SUM({_montant("l")})
+        FROM lignes_commande l
+        JOIN commandes c ON c.id = l.commande_id
+        WHERE c.created_at IS NOT NULL
+        GROUP BY 1, 2
+    """)
+    cursor.execute(f"""
+        INSERT INTO ventes_jour_client (jour, client_id, commandes, quantite, montant)
+        SELECT {_JOUR.format("c.created_at")}, c.client_id, COUNT(*),
+               COALESCE(SUM(t.quantite), 0), COALESCE(SUM(t.montant), 0)
+        FROM commandes c
+        LEFT JOIN (
+            SELECT commande_id, SUM(quantite) AS quantite, SUM({_montant("l")}) AS montant
+            FROM lignes_commande l
+            GROUP BY commande_id
+        ) t ON t.commande_id = c.id
+        WHERE c.created_at IS NOT NULL
+        GROUP BY 1, 2
+    """)
+
+
+'''fonction pour remplir le cumul par categorie a partir des cumuls par produit'''
+def _fill_category_rollup(cursor):
+    cursor.execute("""
+        INSERT INTO ventes_jour_categorie (jour, categorie_id, quantite, montant)
+        SELECT v.jour, p.categorie_id, SUM(v.quantite), SUM(v.montant)
+        FROM ventes_jour_produit v
+        JOIN produits p ON p.id = v.produit_id
+        GROUP BY 1, 2
+    """)
+
+
+'''fonction pour recalculer les cumuls a partir des commandes (import en masse, reparation)'''
+# Les triggers des cumuls par catégorie sont coupés (mode import) le temps du recalcul.
+def rebuild_sales_rollups(cursor):
+    set_bulk_mode(cursor, True)
+    cursor.execute("DELETE FROM ventes_jour_produit")
+    cursor.execute("DELETE FROM ventes_jour_categorie")
+    cursor.execute("DELETE FROM ventes_jour_client")
+    _fill_sales_rollups(cursor)
+    _fill_category_rollup(cursor)
+    set_bulk_mode(cursor, False)
+
+
+# Requêtes des rapports : (libellé, quantité, montant en centimes[, id[, commandes]])
+_REPORT_QUERIES = {
+    "categorie": """
+        SELECT c.nom, v.quantite, v.montant, v.categorie_id
+        FROM (
+            SELECT categorie_id, SUM(quantite) AS quantite, SUM(montant) AS montant
+            FROM ventes_jour_categorie
+            WHERE jour >= ?
+            GROUP BY categorie_id
+            ORDER BY montant DESC
+            LIMIT ?
+        ) v
+        JOIN categories c ON c.id = v.categorie_id
+        ORDER BY v.montant DESC
+    """,
+    # Regroupement et classement d'abord : les noms ne sont lus que pour les lignes retenues.
+    # "+produit_id" : sans lui, SQLite regroupe en parcourant tout l'index des produits au
+    # lieu de ne lire que la période dans la clé primaire (jour, ...)
+    "produit": """
+        SELECT p.nom, v.quantite, v.montant, v.produit_id
+        FROM (
+            SELECT produit_id, SUM(quantite) AS quantite, SUM(montant) AS montant
+            FROM ventes_jour_produit
+            WHERE jour >= ?
+            GROUP BY +produit_id
+            ORDER BY montant DESC
+            LIMIT ?
+        ) v
+        JOIN produits p ON p.id = v.produit_id
+        ORDER BY v.montant DESC
+    """,
+    "client": """
+        SELECT cl.nom, v.quantite, v.montant, v.client_id, v.commandes
+        FROM (
+            SELECT client_id, SUM(quantite) AS quantite, SUM(montant) AS montant, SUM(commandes) AS commandes
+            FROM ventes_jour_client
+            WHERE jour >= ?
+            GROUP BY client_id
+            ORDER BY montant DESC
+            LIMIT ?
+        ) v
+        JOIN clients cl ON cl.id = v.client_id
+        ORDER BY v.montant DESC
+    """,
+    "jour": """
+        SELECT jour, SUM(quantite), SUM(montant), NULL, SUM(commandes)
+        FROM ventes_jour_client
+        WHERE jour >= ?
+        GROUP BY jour
+        ORDER BY jour
+        LIMIT ?
+    """,
+}
+
+
+'''fonction pour calculer le rapport des ventes des derniers jours (liste de dictionnaires)'''
+# par : "categorie", "produit", "client" ou "jour" ; jours=90 couvre aujourd'hui et les 89 jours précédents
+def sales_report(par="categorie", jours=90, limit=None):
+    if par not in _REPORT_QUERIES:
+        raise ValueError(f"Rapport inconnu : {par} (attendu : {', '.join(RAPPORTS)})")
+    if not 1 <= jours <= JOURS_MAX:
+        raise ValueError(f"La période doit être comprise entre 1 et {JOURS_MAX} jours.")
+    # Lu dans la copie d'analyse si elle existe (voir database.backup_database)
+    with read_snapshot(analytics=True) as cursor:
+        cursor.execute("SELECT date('now', ?)", (f"-{jours - 1} days",))
+        depuis = cursor.fetchone()[0]
+        cursor.execute(_REPORT_QUERIES[par], (depuis, -1 if limit is None else limit))
+        rows = cursor.fetchall()
+    lignes = []
+    for row in rows:
+        ligne = {par: row[0], "quantite": row[1], "montant": round(row[2] / 100, 2)}
+        if len(row) > 3 and row[3] is not None:
+            ligne["id"] = row[3]
+        if len(row) > 4:
+            ligne["commandes"] = row[4]
+        lignes.append(ligne)
+    return {"par": par, "jours": jours, "depuis": depuis, "lignes": lignes}